@@ -0,0 +1,72 @@
+'''Compares inserting tracks one QSqlRecord at a time through the table
+model with desuplayerModel.bulkInsert. Run from the repository root:
+
+    python -m benchmarks.bench_addRecords --tracks 5000
+'''
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from PyQt5.QtSql import QSqlDatabase
+from desutunes.processfile import metadata, random_id
+from desutunes.tablemodel import loadDatabase
+
+
+def makeTracks(count):
+    return [
+        metadata(
+            ID=random_id(),
+            Filename=Path('h0m54r') / f'test_{index}.mp3',
+            Tracktitle=f'Test {index}',
+            Artist='h0m54r',
+            Album='Sounds of the desutunes',
+            Length=1234,
+            Anime='Neko Desu',
+            Role='OP',
+            Rolequalifier=str(index),
+            Label='h0m54r records',
+            Composer='h0m54r',
+            InMyriad='NO',
+            Dateadded='2018-04-01 12:00',
+            OriginalFileName='test_audio.mp3') for index in range(count)
+    ]
+
+
+def insertOneByOne(model, tracks):
+    '''The old addRecords insert loop'''
+
+    model._lock_edits = False
+    for track in tracks:
+        record = model.record()
+        for fieldName, fieldValue in track._asdict().items():
+            if not fieldName == 'OriginalFileName':
+                record.setValue(fieldName, str(fieldValue))
+        assert model.insertRecord(-1, record)
+    model.submitAll()
+    model._lock_edits = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=2000)
+    args = parser.parse_args()
+
+    for name, insert in [('insertRecord', insertOneByOne),
+                         ('bulkInsert', lambda model, tracks:
+                          model.bulkInsert(tracks))]:
+        with tempfile.TemporaryDirectory() as directory:
+            model = loadDatabase('bench.db', Path(directory))
+            tracks = makeTracks(args.tracks)
+            start = time.perf_counter()
+            insert(model, tracks)
+            elapsed = time.perf_counter() - start
+            print(f'{name:>12}: {elapsed:7.2f}s, '
+                  f'{args.tracks / elapsed:8.0f} rows/s')
+            model.database().close()
+            del model
+            QSqlDatabase.removeDatabase('qt_sql_default_connection')
+
+
+if __name__ == '__main__':
+    main()
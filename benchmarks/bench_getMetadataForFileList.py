@@ -0,0 +1,73 @@
+'''Measures how getMetadataForFileList scales with the number of workers.
+
+Builds a folder of copies of the test audio files and times reading tags
+from all of them with each worker count, then times a cold and a warm
+import through a TagCache. Run from the repository root:
+
+    python -m benchmarks.bench_getMetadataForFileList --files 2000
+'''
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from desutunes.processfile import getMetadataForFileList
+from desutunes.tagcache import TagCache
+
+_audio_path = Path(__file__).resolve().parent.parent / 'tests' / 'audio'
+_samples = ['test_audio.mp3', 'test_audio.aac', 'test_audio.m4a',
+            'test_audio.flac']
+
+
+def makeCorpus(directory, count):
+    '''Fills directory with count copies of the test audio, spread over
+    a few subfolders like a real drop'''
+
+    for i in range(count):
+        sample = _samples[i % len(_samples)]
+        folder = Path(directory) / f'artist{i % 20}'
+        folder.mkdir(exist_ok=True)
+        shutil.copyfile(_audio_path / sample,
+                        folder / f'{i}{Path(sample).suffix}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--workers', type=int, nargs='*')
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    workers = args.workers or sorted({1, 2, 4, 8, cpus} - {
+        n for n in (2, 4, 8) if n > cpus})
+
+    with tempfile.TemporaryDirectory() as directory:
+        makeCorpus(directory, args.files)
+        print(f'{args.files} files, {cpus} CPUs')
+        baseline = None
+        for count in workers:
+            start = time.perf_counter()
+            result = getMetadataForFileList([directory], workers=count)
+            elapsed = time.perf_counter() - start
+            assert len(result) == args.files
+            baseline = baseline or elapsed
+            print(f'{count:>3} workers: {elapsed:7.2f}s, '
+                  f'{args.files / elapsed:8.1f} files/s, '
+                  f'{baseline / elapsed:5.2f}x')
+
+        cache = TagCache(Path(directory) / 'tagcache.db')
+        for run in ('cold', 'warm'):
+            start = time.perf_counter()
+            result = getMetadataForFileList(
+                [directory], workers=max(workers), cache=cache)
+            elapsed = time.perf_counter() - start
+            assert len(result) == args.files
+            print(f'{run} cache: {elapsed:7.2f}s, '
+                  f'{args.files / elapsed:8.1f} files/s')
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+'''Times the title parser on a corpus of real-world titles, along both the
+file import path (part, once per file) and the iTunes import path
+(handleXML over a library built from the corpus), checking every result
+against the corpus as it goes. Run from the repository root:
+
+    python -m benchmarks.bench_part --tracks 20000
+'''
+
+import argparse
+import contextlib
+import io
+import plistlib
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from desutunes.processfile import part, partAll, _roleParts
+from desutunes.processitunes import handleXML
+
+_corpus_path = (Path(__file__).resolve().parent.parent / 'tests' / 'corpus' /
+                'titles.tsv')
+
+
+def loadCorpus():
+    with open(_corpus_path, encoding='utf-8') as f:
+        return [
+            (fields[0], tuple(fields[1:]))
+            for fields in (line.rstrip('\n').split('\t') for line in f
+                           if not line.startswith('#'))
+        ]
+
+
+def makeLibrary(fileName, titles):
+    tracks = {
+        f'{index:06d}': {
+            'Track ID': index,
+            'Persistent ID': f'{index:016X}',
+            'Name': title,
+            'Artist': 'h0m54r',
+            'Total Time': 1234,
+            'Description': 'h0m54r records',
+            'Composer': 'h0m54r',
+            'Date Added': datetime(2018, 4, 1, 12, 0),
+            'Location': f'file:///music/{index}.mp3'
+        }
+        for index, title in enumerate(titles)
+    }
+    with open(fileName, 'wb') as f:
+        plistlib.dump({'Tracks': tracks}, f)
+
+
+def report(name, count, elapsed, wrong):
+    print(f'{name:>12}: {elapsed:7.3f}s, {count / elapsed:9.0f} titles/s, '
+          f'{wrong} wrong')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=20000)
+    args = parser.parse_args()
+
+    corpus = loadCorpus()
+    repeats = -(-args.tracks // len(corpus))
+    titles = [title for title, _ in corpus] * repeats
+    expected = [parsed for _, parsed in corpus] * repeats
+
+    _roleParts.cache_clear()
+    start = time.perf_counter()
+    results = [part(title) for title in titles]
+    report('part', len(titles), time.perf_counter() - start,
+           sum(a != b for a, b in zip(results, expected)))
+
+    _roleParts.cache_clear()
+    start = time.perf_counter()
+    results = partAll(titles)
+    report('partAll', len(titles), time.perf_counter() - start,
+           sum(a != b for a, b in zip(results, expected)))
+
+    with tempfile.TemporaryDirectory() as directory:
+        fileName = str(Path(directory) / 'iTunes Library.xml')
+        makeLibrary(fileName, titles)
+        _roleParts.cache_clear()
+        start = time.perf_counter()
+        # The files don't exist, so each one is reported as unreadable
+        with contextlib.redirect_stdout(io.StringIO()):
+            tracks = [track for batch in handleXML(fileName)
+                      for track in batch]
+        elapsed = time.perf_counter() - start
+        results = [(track.Tracktitle, track.Anime, track.Role,
+                    track.Rolequalifier) for track in tracks]
+        report('handleXML', len(titles), elapsed,
+               sum(a != b for a, b in zip(results, expected)))
+
+
+if __name__ == '__main__':
+    main()
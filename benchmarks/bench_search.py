@@ -0,0 +1,60 @@
+'''Times searches through the full-text index on a large library. Run from
+the repository root:
+
+    python -m benchmarks.bench_search --tracks 100000
+'''
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+from desutunes.processfile import metadata
+from desutunes.tablemodel import loadDatabase
+
+_words = ('ai kimi yume hoshi sora hikari kokoro namida tsubasa sakura '
+          'natsu fuyu haru aki kaze umi tsuki yoru asa ashita').split()
+_anime = ['Puella Magi Madoka Magica', 'Cowboy Bebop', 'Lucky Star',
+          'Macross Frontier', 'Neon Genesis Evangelion', 'K-On!']
+
+
+def makeTracks(count):
+    pick = random.Random(0).choice
+    return [
+        metadata(
+            ID=f'{index:016X}',
+            Filename=Path('bench') / f'{index}.mp3',
+            Tracktitle=' '.join(pick(_words) for _ in range(3)),
+            Artist=f'Artist {index % 5000}',
+            Album=f'Album {index % 20000}',
+            Length=1234,
+            Anime=pick(_anime),
+            Role='OP',
+            Rolequalifier='',
+            Label=f'Label {index % 300}',
+            Composer=f'Composer {index % 3000}',
+            InMyriad='NO',
+            Dateadded='2018-04-01 12:00',
+            OriginalFileName='test_audio.mp3') for index in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        model = loadDatabase('bench.db', Path(directory))
+        model.bulkInsert(makeTracks(args.tracks))
+        for text in ['yume', 'madoka', 'hikari sora', 'artist 4999',
+                     'composer 12', 'k', '']:
+            start = time.perf_counter()
+            model.search(text)
+            elapsed = time.perf_counter() - start
+            print(f'{text!r:>15}: {elapsed * 1000:7.1f}ms, '
+                  f'{model.rowCount()} rows fetched')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+'''Compares jumping to the last row of a large library with the windowed
+model and with desuplayerModel. Run from the repository root:
+
+    python -m benchmarks.bench_windowedModel --tracks 200000
+'''
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from PyQt5.QtCore import Qt, QModelIndex
+from desutunes.tablemodel import col, loadDatabase, windowedModel
+from .bench_search import makeTracks
+
+
+def lastRow(model):
+    '''Times reading the last row, fetching more rows first if the model
+    needs them'''
+
+    start = time.perf_counter()
+    while model.canFetchMore(QModelIndex()):
+        model.fetchMore(QModelIndex())
+    model.data(model.index(model.rowCount() - 1, col("Track title")))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        model = loadDatabase('bench.db', Path(directory))
+        model.bulkInsert(makeTracks(args.tracks))
+        windowed = windowedModel(Path(directory))
+        for name, current in [('desuplayerModel', model),
+                              ('windowedModel', windowed)]:
+            for column, order in [(-1, Qt.AscendingOrder),
+                                  (col("Artist"), Qt.DescendingOrder)]:
+                start = time.perf_counter()
+                current.sort(column, order)
+                sorting = time.perf_counter() - start
+                print(f'{name:>15}, sorted on {column:2}: '
+                      f'sort {sorting * 1000:7.1f}ms, '
+                      f'last row {lastRow(current) * 1000:7.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
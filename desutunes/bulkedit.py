@@ -0,0 +1,48 @@
+'''The dialog for editing a column of many tracks at once'''
+
+from PyQt5.QtWidgets import (QComboBox, QDialog, QDialogButtonBox,
+                             QFormLayout, QLineEdit)
+
+
+class BulkEditDialog(QDialog):
+    '''Asks which column to edit, and either the value to set it to or, if
+    replace, the text to find in it and what to replace that with.
+    columns is a list of (column number, header) to choose from.'''
+
+    def __init__(self, columns, current=None, replace=False, parent=None):
+        super().__init__(parent)
+        self.replace = replace
+        self.setWindowTitle("Find and replace" if replace
+                            else "Edit selected tracks")
+
+        self._column = QComboBox()
+        for column, header in columns:
+            self._column.addItem(header, column)
+        if current is not None and self._column.findData(current) >= 0:
+            self._column.setCurrentIndex(self._column.findData(current))
+        self._find = QLineEdit()
+        self._value = QLineEdit()
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok |
+                                   QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+
+        form = QFormLayout()
+        form.addRow("Column", self._column)
+        if replace:
+            form.addRow("Find", self._find)
+            form.addRow("Replace with", self._value)
+        else:
+            form.addRow("Set to", self._value)
+        form.addRow(buttons)
+        self.setLayout(form)
+
+    def column(self):
+        return self._column.currentData()
+
+    def find(self):
+        return self._find.text()
+
+    def value(self):
+        return self._value.text()
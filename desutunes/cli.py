@@ -0,0 +1,273 @@
+'''desutunes without the GUI, for scripts and cron jobs. Run from the
+repository root:
+
+    python -m desutunes.cli dump [--delta] [--output FILE]
+    python -m desutunes.cli import [--allow-duplicates] FILE...
+    python -m desutunes.cli verify [--full]
+    python -m desutunes.cli duplicates
+    python -m desutunes.cli stats
+
+The library is found the same way the GUI finds it, from the desutunes
+settings for the current mode, unless --library is given.
+'''
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import os
+import sys
+from pathlib import Path
+from PyQt5.QtCore import QCoreApplication, QSettings
+from PyQt5.QtSql import QSqlDatabase, QSqlQuery
+from .connection import createConnection, threadConnection
+from . import integrity
+from .fingerprint import audioFingerprint
+from .library import importBatches
+from .processfile import metadataBatches
+from .processitunes import exportDatabaseXML, handleXML, lastExportRevision
+from .tagcache import TagCache
+
+# Exit codes
+OK = 0
+FAILED = 1  # the command ran, but failed or found problems
+USAGE = 2  # as used by argparse
+NO_DATABASE = 3
+
+_databases = {'nekodesu': 'desutunes.db', 'inudesu': 'inudesutunes.db'}
+
+
+def _rows(db, statement):
+    query = QSqlQuery(db)
+    query.setForwardOnly(True)
+    if not query.exec_(statement):
+        raise RuntimeError(query.lastError().text())
+    while query.next():
+        yield [query.value(index)
+               for index in range(query.record().count())]
+
+
+def dump(args, db, libraryPath):
+    since = lastExportRevision(db) if args.delta else None
+    output = args.output or ('songlibrary-delta.xml' if args.delta
+                             else 'songlibrary.xml')
+    if not args.delta and os.path.exists(output):
+        os.replace(output, output + '.old')
+        print(f"Backed up {output} to {output}.old, overwriting any "
+              "previous backup.")
+    if not exportDatabaseXML(db, libraryPath, output, since,
+                             readDb=threadConnection()):
+        return FAILED
+    print(f"Dumped the library to {output}")
+    return OK
+
+
+def importFiles(args, db, libraryPath):
+    unreadable = []
+    duplicates = []
+    imported = 0
+    xml = len(args.files) == 1 and args.files[0].endswith('xml')
+    cache = TagCache(libraryPath / 'tagcache.db')
+
+    def reportDuplicates(found):
+        duplicates.extend(found)
+        for track, id in found:
+            print(f"{track.OriginalFileName} has the same audio as {id}")
+
+    def report(track, error):
+        nonlocal imported
+        if error is not None:
+            print(f"Unable to copy {track.OriginalFileName}: {error}")
+        else:
+            imported += 1
+
+    batches = None
+    try:
+        if xml:
+            batches = handleXML(args.files[0], cache, args.workers)
+        else:
+            batches = metadataBatches(args.files, args.workers,
+                                      failures=unreadable, cache=cache)
+        uncopied = importBatches(
+            db, batches, libraryPath,
+            skipDuplicates=not args.allow_duplicates,
+            duplicates=reportDuplicates, copied=report)
+    finally:
+        if batches is not None:
+            batches.close()
+        cache.close()
+
+    if duplicates and not args.allow_duplicates:
+        print(f"Skipped {len(duplicates)} duplicate"
+              f"{'' if len(duplicates) == 1 else 's'}.")
+    print(f"Imported {imported} tracks.")
+    failed = len(unreadable) + len(uncopied)
+    if failed:
+        print(f"{failed} file{'' if failed == 1 else 's'} couldn't be "
+              "imported.")
+        return FAILED
+    return OK
+
+
+def verify(args, db, libraryPath):
+    '''Checks every track's file is there, matches its checksum and is the
+    right length, reading only those changed since the last verify.'''
+
+    result = integrity.scanLibrary(db, libraryPath, args.workers, args.full,
+                                   readDb=threadConnection())
+    for problem in result.problems:
+        print(f"{problem.ID}: {problem.Filename} "
+              f"{integrity.descriptions[problem.Status]}")
+    print(f"Checked {result.checked} tracks, reading {result.probed} "
+          f"file{'' if result.probed == 1 else 's'}.")
+    problems = len(result.problems)
+    print(f"{problems} problem{'' if problems == 1 else 's'} found.")
+    return FAILED if problems else OK
+
+
+def _fingerprintSafely(path):
+    try:
+        return audioFingerprint(path)
+    except OSError as ex:
+        print(f"Unable to read {path}: {ex}")
+        return None
+
+
+def duplicates(args, db, libraryPath):
+    '''Fingerprints the audio of the tracks that don't have a fingerprint
+    yet, such as those imported before fingerprints were taken, then lists
+    the tracks whose audio is the same'''
+
+    unprinted = list(_rows(threadConnection(), "select id, filename from "
+                           "tracks where fingerprint is null"))
+    if unprinted:
+        with ProcessPoolExecutor(args.workers) as pool:
+            fingerprints = list(pool.map(
+                _fingerprintSafely,
+                [str(libraryPath / fileName) for _, fileName in unprinted],
+                chunksize=64))
+        query = QSqlQuery(db)
+        query.prepare("update tracks set fingerprint = ? where id = ?")
+        query.addBindValue(fingerprints)
+        query.addBindValue([id for id, _ in unprinted])
+        if not (db.transaction() and query.execBatch() and db.commit()):
+            print(query.lastError().text() or db.lastError().text())
+            db.rollback()
+            return FAILED
+        print(f"Fingerprinted {sum(map(bool, fingerprints))} of "
+              f"{len(unprinted)} tracks.")
+
+    groups = 0
+    for fingerprint, count, tracks in _rows(
+            threadConnection(),
+            "select fingerprint, count(*), group_concat("
+            "'  ' || id || ': ' || artist || ', ' || tracktitle, char(10)) "
+            "from tracks where fingerprint is not null "
+            "group by fingerprint having count(*) > 1"):
+        groups += 1
+        print(f"{count} tracks share the audio {fingerprint}:\n{tracks}")
+    print(f"{groups} set{'' if groups == 1 else 's'} of duplicates found.")
+    return OK
+
+
+def stats(args, db, libraryPath):
+    readDb = threadConnection()
+    (tracks, length, needsLabel, needsComposer), = _rows(
+        readDb,
+        "select count(*), coalesce(sum(length), 0), "
+        "sum(label = ''), sum(composer = '') from tracks")
+    print(f"Tracks: {tracks}")
+    print(f"Total length: {length / 3600000:.1f} hours")
+    print(f"Missing label: {needsLabel or 0}")
+    print(f"Missing composer: {needsComposer or 0}")
+    for inMyriad, count in _rows(
+            readDb, "select inmyriad, count(*) from tracks "
+            "group by inmyriad order by count(*) desc"):
+        print(f"In Myriad {inMyriad!r}: {count}")
+    revision = lastExportRevision(readDb)
+    changed, = next(_rows(
+        readDb, "select count(distinct id) from changelog "
+        f"where seq > {int(revision)}"))
+    print(f"Changed since last dump: {changed}")
+    return OK
+
+
+def parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m desutunes.cli',
+        description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=sorted(_databases),
+                        help='which library to use (default: the mode the '
+                        'GUI was last in)')
+    parser.add_argument('--library', type=Path,
+                        help='the library folder (default: from settings)')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('dump', help='export the library XML')
+    command.add_argument('--delta', action='store_true',
+                         help='only the tracks changed since the last dump')
+    command.add_argument('--output', help='the file to write')
+    command.set_defaults(run=dump)
+
+    command = commands.add_parser(
+        'import', help='import audio files, folders or an iTunes XML file')
+    command.add_argument('files', nargs='+')
+    command.add_argument('--workers', type=int, default=None,
+                         help='processes reading tags (default: one per '
+                         'CPU)')
+    command.add_argument('--allow-duplicates', action='store_true',
+                         help='import tracks even if their audio is already '
+                         'in the library')
+    command.set_defaults(run=importFiles)
+
+    command = commands.add_parser(
+        'verify', help="check the library's files are all there and intact")
+    command.add_argument('--full', action='store_true',
+                         help="read every file, not just those that have "
+                         "changed since the last verify")
+    command.add_argument('--workers', type=int, default=None,
+                         help='processes reading files (default: one per '
+                         'CPU)')
+    command.set_defaults(run=verify)
+
+    command = commands.add_parser(
+        'duplicates', help='list the tracks whose audio is the same, '
+        'fingerprinting any tracks that need it first')
+    command.add_argument('--workers', type=int, default=None,
+                         help='processes reading files (default: one per '
+                         'CPU)')
+    command.set_defaults(run=duplicates)
+
+    command = commands.add_parser('stats', help='summarise the library')
+    command.set_defaults(run=stats)
+    return parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    # Qt's SQL drivers are plugins, which need an application to load; it
+    # has to be kept alive for as long as the database is in use
+    app = (QCoreApplication.instance() or  # noqa: F841
+           QCoreApplication(sys.argv[:1]))
+
+    settings = QSettings('h0m54r', 'desutunes')
+    mode = args.mode or settings.value('mode', defaultValue='nekodesu')
+    libraryPath = args.library or Path(settings.value(
+        f'{mode}/libraryPath',
+        defaultValue=os.path.expanduser(f'~/{mode}tunes')))
+    database = libraryPath / _databases[mode]
+    if not database.exists() and args.command != 'import':
+        print(f"There's no library database at {database}")
+        return NO_DATABASE
+    libraryPath.mkdir(parents=True, exist_ok=True)
+    if not createConnection(database):
+        print(f"Unable to open {database}")
+        return NO_DATABASE
+    try:
+        return args.run(args, QSqlDatabase.database(), libraryPath)
+    except Exception as ex:
+        print(f"{args.command} failed: {ex}")
+        return FAILED
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -38,42 +38,335 @@
 #
 ############################################################################
 
-from PyQt5.QtWidgets import QMessageBox
 from PyQt5.QtSql import QSqlDatabase, QSqlQuery
+from .sortkeys import keyColumns, sortChains, sortKey
+import threading
 
 
-def initDatabase(db):
+_ftsColumns = "tracktitle, artist, anime, album, label, composer"
+
+
+def _ftsValues(row):
+    return ', '.join(f'{row}.{column}' for column in _ftsColumns.split(', '))
+
+
+_trackColumns = ("id, filename, tracktitle, artist, album, length, anime, "
+                 "role, rolequant, label, composer, inmyriad, dateadded")
+
+
+def _addSortKeys(db):
+    '''Adds a column for each sort key that isn't there yet, and works out
+    the keys of the tracks already in the table'''
+
     query = QSqlQuery(db)
-    query.exec_("create table tracks(id text primary key, "
-                "filename text, "
-                "tracktitle text, "
-                "artist text, "
-                "album text, "
-                "length integer, "
-                "anime text, "
-                "role text, "
-                "rolequant text, "
-                "label text, "
-                "composer text, "
-                "inmyriad text, "
-                "dateadded text)")
+    record = db.record('tracks')
+    for keyColumn in keyColumns.values():
+        if record.indexOf(keyColumn) < 0 and not query.exec_(
+                f"alter table tracks add column {keyColumn} "
+                "text not null default ''"):
+            print(query.lastError().text())
+            return False
+    if not query.exec_(f"select rowid, {', '.join(keyColumns)} from tracks"):
+        print(query.lastError().text())
+        return False
+    rowids = []
+    keys = [[] for _ in keyColumns]
+    while query.next():
+        rowids.append(query.value(0))
+        for index, values in enumerate(keys):
+            values.append(sortKey(query.value(index + 1)))
+    if not rowids:
+        return True
+    update = QSqlQuery(db)
+    update.prepare(
+        "update tracks set "
+        f"{', '.join(f'{key} = ?' for key in keyColumns.values())} "
+        "where rowid = ?")
+    for values in keys + [rowids]:
+        update.addBindValue(values)
+    if not update.execBatch():
+        print(update.lastError().text())
+        return False
+    return True
+
 
+def _addFingerprints(db):
+    '''Adds the column for fingerprints of the tracks' audio, if it isn't
+    there yet. Tracks already in the table are left without one.'''
+
+    query = QSqlQuery(db)
+    if db.record('tracks').indexOf('fingerprint') >= 0:
+        return True
+    if not query.exec_("alter table tracks add column fingerprint text"):
+        print(query.lastError().text())
+        return False
     return True
 
 
-def createConnection(database):
-    db = QSqlDatabase.addDatabase('QSQLITE')
+# Each migration is a list of statements that takes the schema from the
+# version before it to its own; the version is stored in user_version.
+# A statement may also be a function, which is passed the database and
+# returns whether it succeeded. Statements must be safe to re-run, since
+# databases from before versioning may already have some of them applied.
+migrations = [
+    # 1: the tracks themselves
+    [
+        "create table if not exists tracks(id text primary key, "
+        "filename text, "
+        "tracktitle text, "
+        "artist text, "
+        "album text, "
+        "length integer, "
+        "anime text, "
+        "role text, "
+        "rolequant text, "
+        "label text, "
+        "composer text, "
+        "inmyriad text, "
+        "dateadded text)",
+    ],
+    # 2: checksums of the files copied into the library
+    [
+        "create table if not exists checksums("
+        "id text primary key, "
+        "checksum text)",
+    ],
+    # 3: a log of every change to tracks, so exports can tell what's new,
+    # and the rendered XML for each track
+    [
+        "create table if not exists changelog("
+        "seq integer primary key autoincrement, "
+        "id text, "
+        "deleted integer)",
+        "create index if not exists changelog_id on changelog(id, seq)",
+        "create trigger if not exists tracks_inserted after insert on tracks "
+        "begin "
+        "insert into changelog(id, deleted) values (new.id, 0); "
+        "end",
+        "create trigger if not exists tracks_updated after update on tracks "
+        "begin "
+        "insert into changelog(id, deleted) "
+        "select old.id, 1 where old.id is not new.id; "
+        "insert into changelog(id, deleted) values (new.id, 0); "
+        "end",
+        "create trigger if not exists tracks_deleted after delete on tracks "
+        "begin "
+        "insert into changelog(id, deleted) values (old.id, 1); "
+        "end",
+        "create table if not exists xml_fragments("
+        "id text primary key, "
+        "trackrowid integer, "
+        "seq integer, "
+        "root text, "
+        "fragment blob)",
+        "create table if not exists xml_exports("
+        "name text primary key, "
+        "seq integer)",
+    ],
+    # 4: indexes for sorting by date added and finding tracks that need
+    # attention; the text columns get theirs with their sort keys
+    [
+        "create index if not exists tracks_dateadded on tracks(dateadded)",
+        "create index if not exists tracks_inmyriad "
+        "on tracks(inmyriad, label, composer)",
+    ],
+    # 5: full-text search, kept in step with tracks by triggers
+    [
+        "create virtual table if not exists tracks_fts using fts5("
+        "tracktitle, artist, anime, album, label, composer, "
+        "content='tracks', content_rowid='rowid', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        "create trigger if not exists tracks_fts_inserted "
+        "after insert on tracks begin "
+        "insert into tracks_fts(rowid, " + _ftsColumns + ") "
+        "values (new.rowid, " + _ftsValues('new') + "); "
+        "end",
+        "create trigger if not exists tracks_fts_deleted "
+        "after delete on tracks begin "
+        "insert into tracks_fts(tracks_fts, rowid, " + _ftsColumns + ") "
+        "values ('delete', old.rowid, " + _ftsValues('old') + "); "
+        "end",
+        "create trigger if not exists tracks_fts_updated "
+        "after update on tracks begin "
+        "insert into tracks_fts(tracks_fts, rowid, " + _ftsColumns + ") "
+        "values ('delete', old.rowid, " + _ftsValues('old') + "); "
+        "insert into tracks_fts(rowid, " + _ftsColumns + ") "
+        "values (new.rowid, " + _ftsValues('new') + "); "
+        "end",
+        "insert into tracks_fts(tracks_fts) values ('rebuild')",
+    ],
+    # 6: case-folded, natural-order sort keys, with an index for each
+    # column the table can be sorted on. Updates that only touch the keys
+    # don't count as changes to the track.
+    [
+        "drop trigger if exists tracks_updated",
+        "create trigger tracks_updated "
+        "after update of " + _trackColumns + " on tracks "
+        "begin "
+        "insert into changelog(id, deleted) "
+        "select old.id, 1 where old.id is not new.id; "
+        "insert into changelog(id, deleted) values (new.id, 0); "
+        "end",
+        "drop trigger if exists tracks_fts_updated",
+        "create trigger tracks_fts_updated "
+        "after update of " + _ftsColumns + " on tracks begin "
+        "insert into tracks_fts(tracks_fts, rowid, " + _ftsColumns + ") "
+        "values ('delete', old.rowid, " + _ftsValues('old') + "); "
+        "insert into tracks_fts(rowid, " + _ftsColumns + ") "
+        "values (new.rowid, " + _ftsValues('new') + "); "
+        "end",
+        _addSortKeys,
+    ] + [
+        f"create index if not exists tracks_sort_{column} "
+        f"on tracks({', '.join(chain)})"
+        for column, chain in sortChains.items()
+    ],
+    # 7: fingerprints of the audio in each file, to find duplicates
+    [
+        _addFingerprints,
+        "create index if not exists tracks_fingerprint "
+        "on tracks(fingerprint)",
+    ],
+    # 8: what the last integrity scan found for each track's file
+    [
+        "create table if not exists integrity("
+        "id text primary key, "
+        "size integer, "
+        "mtime_ns integer, "
+        "length integer, "
+        "status text, "
+        "checked text)",
+        "create index if not exists integrity_status on integrity(status)",
+    ],
+    # 9: fragments rendered by an export that hasn't finished yet
+    [
+        "create table if not exists xml_fragments_staged("
+        "id text primary key, "
+        "trackrowid integer, "
+        "seq integer, "
+        "root text, "
+        "fragment blob)",
+    ],
+]
+
+
+def schemaVersion(db):
+    query = QSqlQuery("pragma user_version", db)
+    return query.value(0) if query.next() else 0
+
+
+def migrateDatabase(db):
+    '''Brings the schema of db up to date. Each migration runs in its own
+    transaction along with the update to user_version, so an upgrade that
+    fails part way leaves the database at the last complete version.'''
+
+    version = schemaVersion(db)
+    for number in range(version + 1, len(migrations) + 1):
+        if not db.transaction():
+            print(db.lastError().text())
+            return False
+        query = QSqlQuery(db)
+        for statement in migrations[number - 1] + [
+                f"pragma user_version = {number}"]:
+            if callable(statement):
+                # Functions print the error from their own queries
+                success = statement(db)
+                error = ''
+            else:
+                success = query.exec_(statement)
+                error = f": {query.lastError().text()}"
+            if not success:
+                print(f"Unable to upgrade database to version {number}"
+                      f"{error}")
+                db.rollback()
+                return False
+        if not db.commit():
+            print(db.lastError().text())
+            return False
+    return True
+
+
+# Applied to every connection. The cache and memory map are per
+# connection, so readers on other threads get their own.
+_pragmas = [
+    "pragma cache_size = -65536",
+    "pragma mmap_size = 268435456",
+    "pragma temp_store = memory",
+]
+# Applied to connections that write. In WAL mode readers don't block the
+# writer or each other, and a commit only has to append to the log;
+# synchronous = normal only syncs it at checkpoints, which can lose the
+# last few commits in a power cut but can't corrupt the database.
+_writePragmas = [
+    "pragma journal_mode = wal",
+    "pragma synchronous = normal",
+]
+_busyTimeout = 5000
+_databaseName = None
+
+
+def _configure(db, readOnly=False):
+    query = QSqlQuery(db)
+    for statement in _pragmas + ([] if readOnly else _writePragmas):
+        if not query.exec_(statement):
+            print(f"{statement}: {query.lastError().text()}")
+            return False
+    return True
+
+
+def _openConnection(name, database, readOnly=False):
+    if name is None:
+        db = QSqlDatabase.addDatabase('QSQLITE')
+    else:
+        db = QSqlDatabase.addDatabase('QSQLITE', name)
     db.setDatabaseName(str(database))
+    db.setConnectOptions(
+        f"QSQLITE_BUSY_TIMEOUT={_busyTimeout}" +
+        (";QSQLITE_OPEN_READONLY" if readOnly else ""))
     if not db.open():
-        QMessageBox.critical(
-            None, "Cannot open database",
-            "Unable to establish a database connection.\n"
-            "This example needs SQLite support. Please read the Qt SQL "
-            "driver documentation for information how to build it.\n\n"
-            "Click Cancel to exit.", QMessageBox.Cancel)
-        return False
+        print(db.lastError().text())
+        return db
+    _configure(db, readOnly)
+    return db
 
-    if 'tracks' not in db.tables():
-        return initDatabase(db)
 
-    return True
+def threadConnection(readOnly=True):
+    '''A connection for the calling thread to the database opened by
+    createConnection, read-only unless readOnly is False. Kept until
+    releaseThreadConnections is called on that thread.'''
+
+    name = (f"{'read' if readOnly else 'write'}-"
+            f"{threading.get_ident()}")
+    if QSqlDatabase.contains(name):
+        db = QSqlDatabase.database(name, open=False)
+        if db.databaseName() == _databaseName and db.isOpen():
+            return db
+        db.close()
+        del db
+        QSqlDatabase.removeDatabase(name)
+    return _openConnection(name, _databaseName, readOnly)
+
+
+def releaseThreadConnections():
+    '''Closes the calling thread's connections'''
+
+    for readOnly in (True, False):
+        name = (f"{'read' if readOnly else 'write'}-"
+                f"{threading.get_ident()}")
+        if QSqlDatabase.contains(name):
+            QSqlDatabase.database(name, open=False).close()
+            QSqlDatabase.removeDatabase(name)
+
+
+def createConnection(database):
+    '''Opens database as the default connection and brings its schema up
+    to date. Returns False if either fails.'''
+
+    global _databaseName
+
+    db = _openConnection(None, database)
+    if not db.isOpen():
+        return False
+
+    _databaseName = str(database)
+    return migrateDatabase(db)
@@ -0,0 +1,84 @@
+'''Copies imported audio into the library, checking every copy against a
+hash of the original'''
+
+import hashlib
+import os
+import queue
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+_chunkSize = 1 << 20
+
+
+def _hasher():
+    return hashlib.blake2b(digest_size=20)
+
+
+def hashFile(filename):
+    '''Returns the hex digest of the contents of filename, reading it in
+    chunks'''
+
+    digest = _hasher()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(_chunkSize), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def verifiedCopy(source, destination):
+    '''Copies source to destination, hashing the data as it goes, then
+    re-reads the copy to check it. Returns the hex digest.'''
+
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    digest = _hasher()
+    with open(source, 'rb') as fsrc, open(destination, 'wb') as fdst:
+        for chunk in iter(lambda: fsrc.read(_chunkSize), b''):
+            digest.update(chunk)
+            fdst.write(chunk)
+
+    checksum = digest.hexdigest()
+    if hashFile(destination) != checksum:
+        os.remove(destination)
+        raise OSError(f'Copy of {source} does not match the original')
+    return checksum
+
+
+def _device(filename):
+    try:
+        return os.stat(filename).st_dev
+    except OSError:
+        return None
+
+
+def _copyGroup(tracks, libraryPath, results, stop):
+    for track in tracks:
+        if stop is not None and stop.is_set():
+            results.put((track, None, CancelledError()))
+            continue
+        try:
+            checksum = verifiedCopy(track.OriginalFileName,
+                                    libraryPath / track.Filename)
+        except Exception as ex:
+            results.put((track, None, ex))
+        else:
+            results.put((track, checksum, None))
+
+
+def copyTracks(tracks, libraryPath, workers=4, perDevice=1, stop=None):
+    '''Copies each track's file to its place in the library, at most
+    perDevice at a time from any one device, yielding (track, checksum,
+    error) as copies finish.'''
+
+    groups = {}
+    for track in tracks:
+        groups.setdefault(_device(track.OriginalFileName), []).append(track)
+
+    results = queue.Queue()
+    remaining = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for group in groups.values():
+            for start in range(perDevice):
+                executor.submit(_copyGroup, group[start::perDevice],
+                                libraryPath, results, stop)
+            remaining += len(group)
+        for _ in range(remaining):
+            yield results.get()
@@ -1,24 +1,40 @@
 #! /usr/bin/env python
 
+# First, so that --profile-startup counts the time spent importing
+from .startup import StartupProfile, started
 import sys
 import os
+import threading
 from pathlib import Path
-from PyQt5.QtCore import Qt, QSettings, QSize, QPoint
+from PyQt5.QtCore import (Qt, QSettings, QSize, QPoint, QThreadPool, QTimer,
+                          pyqtSignal)
 from PyQt5.QtGui import QIcon, QKeySequence
-from PyQt5.QtWidgets import (QApplication, QDialog, QFileDialog, QMessageBox,
-                             QWidget, QVBoxLayout)
+from PyQt5.QtWidgets import (QApplication, QDialog, QFileDialog, QLineEdit,
+                             QMessageBox, QProgressDialog, QWidget,
+                             QVBoxLayout)
+from .bulkedit import BulkEditDialog
+from .fields import headers
 from .tablemodel import loadDatabase, col
-from .processfile import getMetadataForFileList
-from .processitunes import handleXML, exportXML
-from .player import AudioPlayer
+from .connection import threadConnection, releaseThreadConnections
 from .menu import setUpMenu
-from shutil import move
 
 
+# Tag reading (mutagen), XML export and the audio player (QtMultimedia) are
+# slow to import, so they're imported where they're first used instead, and
+# the player is only made once the window has been drawn.
 class Desutunes(QWidget):
-    def __init__(self, database, mode, settings):
+    # The scanResult of a library verify, or the error that stopped it
+    libraryVerified = pyqtSignal(object, str)
+    # The file the library was dumped to, and why it failed if it did
+    libraryDumped = pyqtSignal(str, str)
+
+    def __init__(self, database, mode, settings, windowed=False,
+                 profile=None):
         super().__init__()
 
+        self._profile = profile or StartupProfile(enabled=False)
+        self._painted = False
+        self._player = None
         self.settings = settings
         libraryPath = self.settings.value(
             f'{mode}/libraryPath',
@@ -31,14 +47,20 @@ class Desutunes(QWidget):
                                 "Unable to create a library folder.")
             sys.exit()
 
-        self._model = loadDatabase(database, self.libraryPath)
+        self._model = loadDatabase(database, self.libraryPath, windowed,
+                                   lazy=True)
         self._mode = mode
         if not self._model:
             QMessageBox.warning("Unable to load database.",
                                 "desutunes couldn't load the database.")
             sys.exit()
+        self._imports = set()
+        self.libraryVerified.connect(self.showVerifyResult)
+        self.libraryDumped.connect(self.showDumpResult)
+        self._profile.mark('open database')
 
         self.initUI()
+        self._profile.mark('build window')
 
     def initUI(self):
         self.setAcceptDrops(True)
@@ -46,9 +68,17 @@ class Desutunes(QWidget):
         self._tableView.doubleClicked.connect(self.tableDoubleClick)
         self._tableView.horizontalHeader().sectionClicked.connect(
             self.tableColumnHeaderClick)
-        self._player = AudioPlayer()
+        self._searchBox = QLineEdit()
+        self._searchBox.setPlaceholderText("Search")
+        self._searchBox.setClearButtonEnabled(True)
+        self._searchTimer = QTimer(self)
+        self._searchTimer.setSingleShot(True)
+        self._searchTimer.setInterval(150)
+        self._searchTimer.timeout.connect(self.search)
+        self._searchBox.textChanged.connect(
+            lambda text: self._searchTimer.start())
         boxes = QVBoxLayout()
-        boxes.addWidget(self._player)
+        boxes.addWidget(self._searchBox)
         boxes.addWidget(self._tableView)
         self.setLayout(boxes)
         self.resize(
@@ -66,6 +96,32 @@ class Desutunes(QWidget):
         self.show()
         self.raise_()
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._painted:
+            self._painted = True
+            self._profile.mark('first paint')
+            QTimer.singleShot(0, self.finishStartup)
+
+    def finishStartup(self):
+        '''The parts of starting up that can wait until the window has been
+        drawn'''
+
+        self._model.select()
+        self._profile.mark('read tracks')
+        self.player()
+        self._profile.mark('load player')
+        self._model.libraryIndex.start()
+        self._profile.mark('start library scan')
+        self._profile.report()
+
+    def player(self):
+        if self._player is None:
+            from .player import AudioPlayer
+            self._player = AudioPlayer()
+            self.layout().insertWidget(0, self._player)
+        return self._player
+
     def dragEnterEvent(self, e):
         if e.mimeData().hasUrls:
             e.accept()
@@ -116,10 +172,49 @@ class Desutunes(QWidget):
         except Exception:
             return False
         else:
-            if len(files) == 1 and files[0].endswith('xml'):
-                self._model.addRecords(handleXML(files[0]))
-            else:
-                self._model.addRecords(getMetadataForFileList(files))
+            self.importFiles(files)
+
+    def importFiles(self, files):
+        '''Imports files, or an iTunes XML file, on a worker thread,
+        showing how it's going in a progress dialog that can cancel it'''
+
+        from .importer import ImportWorker
+
+        worker = ImportWorker(files, self.libraryPath,
+                              cacheFileName=self.libraryPath / 'tagcache.db')
+        dialog = QProgressDialog("Looking for audio files...", "Cancel",
+                                 0, 0, self)
+        dialog.setWindowTitle("Importing")
+        dialog.setAutoClose(False)
+        dialog.setAutoReset(False)
+        dialog.setMinimumDuration(0)
+        dialog.canceled.connect(worker.cancel)
+
+        def progress(stage, done, total):
+            if dialog.wasCanceled():
+                return
+            dialog.setLabelText(
+                f"{stage.capitalize()} {done}"
+                f"{f' of {total}' if total else ''} "
+                f"track{'' if done == 1 else 's'}")
+            if stage in ('copied', 'inserted'):
+                dialog.setMaximum(total)
+                dialog.setValue(done)
+
+        def finished(failures):
+            self._imports.discard(worker)
+            dialog.close()
+            self._model.reportFailures(failures)
+
+        worker.signals.progress.connect(progress)
+        worker.signals.inserted.connect(
+            lambda tracks: self._model.tracksInserted(tracks,
+                                                      self._tableView))
+        worker.signals.duplicates.connect(self._model.reportDuplicates)
+        worker.signals.finished.connect(finished)
+        self._imports.add(worker)
+        dialog.setValue(0)
+        QThreadPool.globalInstance().start(worker)
 
     def switch(self):
         if self._mode == 'nekodesu':
@@ -138,34 +233,70 @@ class Desutunes(QWidget):
             row = cell.row()
             filename = self._model.data(
                 self._model.index(row, col("File name")), Qt.DisplayRole)
-            self._player.openFile(
+            self.player().openFile(
                 str(self.libraryPath / filename),
                 text='{} - {}'.format(
                     self._model.data(
                         self._model.index(row, col("Track title"))),
                     self._model.data(self._model.index(row, col("Artist")))))
-            self._player.play()
+            self.player().play()
+
+    def search(self):
+        self._model.search(self._searchBox.text())
 
     def tableColumnHeaderClick(self, index):
-        self._model.resort(index)
+        self._model.resort(index, self._tableView)
 
     def keyPressEvent(self, event):
         if event.matches(QKeySequence.Delete):
-            selectionModel = self._tableView.selectionModel()
-            for row in reversed(selectionModel.selectedRows()):
-                fileName = self._model.data(
-                    self._model.index(row.row(), col("File name")))
-                original = self.libraryPath / fileName
-                if original.exists():
-                    (self.libraryPath / "__deleted__").mkdir(
-                        parents=True, exist_ok=True)
-                    move(str(original), str(self.libraryPath / "__deleted__"))
-                self._model.removeRecord(row.row())
+            rows = self._tableView.selectionModel().selectedRows()
+            ids = [self._model.data(self._model.index(row.row(), col("ID")))
+                   for row in rows]
+            if ids:
+                self._model.removeRecords(ids)
         super().keyPressEvent(event)
 
+    def selectedRows(self):
+        return sorted({index.row() for index in
+                       self._tableView.selectionModel().selectedIndexes()})
+
+    def editSelected(self, replace=False):
+        '''Sets a column of every selected track to one value, or, if
+        replace, finds and replaces text in it'''
+
+        rows = self.selectedRows()
+        if not rows:
+            QMessageBox.information(self, "Nothing selected",
+                                    "Select the tracks to edit first.")
+            return
+        editable = [
+            (column, header) for column, header in enumerate(headers)
+            if self._model.flags(self._model.index(rows[0], column))
+            & Qt.ItemIsEditable and header != "ID"
+        ]
+        dialog = BulkEditDialog(editable, self._tableView.currentIndex()
+                                .column(), replace, self)
+        if dialog.exec_() != QDialog.Accepted:
+            return
+        if replace:
+            changed = self._model.replaceInColumn(
+                rows, dialog.column(), dialog.find(), dialog.value())
+        else:
+            changed = self._model.setColumn(rows, dialog.column(),
+                                            dialog.value())
+        if changed is None:
+            QMessageBox.warning(self, "Edit failed",
+                                "Unable to save the changes.")
+
+    def findReplace(self):
+        self.editSelected(replace=True)
+
     def closeEvent(self, event):
         self.settings.setValue('window/size', self.size())
         self.settings.setValue('window/pos', self.pos())
+        for worker in list(self._imports):
+            worker.cancel()
+        QThreadPool.globalInstance().waitForDone()
         event.accept()
 
     def dumpXML(self):
@@ -173,12 +304,79 @@ class Desutunes(QWidget):
         browser.setAcceptMode(QFileDialog.AcceptSave)
         browser.setDefaultSuffix("xml")
         if browser.exec_() == QDialog.Accepted:
-            exportXML(self._model, self.libraryPath,
-                      browser.selectedFiles()[0])
+            threading.Thread(target=self._dumpXML,
+                             args=(browser.selectedFiles()[0],)).start()
+
+    def _dumpXML(self, fileName):
+        '''Writes the XML out on a worker thread, with connections of its
+        own, so that the table can still be used in the meantime'''
+
+        from .processitunes import exportDatabaseXML
+
+        errors = []
+        try:
+            exportDatabaseXML(threadConnection(readOnly=False),
+                              self.libraryPath, fileName,
+                              readDb=threadConnection(), errors=errors)
+        except Exception as ex:
+            errors.append(str(ex))
+        finally:
+            releaseThreadConnections()
+        self.libraryDumped.emit(fileName, errors[0] if errors else '')
+
+    def showDumpResult(self, fileName, error):
+        if error:
+            QMessageBox.warning(self, "Dump failed",
+                                f"Unable to dump the library to {fileName}: "
+                                f"{error}")
+        else:
+            QMessageBox.information(self, "Library dumped",
+                                    f"Dumped the library to {fileName}.")
+
+    def verifyLibrary(self):
+        threading.Thread(target=self._verifyLibrary).start()
+
+    def _verifyLibrary(self):
+        '''Scans the library's files on a worker thread, then sends what it
+        found back to the window'''
+
+        from .integrity import scanLibrary
+
+        try:
+            result = scanLibrary(threadConnection(readOnly=False),
+                                 self.libraryPath, readDb=threadConnection())
+        except Exception as ex:
+            self.libraryVerified.emit(None, str(ex))
+        else:
+            self.libraryVerified.emit(result, '')
+        finally:
+            releaseThreadConnections()
+
+    def showVerifyResult(self, result, error):
+        from .integrity import descriptions
+
+        if result is None:
+            QMessageBox.warning(self, "Verify failed",
+                                f"Unable to verify the library: {error}")
+            return
+        problems = result.problems
+        message = (f"Checked {result.checked} tracks: "
+                   f"{len(problems) or 'no'} "
+                   f"problem{'' if len(problems) == 1 else 's'} found.")
+        shown = 20
+        lines = [f" - {problem.Filename} {descriptions[problem.Status]}"
+                 for problem in problems[:shown]]
+        if len(problems) > shown:
+            lines.append(f" ... and {len(problems) - shown} more; run "
+                         "python -m desutunes.cli verify for them all")
+        if problems:
+            message += '\n\n' + '\n'.join(lines)
+        QMessageBox.information(self, "Library verified", message)
 
 
 if __name__ == '__main__':
-    app = QApplication(sys.argv)
+    profile = StartupProfile('--profile-startup' in sys.argv, started)
+    profile.mark('imports')
     settings = QSettings('h0m54r', 'desutunes')
     if 'inu' in sys.argv or 'inudesu' in sys.argv:
         mode = 'inudesu'
@@ -187,6 +385,15 @@ if __name__ == '__main__':
     else:
         mode = settings.value('mode', defaultValue='nekodesu')
 
+    if 'dump' in sys.argv:
+        # Dumping doesn't need the window; see desutunes.cli
+        from . import cli
+        sys.exit(cli.main(['--mode', mode, 'dump'] +
+                          (['--delta'] if 'delta' in sys.argv else [])))
+
+    app = QApplication(sys.argv)
+    profile.mark('start Qt')
+
     if mode == 'nekodesu':
         icon = QIcon("icons/png/icon.png")
         icon.addFile("icons/png/icon_small.png")
@@ -197,16 +404,8 @@ if __name__ == '__main__':
         database = 'inudesutunes.db'
 
     app.setWindowIcon(icon)
-    desutunes = Desutunes(database, mode, settings)
-    if 'dump' in sys.argv:
-        try:
-            os.rename("songlibrary.xml", "songlibrary.xml.old")
-        except Exception:
-            pass
-        else:
-            print("Backed up songlibrary.xml to songlibrary.xml.old, "
-                  "overwriting any previous backup.")
-        exportXML(desutunes._model, desutunes.libraryPath, "songlibrary.xml")
-    else:
-        desutunes.show()
-        sys.exit(app.exec_())
+    windowed = ('windowed' in sys.argv or
+                settings.value('windowedModel', defaultValue=False, type=bool))
+    desutunes = Desutunes(database, mode, settings, windowed, profile)
+    desutunes.show()
+    sys.exit(app.exec_())
@@ -0,0 +1,13 @@
+'''The fields of a track, as shown in the table and stored in the tracks
+table. Kept apart from the models so that code with no GUI can use them
+without loading Qt's widgets.'''
+
+headers = [
+    "ID", "File name", "Track title", "Artist", "Album", "Length", "Anime",
+    "Role", "Role qualifier", "Label", "Composer", "In Myriad", "Date added"
+]
+col = headers.index
+columns = [
+    "id", "filename", "tracktitle", "artist", "album", "length", "anime",
+    "role", "rolequant", "label", "composer", "inmyriad", "dateadded"
+]
@@ -0,0 +1,133 @@
+'''Fingerprints of the audio in a file, leaving out its tags, so that the
+same recording imported twice with different tags can be recognised'''
+
+import hashlib
+import os
+import struct
+
+_chunkSize = 1 << 20
+
+
+def _id3v2Size(header):
+    '''The size of the ID3v2 tag starting with header (its first 10 bytes),
+    including the header and any footer, or 0 if it isn't one'''
+
+    if len(header) < 10 or header[:3] != b'ID3':
+        return 0
+    size = 0
+    for byte in header[6:10]:
+        size = (size << 7) | (byte & 0x7f)
+    return 10 + size + (10 if header[5] & 0x10 else 0)
+
+
+def _skipID3v2(f, start=0):
+    '''The position after any ID3v2 tags at start'''
+
+    while True:
+        f.seek(start)
+        size = _id3v2Size(f.read(10))
+        if not size:
+            return start
+        start += size
+
+
+def _trimTrailingTags(f, start, end):
+    '''The end of the audio that finishes by end, once any ID3v1 and APEv2
+    tags after it, in either order, are left out'''
+
+    while True:
+        if end - start >= 128:
+            f.seek(end - 128)
+            if f.read(3) == b'TAG':
+                end -= 128
+                continue
+        if end - start >= 32:
+            f.seek(end - 32)
+            footer = f.read(32)
+            size, _, flags = struct.unpack('<III', footer[12:24])
+            # The size counts the footer, but not the header
+            if footer[:8] == b'APETAGEX' and size >= 32:
+                end -= size + (32 if flags & 0x80000000 else 0)
+                continue
+        return max(start, end)
+
+
+def _streamRanges(f, size):
+    '''MP3 and ADTS AAC: the frames between the tags at either end'''
+
+    start = _skipID3v2(f)
+    return [(start, _trimTrailingTags(f, start, size))]
+
+
+def _flacRanges(f, size):
+    '''FLAC: the frames after the last metadata block'''
+
+    position = _skipID3v2(f)
+    f.seek(position)
+    if f.read(4) != b'fLaC':
+        return None
+    position += 4
+    while True:
+        f.seek(position)
+        header = f.read(4)
+        if len(header) < 4:
+            return None
+        position += 4 + int.from_bytes(header[1:4], 'big')
+        if header[0] & 0x80:
+            break
+    return [(position, _trimTrailingTags(f, position, size))]
+
+
+def _mp4Ranges(f, size):
+    '''MP4: the contents of the top-level mdat boxes. The tags are kept in
+    moov, so edits to them move mdat about but don't change it.'''
+
+    ranges = []
+    position = 0
+    while position + 8 <= size:
+        f.seek(position)
+        boxSize, boxType = struct.unpack('>I4s', f.read(8))
+        headerSize = 8
+        if boxSize == 1:
+            boxSize, = struct.unpack('>Q', f.read(8))
+            headerSize = 16
+        elif boxSize == 0:
+            boxSize = size - position
+        if boxSize < headerSize:
+            return None
+        if boxType == b'mdat':
+            ranges.append((position + headerSize,
+                           min(size, position + boxSize)))
+        position += boxSize
+    return ranges or None
+
+
+_audioRanges = {
+    '.mp3': _streamRanges,
+    '.aac': _streamRanges,
+    '.flac': _flacRanges,
+    '.m4a': _mp4Ranges,
+    '.mp4': _mp4Ranges,
+}
+
+
+def audioFingerprint(filename):
+    '''A hex digest of the audio in filename, without its ID3, APE, FLAC or
+    MP4 tags. A file whose format isn't known, or whose layout can't be made
+    sense of, is hashed whole.'''
+
+    digest = hashlib.blake2b(digest_size=20)
+    with open(filename, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        findRanges = _audioRanges.get(os.path.splitext(filename)[1].lower())
+        ranges = findRanges(f, size) if findRanges else None
+        for start, end in ranges or [(0, size)]:
+            f.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                chunk = f.read(min(_chunkSize, remaining))
+                if not chunk:
+                    break
+                digest.update(chunk)
+                remaining -= len(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,163 @@
+'''Imports audio files and iTunes XML into the library on a worker thread,
+reporting its progress back to the GUI with signals'''
+
+import threading
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+from .connection import threadConnection, releaseThreadConnections
+from .processfile import processFiles, walkAudioFiles
+from .processitunes import handleXML
+from .library import importBatches
+from .tagcache import TagCache
+
+# The stages of an import, in the order they finish
+SCANNED = 'scanned'
+PARSED = 'parsed'
+COPIED = 'copied'
+INSERTED = 'inserted'
+
+
+class ImportSignals(QObject):
+    '''What an ImportWorker reports back to the thread that started it'''
+
+    # The stage, how far through it the import is, and how far it has to
+    # go (0 if that isn't known yet)
+    progress = pyqtSignal(str, int, int)
+    # The tracks in a batch that has just been committed
+    inserted = pyqtSignal(list)
+    # (track, ID of the track already in the library) for each track whose
+    # audio is a duplicate
+    duplicates = pyqtSignal(list)
+    # The tracks that couldn't be imported
+    finished = pyqtSignal(list)
+
+
+class ImportWorker(QRunnable):
+    '''Reads, copies and inserts files (or the tracks in an iTunes XML file)
+    off the GUI thread, in committed batches. Connect to signals, then run
+    it on a QThreadPool.'''
+
+    def __init__(self, files, libraryPath, cacheFileName=None, workers=None,
+                 copyWorkers=4, batchSize=500, skipDuplicates=True):
+        super().__init__()
+        self.files = files
+        self.libraryPath = libraryPath
+        self.cacheFileName = cacheFileName
+        self.workers = workers
+        self.copyWorkers = copyWorkers
+        self.batchSize = batchSize
+        self.skipDuplicates = skipDuplicates
+        self.signals = ImportSignals()
+        self._stop = threading.Event()
+
+    def cancel(self):
+        '''Stops the import as soon as it can. Files that have already been
+        copied are still inserted, so nothing is left half-imported.'''
+
+        self._stop.set()
+
+    def cancelled(self):
+        return self._stop.is_set()
+
+    def run(self):
+        failures = []
+        cache = None
+        batches = None
+        try:
+            if self.cacheFileName is not None:
+                cache = TagCache(self.cacheFileName)
+            if len(self.files) == 1 and self.files[0].endswith('xml'):
+                batches = self._readXML(cache)
+            else:
+                batches = self._readFiles(cache)
+            failures = self._importBatches(batches)
+        except Exception as ex:
+            print(f"Import failed: {ex}")
+        finally:
+            # Before the cache is closed, since reading uses it
+            if batches is not None:
+                batches.close()
+            if cache is not None:
+                cache.close()
+            releaseThreadConnections()
+            self.signals.finished.emit(failures)
+
+    def _readXML(self, cache):
+        return handleXML(
+            self.files[0], cache, self.workers, self.batchSize,
+            progress=lambda read: self.signals.progress.emit(
+                PARSED, read, 0))
+
+    def _readFiles(self, cache):
+        scanned = 0
+
+        def scan():
+            nonlocal scanned
+            for fileName in walkAudioFiles(self.files):
+                if self.cancelled():
+                    return
+                scanned += 1
+                self.signals.progress.emit(SCANNED, scanned, 0)
+                yield fileName
+
+        batch = []
+        results = processFiles(scan(), self.workers, cache)
+        try:
+            for parsed, (fileName, result, error) in enumerate(results, 1):
+                if error is not None:
+                    print(f"Unable to read {fileName}: {error}")
+                else:
+                    batch.extend(result)
+                self.signals.progress.emit(PARSED, parsed, scanned)
+                if self.cancelled():
+                    return
+                if len(batch) >= self.batchSize:
+                    yield batch
+                    batch = []
+        finally:
+            results.close()
+        if batch:
+            yield batch
+
+    def _importBatches(self, batches):
+        '''Copies and inserts each batch of tracks as it is read. The copy
+        and insert totals grow as batches come in.'''
+
+        total = 0
+        copied = 0
+        inserted = 0
+        duplicates = []
+
+        def counted():
+            nonlocal total
+            for batch in batches:
+                total += len(batch)
+                yield batch
+
+        def reportDuplicates(found):
+            nonlocal total
+            duplicates.extend(found)
+            if self.skipDuplicates:
+                total -= len(found)
+
+        def reportCopy(track, error):
+            nonlocal copied
+            copied += 1
+            if error is not None:
+                print(error)
+            self.signals.progress.emit(COPIED, copied, total)
+
+        def reportBatch(batch):
+            nonlocal inserted
+            inserted += len(batch)
+            self.signals.progress.emit(INSERTED, inserted, total)
+            self.signals.inserted.emit(batch)
+
+        try:
+            return importBatches(
+                threadConnection(readOnly=False), counted(), self.libraryPath,
+                self.copyWorkers, self.batchSize, self.skipDuplicates,
+                duplicates=reportDuplicates, copied=reportCopy,
+                inserted=reportBatch, stop=self._stop)
+        finally:
+            if duplicates:
+                self.signals.duplicates.emit(duplicates)
@@ -0,0 +1,178 @@
+'''Checks that the files in the library are still there and still what was
+imported. What each scan finds is kept in the integrity table, so the next
+scan only has to read the files whose size or modification time has
+changed; the rest just need a stat.'''
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timezone
+import os
+import mutagen
+from mutagen import aac
+from PyQt5.QtSql import QSqlQuery
+from .copyfiles import hashFile
+
+# The state of a track's file
+OK = 'ok'
+MISSING = 'missing'
+UNREADABLE = 'unreadable'
+CORRUPT = 'checksum'  # doesn't match the checksum taken when it was copied
+WRONG_LENGTH = 'length'  # isn't as long as the database says
+
+# What each state means, to show to people
+descriptions = {
+    MISSING: "is missing",
+    UNREADABLE: "can't be read",
+    CORRUPT: "doesn't match its checksum",
+    WRONG_LENGTH: "isn't as long as the library says",
+}
+
+# How far, in ms, the length of a file may be from the one in the database
+lengthTolerance = 1000
+
+problem = namedtuple('problem', ['ID', 'Filename', 'Status'])
+scanResult = namedtuple('scanResult', ['checked', 'probed', 'problems'])
+
+_statChunk = 256
+
+
+def _statAll(paths):
+    '''(size, mtime_ns) of each of paths, or None for those that can't be
+    found'''
+
+    results = []
+    for path in paths:
+        try:
+            info = os.stat(path)
+        except OSError:
+            results.append(None)
+        else:
+            results.append((info.st_size, info.st_mtime_ns))
+    return results
+
+
+def _probe(path, checksum=None):
+    '''Reads the length in ms of the audio in path, and checks the file
+    against checksum if there is one. Returns (length, intact), with a
+    length of None if the file can't be read.'''
+
+    try:
+        # ADTS with an ID3 tag looks like MP3 to mutagen.File
+        if path.lower().endswith('.aac'):
+            audio = aac.AAC(path)
+        else:
+            audio = mutagen.File(path)
+        if audio is None:
+            return None, False
+        length = int(audio.info.length * 1000)
+        return length, checksum is None or hashFile(path) == checksum
+    except (OSError, mutagen.MutagenError) as ex:
+        print(f"Unable to read {path}: {ex}")
+        return None, False
+
+
+def _status(trackLength, length, intact):
+    if length is None:
+        return UNREADABLE
+    if not intact:
+        return CORRUPT
+    if not isinstance(trackLength, int) or \
+            abs(length - trackLength) > lengthTolerance:
+        return WRONG_LENGTH
+    return OK
+
+
+def scanLibrary(db, libraryPath, workers=None, full=False, readDb=None):
+    '''Checks that the file of every track in db is there, matches its
+    checksum and is the right length, reading only files that have changed
+    (all of them if full), and returns a scanResult.'''
+
+    query = QSqlQuery(db if readDb is None else readDb)
+    query.setForwardOnly(True)
+    if not query.exec_(
+            "select t.id, t.filename, t.length, c.checksum, "
+            "i.size, i.mtime_ns, i.length, i.status from tracks t "
+            "left join checksums c on c.id = t.id "
+            "left join integrity i on i.id = t.id order by t.rowid"):
+        raise RuntimeError(query.lastError().text())
+    tracks = []
+    while query.next():
+        tracks.append([None if query.isNull(index) else query.value(index)
+                       for index in range(8)])
+    query.finish()
+
+    paths = [str(libraryPath / track[1]) for track in tracks]
+    with ThreadPoolExecutor(workers) as pool:
+        stats = [stat for chunk in pool.map(
+            _statAll, [paths[start:start + _statChunk]
+                       for start in range(0, len(paths), _statChunk)])
+                 for stat in chunk]
+
+    toProbe = [
+        index for index, (track, stat) in enumerate(zip(tracks, stats))
+        if stat is not None and (full or track[7] in (None, MISSING) or
+                                 stat != (track[4], track[5]))
+    ]
+    probePaths = [paths[index] for index in toProbe]
+    checksums = [tracks[index][3] for index in toProbe]
+    if workers is not None and workers <= 1:
+        probes = list(map(_probe, probePaths, checksums))
+    elif toProbe:
+        with ProcessPoolExecutor(workers) as pool:
+            probes = list(pool.map(_probe, probePaths, checksums,
+                                   chunksize=16))
+    else:
+        probes = []
+    probed = dict(zip(toProbe, probes))
+
+    problems = []
+    changed = []
+    for index, (track, stat) in enumerate(zip(tracks, stats)):
+        id, fileName, trackLength, _, size, mtime_ns, length, status = track
+        if stat is None:
+            newStatus = MISSING
+            size = mtime_ns = length = None
+        else:
+            if index in probed:
+                size, mtime_ns = stat
+                length, intact = probed[index]
+            else:
+                intact = status != CORRUPT
+            newStatus = _status(trackLength, length, intact)
+        if newStatus != OK:
+            problems.append(problem(id, fileName, newStatus))
+        if index in probed or newStatus != status:
+            changed.append((id, size, mtime_ns, length, newStatus))
+
+    _saveResults(db, changed)
+    return scanResult(len(tracks), len(toProbe), problems)
+
+
+def _saveResults(db, changed):
+    queries = []
+    if changed:
+        query = QSqlQuery(db)
+        query.prepare("insert or replace into integrity"
+                      "(id, size, mtime_ns, length, status) "
+                      "values (?, ?, ?, ?, ?)")
+        for values in zip(*changed):
+            query.addBindValue(list(values))
+        queries.append((query, query.execBatch))
+    query = QSqlQuery(db)
+    query.prepare("update integrity set checked = ?")
+    query.addBindValue(
+        datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M"))
+    queries.append((query, query.exec_))
+    query = QSqlQuery(db)
+    query.prepare("delete from integrity "
+                  "where id not in (select id from tracks)")
+    queries.append((query, query.exec_))
+
+    if not db.transaction():
+        raise RuntimeError(db.lastError().text())
+    for query, execute in queries:
+        if not execute():
+            db.rollback()
+            raise RuntimeError(query.lastError().text())
+    if not db.commit():
+        raise RuntimeError(db.lastError().text())
@@ -0,0 +1,224 @@
+'''Writes tracks into the library and its database. Has no GUI, so it can
+be used from worker threads and the command line.'''
+
+from concurrent.futures import CancelledError
+import json
+import os
+import shutil
+from PyQt5.QtSql import QSqlQuery
+from .copyfiles import copyTracks
+from .fields import columns
+from .sortkeys import keyColumns, sortKey
+
+
+def insertTracks(db, tracks, checksums=None):
+    '''Inserts tracks (and optionally the checksums of their files) into db
+    with prepared statements, executed as a batch inside a single
+    transaction'''
+
+    if not tracks:
+        return True
+    queries = []
+    query = QSqlQuery(db)
+    names = columns + list(keyColumns.values()) + ['fingerprint']
+    query.prepare(f"insert into tracks({', '.join(names)}) "
+                  f"values ({', '.join('?' * len(names))})")
+    values = [[str(track[index]) for track in tracks]
+              for index in range(len(columns))]
+    for column in values:
+        query.addBindValue(column)
+    for column in keyColumns:
+        query.addBindValue([sortKey(value)
+                            for value in values[columns.index(column)]])
+    query.addBindValue([track.Fingerprint or None for track in tracks])
+    queries.append(query)
+    if checksums is not None:
+        query = QSqlQuery(db)
+        query.prepare("insert or replace into checksums(id, checksum) "
+                      "values (?, ?)")
+        query.addBindValue([track.ID for track in tracks])
+        query.addBindValue(list(checksums))
+        queries.append(query)
+
+    if not db.transaction():
+        print(db.lastError().text())
+        return False
+    for query in queries:
+        if not query.execBatch():
+            print(query.lastError().text())
+            db.rollback()
+            return False
+    return db.commit()
+
+
+def splitDuplicates(db, tracks):
+    '''Separates tracks whose audio is already in db, or earlier in tracks,
+    from the rest. Returns the tracks that aren't duplicates, and a list of
+    (duplicate, ID of the track it duplicates).'''
+
+    seen = {}
+    fingerprints = [track.Fingerprint for track in tracks
+                    if track.Fingerprint]
+    if fingerprints:
+        query = QSqlQuery(db)
+        query.setForwardOnly(True)
+        query.prepare("select fingerprint, id from tracks where fingerprint "
+                      "in (select value from json_each(?))")
+        query.addBindValue(json.dumps(fingerprints))
+        if not query.exec_():
+            print(query.lastError().text())
+        while query.next():
+            seen.setdefault(query.value(0), query.value(1))
+
+    unique = []
+    duplicates = []
+    for track in tracks:
+        if track.Fingerprint in seen:
+            duplicates.append((track, seen[track.Fingerprint]))
+            continue
+        unique.append(track)
+        if track.Fingerprint:
+            seen[track.Fingerprint] = track.ID
+    return unique, duplicates
+
+
+def copyAndInsert(db, tracks, libraryPath, workers=4, batchSize=500,
+                  copied=None, inserted=None, stop=None):
+    '''Copies tracks into the library and inserts them into db in batches of
+    batchSize, each in its own transaction, until stop is set. Returns the
+    tracks that couldn't be copied.'''
+
+    failures = []
+    batch = []
+    checksums = []
+
+    def insert():
+        insertSuccess = insertTracks(db, batch, checksums)
+        assert insertSuccess
+        if inserted is not None:
+            inserted(list(batch))
+        batch.clear()
+        checksums.clear()
+
+    for track, checksum, error in copyTracks(tracks, libraryPath, workers,
+                                             stop=stop):
+        if isinstance(error, CancelledError):
+            continue
+        if copied is not None:
+            copied(track, error)
+        if error is not None:
+            failures.append(track)
+            continue
+        batch.append(track)
+        checksums.append(checksum)
+        if len(batch) >= batchSize:
+            insert()
+    if batch:
+        insert()
+    return failures
+
+
+def importBatches(db, batches, libraryPath, workers=4, batchSize=500,
+                  skipDuplicates=True, duplicates=None, copied=None,
+                  inserted=None, stop=None):
+    '''Runs each list of tracks in batches through splitDuplicates and
+    copyAndInsert as it arrives, so the first are in the library while the
+    rest are still being read. Returns the tracks that couldn't be copied.'''
+
+    failures = []
+    for tracks in batches:
+        if stop is not None and stop.is_set():
+            break
+        unique, found = splitDuplicates(db, tracks)
+        if found and duplicates is not None:
+            duplicates(found)
+        failures.extend(copyAndInsert(
+            db, unique if skipDuplicates else tracks, libraryPath, workers,
+            batchSize, copied, inserted, stop))
+    return failures
+
+
+def updateTracks(db, column, changes):
+    '''Sets column of the tracks in changes, a dict mapping IDs to new
+    values, along with its sort key if it has one. Every track is updated
+    by a single UPDATE, in its own transaction.'''
+
+    if not changes:
+        return True
+    assignments = [f"{column} = json_extract(changed.value, '$[0]')"]
+    if column in keyColumns:
+        assignments.append(
+            f"{keyColumns[column]} = json_extract(changed.value, '$[1]')")
+    query = QSqlQuery(db)
+    query.prepare(f"update tracks set {', '.join(assignments)} "
+                  "from json_each(?) as changed "
+                  "where tracks.id = changed.key")
+    query.addBindValue(json.dumps({id: [value, sortKey(value)]
+                                   for id, value in changes.items()}))
+    if not db.transaction():
+        print(db.lastError().text())
+        return False
+    if not query.exec_():
+        print(query.lastError().text())
+        db.rollback()
+        return False
+    return db.commit()
+
+
+def trackFileNames(db, ids):
+    '''The file names of the tracks with ids, read in one query'''
+
+    query = QSqlQuery(db)
+    query.setForwardOnly(True)
+    query.prepare("select filename from tracks "
+                  "where id in (select value from json_each(?))")
+    query.addBindValue(json.dumps(list(ids)))
+    if not query.exec_():
+        print(query.lastError().text())
+        return []
+    fileNames = []
+    while query.next():
+        fileNames.append(query.value(0))
+    return fileNames
+
+
+def deleteTracks(db, ids):
+    '''Deletes the tracks with ids, and what is kept about their files, in
+    a single transaction'''
+
+    if not ids:
+        return True
+    ids = json.dumps(list(ids))
+    if not db.transaction():
+        print(db.lastError().text())
+        return False
+    for table in ('tracks', 'checksums', 'integrity'):
+        query = QSqlQuery(db)
+        query.prepare(f"delete from {table} "
+                      "where id in (select value from json_each(?))")
+        query.addBindValue(ids)
+        if not query.exec_():
+            print(query.lastError().text())
+            db.rollback()
+            return False
+    return db.commit()
+
+
+def moveToDeleted(libraryPath, fileNames):
+    '''Moves the files (relative to libraryPath) that are still there into
+    its __deleted__ folder. Returns the file names that couldn't be
+    moved.'''
+
+    deleted = libraryPath / '__deleted__'
+    failures = []
+    for fileName in fileNames:
+        original = libraryPath / fileName
+        if not original.exists():
+            continue
+        try:
+            os.makedirs(deleted, exist_ok=True)
+            shutil.move(str(original), str(deleted / original.name))
+        except OSError as ex:
+            print(f"Unable to move {original} to {deleted}: {ex}")
+            failures.append(fileName)
+    return failures
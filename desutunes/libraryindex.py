@@ -0,0 +1,104 @@
+'''Keeps track of which files are present in the library, so that the table
+doesn't need to touch the filesystem to colour missing tracks'''
+
+import os
+import threading
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+
+class LibraryIndex(QObject):
+    '''An in-memory index of the files under libraryPath, rescanned every
+    interval milliseconds on a background thread. Until the first scan
+    finishes, every file is assumed to exist.'''
+
+    changed = pyqtSignal()
+
+    def __init__(self, libraryPath, parent=None):
+        super().__init__(parent)
+        self.libraryPath = libraryPath
+        self.ready = False
+        # folder -> (mtime_ns, set of file names, list of subfolders)
+        self._folders = {}
+        self._scanning = threading.Lock()
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.rescan)
+
+    def start(self, interval=60000):
+        self._timer.start(interval)
+        self.rescan()
+
+    def rescan(self):
+        '''Scans the library on a background thread, unless a scan is
+        already running'''
+
+        if self._scanning.acquire(blocking=False):
+            threading.Thread(target=self._rescan, daemon=True).start()
+
+    def _rescan(self):
+        try:
+            self.scan()
+        finally:
+            self._scanning.release()
+
+    def scan(self):
+        '''Brings the index up to date, emitting changed if anything was
+        added or removed'''
+
+        previous = self._folders
+        folders = {}
+        modified = not self.ready
+        stack = ['']
+        while stack:
+            folder = stack.pop()
+            path = os.path.join(self.libraryPath, folder)
+            try:
+                mtime_ns = os.stat(path).st_mtime_ns
+                if folder in previous and previous[folder][0] == mtime_ns:
+                    listing = previous[folder]
+                else:
+                    listing = self._list(path, folder, mtime_ns)
+                    modified = True
+            except OSError:
+                continue
+            folders[folder] = listing
+            stack.extend(listing[2])
+
+        modified = modified or previous.keys() != folders.keys()
+        self._folders = folders
+        self.ready = True
+        if modified:
+            self.changed.emit()
+
+    @staticmethod
+    def _list(path, folder, mtime_ns):
+        files = set()
+        subfolders = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if folder or entry.name != '__deleted__':
+                        subfolders.append(os.path.join(folder, entry.name))
+                else:
+                    files.add(entry.name)
+        return mtime_ns, files, subfolders
+
+    def contains(self, fileName):
+        '''Whether fileName (relative to the library) is present, answered
+        from memory'''
+
+        if not self.ready:
+            return True
+        folder, name = os.path.split(os.path.normpath(fileName))
+        listing = self._folders.get(folder)
+        return listing is not None and name in listing[1]
+
+    def add(self, fileName):
+        '''Records a file that has just been put in the library, without
+        waiting for the next rescan'''
+
+        folder, name = os.path.split(os.path.normpath(fileName))
+        listing = self._folders.get(folder)
+        if listing is not None:
+            listing[1].add(name)
+        elif self.ready:
+            self._folders[folder] = (None, {name}, [])
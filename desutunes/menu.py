@@ -10,6 +10,18 @@ def setUpMenu(parent):
     menu['danger'].setCheckable(True)
     menu['danger'].triggered.connect(parent.toggleDanger)
 
+    menu['editSelected'] = QtWidgets.QAction("&Edit selected...", parent)
+    menu['editSelected'].setShortcut('Ctrl+E')
+    menu['editSelected'].setStatusTip(
+        'Set a field of all the selected tracks at once')
+    menu['editSelected'].triggered.connect(lambda: parent.editSelected())
+
+    menu['findReplace'] = QtWidgets.QAction("&Find and replace...", parent)
+    menu['findReplace'].setShortcut('Ctrl+H')
+    menu['findReplace'].setStatusTip(
+        'Replace text in a field of all the selected tracks at once')
+    menu['findReplace'].triggered.connect(parent.findReplace)
+
     menu['libraryLocation'] = QtWidgets.QAction("Set &library path...", parent)
     menu['libraryLocation'].setShortcut('Ctrl+L')
     menu['libraryLocation'].setStatusTip(
@@ -22,6 +34,12 @@ def setUpMenu(parent):
         'Export the library as an iTunes XML file to upload to nkd.su')
     menu['dump'].triggered.connect(parent.dumpXML)
 
+    menu['verify'] = QtWidgets.QAction("&Verify library", parent)
+    menu['verify'].setStatusTip(
+        "Check the library's files are all there, intact and the right "
+        "length")
+    menu['verify'].triggered.connect(parent.verifyLibrary)
+
     if parent._mode == 'nekodesu':
         newMode = 'inu desu'
     else:
@@ -1,19 +1,34 @@
-from PyQt5.QtCore import QFileInfo, QDir
-from collections import namedtuple
-from functools import partial
-from .tablemodel import headers
-from mutagen import easyid3, id3, mp3, easymp4, mp4, aac, flac
-from random import choice
+from collections import namedtuple, deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from functools import lru_cache, partial
+from .fields import headers
+from .fingerprint import audioFingerprint
+from mutagen import id3, mp3, mp4, aac, flac
+from random import choice, seed
 from datetime import datetime, timezone
 from pathlib import Path
+import os
 import re
 
 metadata = namedtuple(
     "metadata",
-    [header.replace(' ', '') for header in headers + ['OriginalFileName']])
+    [header.replace(' ', '') for header in headers + ['OriginalFileName']] +
+    ['Fingerprint'])
+# Only files that have been read have a fingerprint of their audio
+metadata.__new__.__defaults__ = ('',)
 _blank = [""]
 _unknown = ["Unknown Artist"]
 _nullroledetail = {'anime': '', 'role': '', 'rolepre': '', 'rolepost': ''}
+_role_pattern = re.compile(
+    r'^(?P<anime>.*?) ?\b'
+    r'(?P<rolepre>(rebroadcast)?) ?'
+    r'\b(?P<role>'
+    r'((ED|OP)(?=(\d|\b))|(character|image) song\b|'
+    r'(insert (track|song)\b)|ins|'
+    r'(main )?theme|bgm|ost))'
+    r' ?'
+    r'(?P<rolepost>.*)$',
+    flags=re.IGNORECASE)
 
 
 def random_id():
@@ -29,6 +44,10 @@ def split_id3_title(id3_title):
     '''Take a 'Title (role)'-style ID3 title and return (title, role)
     from https://git.io/vxJtU'''
 
+    # Most titles can be ruled out without walking them
+    if not id3_title.endswith((')', '(')):
+        return id3_title, None
+
     role = None
 
     bracket_depth = 0
@@ -61,31 +80,17 @@ def role_detail(role):
         return _nullroledetail
 
     try:
-        return re.match(
-            r'^(?P<anime>.*?) ?\b'
-            r'(?P<rolepre>(rebroadcast)?) ?'
-            r'\b(?P<role>'
-            r'((ED|OP)(?=(\d|\b))|(character|image) song\b|'
-            r'(insert (track|song)\b)|ins|'
-            r'(main )?theme|bgm|ost))'
-            r' ?'
-            r'(?P<rolepost>.*)$',
-            role,
-            flags=re.IGNORECASE,
-        ).groupdict()
+        return _role_pattern.match(role).groupdict()
     except Exception as ex:
         return {**_nullroledetail, **{'rolepost': role}}
 
 
-def part(trackTitle):
-    '''Take a trackTitle and return its component parts:
-     - the track title proper
-     - the anime from which it comes
-     - the role in said anime
-     - any qualifier on that role (e.g. if role is ED,
-       then which number/season/episode'''
+@lru_cache(maxsize=4096)
+def _roleParts(full_role):
+    '''Works out (anime, role, role qualifier) from the bracketed part of a
+    title. The same few thousand roles come up again and again across a
+    library, so the results are cached.'''
 
-    title, full_role = split_id3_title(trackTitle)
     role_components = role_detail(full_role)
     if role_components['rolepre'] == '' or role_components['rolepost'] == '':
         rolequal = role_components['rolepre'] + role_components['rolepost']
@@ -96,7 +101,47 @@ def part(trackTitle):
         role = role_components['role'].upper()
     else:
         role = role_components['role'].lower()
-    return title, role_components['anime'], role, rolequal
+    return role_components['anime'], role, rolequal
+
+
+def part(trackTitle):
+    '''Take a trackTitle and return its component parts:
+     - the track title proper
+     - the anime from which it comes
+     - the role in said anime
+     - any qualifier on that role (e.g. if role is ED,
+       then which number/season/episode'''
+
+    title, full_role = split_id3_title(trackTitle)
+    return (title, ) + _roleParts(full_role)
+
+
+def partAll(trackTitles):
+    '''Runs part over a list of trackTitles, returning a list of results.
+    Each distinct title is only parsed once.'''
+
+    parts = {trackTitle: part(trackTitle) for trackTitle in set(trackTitles)}
+    return [parts[trackTitle] for trackTitle in trackTitles]
+
+
+def _unparsed(trackTitle):
+    '''Stands in for part when the titles are to be parsed later, together'''
+
+    return trackTitle, '', '', ''
+
+
+def _withParts(track, parts):
+    '''Fills in the parts of a track read with its title unparsed, renaming
+    its file to match'''
+
+    title, anime, role, rolequal = parts
+    return track._replace(
+        Tracktitle=title,
+        Anime=anime,
+        Role=role,
+        Rolequalifier=rolequal,
+        Filename=track.Filename.with_name(
+            f'{sanitize(title)} ({track.ID}){track.Filename.suffix}'))
 
 
 def sanitize(text):
@@ -107,46 +152,225 @@ def canonicalFileName(id, artist, title, extension):
     return Path(sanitize(artist)) / f'{sanitize(title)} ({id}).{extension}'
 
 
-def getMetadataForFileList(filenames):
+def _isDir(entry):
+    try:
+        if isinstance(entry, os.DirEntry):
+            return entry.is_dir()
+        return os.path.isdir(entry)
+    except OSError:
+        return False
+
+
+def _isAudioFile(entry):
+    '''Checks the suffix first, so that only candidate files get stat'ed'''
+
+    path = entry.path if isinstance(entry, os.DirEntry) else entry
+    if os.path.splitext(path)[1].lower() not in _processors:
+        return False
+    try:
+        if isinstance(entry, os.DirEntry):
+            return entry.is_file()
+        return os.path.isfile(entry)
+    except OSError:
+        return False
+
+
+def _scanDir(path, visited):
+    '''Lists a directory sorted by name, or returns None if it can't be read
+    or has already been visited (e.g. via a symlink loop)'''
+
+    try:
+        info = os.stat(path)
+        if (info.st_dev, info.st_ino) in visited:
+            print(f"Skipping {path}, which has already been visited")
+            return None
+        visited.add((info.st_dev, info.st_ino))
+        with os.scandir(path) as entries:
+            return sorted(entries, key=lambda entry: entry.name.lower())
+    except OSError as ex:
+        print(f"Unable to read {path}: {ex}")
+        return None
+
+
+def walkAudioFiles(filenames):
+    '''Lazily yields the paths of the files in filenames that look like
+    audio we can read, descending into any directories depth-first.'''
+
+    visited = set()
+    stack = [iter(filenames)]
+    while stack:
+        for entry in stack[-1]:
+            if _isDir(entry):
+                listing = _scanDir(entry, visited)
+                if listing is not None:
+                    stack.append(iter(listing))
+                    break
+            elif _isAudioFile(entry):
+                yield entry.path if isinstance(entry, os.DirEntry) else entry
+        else:
+            stack.pop()
+
+
+_seededPid = os.getpid()
+
+
+def _seedWorker():
+    '''Reseed the random number generator the first time it's used in a
+    new process, so that forked pool workers don't all hand out the same
+    sequence of IDs'''
+
+    global _seededPid
+    if _seededPid != os.getpid():
+        _seededPid = os.getpid()
+        seed()
+
+
+def _readFileSafely(filename):
+    '''Reads filename with its titles left unparsed, so that one unreadable
+    file doesn't lose the whole batch. Returns (filename, metadata, error).'''
+
+    _seedWorker()
+    try:
+        if Path(filename).suffix.lower() not in _processors:
+            return filename, [], None
+        return filename, _readFile(filename, _unparsed), None
+    except Exception as ex:
+        return filename, [], f'{type(ex).__name__}: {ex}'
+
+
+def processFiles(filenames, workers=1, cache=None):
+    '''Runs processFile over filenames on workers processes (None for one
+    per CPU), yielding (filename, metadata, error) in order. The titles of
+    the files read are parsed here, with partAll, as each run is ready.'''
+
+    def ready(item):
+        return not isinstance(item, Future) or item.done()
+
+    def read(filename):
+        if executor is not None:
+            return executor.submit(_readFileSafely, filename)
+        future = Future()
+        future.set_result(_readFileSafely(filename))
+        return future
+
+    def finish():
+        '''Takes the results that are ready from the front of pending; those
+        from the cache were parsed before they were stored'''
+
+        items = []
+        while pending and ready(pending[0]):
+            items.append(pending.popleft())
+        results = [item.result() if isinstance(item, Future) else item
+                   for item in items]
+        fresh = [index for index, item in enumerate(items)
+                 if isinstance(item, Future)]
+        parts = iter(partAll([track.Tracktitle for index in fresh
+                              for track in results[index][1]]))
+        for index in fresh:
+            filename, result, error = results[index]
+            result = [_withParts(track, next(parts)) for track in result]
+            if cache is not None and error is None and result:
+                cache.put(filename, result)
+            results[index] = filename, result, error
+        return results
+
+    executor = None
+    if workers is None or workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for filename in filenames:
+            cached = _cachedResult(filename, cache)
+            if cached is not None:
+                pending.append((filename, cached, None))
+            else:
+                pending.append(read(filename))
+            yield from finish()
+        while pending:
+            if isinstance(pending[0], Future):
+                wait([pending[0]])
+            yield from finish()
+    finally:
+        for item in pending:
+            if isinstance(item, Future):
+                item.cancel()
+        if executor is not None:
+            executor.shutdown()
+
+
+def metadataBatches(filenames, workers=1, batchSize=500, failures=None,
+                    cache=None):
+    '''Reads the readable tracks in filenames, yielding their metadata in
+    lists of up to batchSize as they are read. Unreadable files are skipped,
+    with (filename, error) appended to failures if it's given.'''
+
+    batch = []
+    results = processFiles(walkAudioFiles(filenames), workers, cache)
+    try:
+        for filename, result, error in results:
+            if error is not None:
+                print(f"Unable to read {filename}: {error}")
+                if failures is not None:
+                    failures.append((filename, error))
+                continue
+            print(filename)
+            batch.extend(result)
+            if len(batch) >= batchSize:
+                yield batch
+                batch = []
+    finally:
+        results.close()
+        if cache is not None:
+            cache.flush()
+    if batch:
+        yield batch
+
+
+def getMetadataForFileList(filenames, workers=1, failures=None, cache=None):
     '''Takes a list of filenames, returns a list of metadata associated with
-    all files in that list that are readable tracks'''
+    all files in that list that are readable tracks. Unreadable files are
+    skipped, with (filename, error) appended to failures if it's given.'''
 
     metadata = []
-    for filename in filenames:
-        info = QFileInfo(filename)
-        if info.isDir() and info.isExecutable():
-            print(filename)
-            dir = QDir(filename)
-            print(dir.entryList(QDir.AllEntries | QDir.NoDotAndDotDot))
-            metadata.extend(
-                getMetadataForFileList([
-                    i.filePath()
-                    for i in dir.entryInfoList(QDir.AllEntries
-                                               | QDir.NoDotAndDotDot)
-                ]))
-        elif info.isFile() and info.isReadable():
-            print(filename)
-            metadata.extend(processFile(filename))
+    for batch in metadataBatches(filenames, workers, failures=failures,
+                                 cache=cache):
+        metadata.extend(batch)
     return metadata
 
 
-def processid3(filename, audioengine=mp3.MP3):
+def _first(values, default=''):
+    return str(values[0]) if values else default
+
+
+def _readID3(filename, audioengine):
+    '''Parses an ID3-tagged file, returning (tags, stream info). Where the
+    audio engine reads ID3 itself (MP3) the file is only parsed once.'''
+
+    f = audioengine(filename)
+    if isinstance(f.tags, id3.ID3):
+        return f.tags, f.info
+    return id3.ID3(filename), f.info
+
+
+def processid3(filename, audioengine=mp3.MP3, parse=part):
     '''Reads metadata from tracks that use the ID3 format - MP3, AAC'''
 
-    f = easyid3.EasyID3(filename)
-    title, anime, role, rolequal = part(f.get('title', _blank)[0])
-    label = f.get('label', _blank)[0]
-    if not label:
-        f_complex = id3.ID3(filename)
-        case_map = {name.lower(): name for name in f_complex}
-        to_try = ['tit3', 'txxx:subtitle', 'txxx:label', 'txxx:description']
-        for field in to_try:
-            if field in case_map:
-                label = f_complex[case_map[field]].text[0]
-                break
-
-    artist = f.get('artist', _unknown)[0]
-    af = audioengine(filename)
+    tags, info = _readID3(filename, audioengine)
+
+    def text(frameID, default=''):
+        frame = tags.get(frameID)
+        return _first(frame.text, default) if frame is not None else default
+
+    title, anime, role, rolequal = parse(text('TIT2'))
+    label = ''
+    case_map = {name.lower(): name for name in tags}
+    to_try = ['tit3', 'txxx:subtitle', 'txxx:label', 'txxx:description']
+    for field in to_try:
+        if field in case_map:
+            label = _first(tags[case_map[field]].text)
+            break
+
+    artist = text('TPE1', _unknown[0])
     id = random_id()
 
     return [
@@ -155,56 +379,53 @@ def processid3(filename, audioengine=mp3.MP3):
             OriginalFileName=filename,
             Filename=canonicalFileName(id, artist, title, filename[-3:]),
             Tracktitle=title,
-            Album=f.get('album', _blank)[0],
-            Length=int(af.info.length * 1000),
+            Album=text('TALB'),
+            Length=int(info.length * 1000),
             Anime=anime,
             Role=role,
             Rolequalifier=rolequal,
-            Artist=f.get('artist', _blank)[0],
-            Composer=f.get('composer', _blank)[0],
+            Artist=text('TPE1'),
+            Composer=text('TCOM'),
             Label=label,
             InMyriad="NO",
             Dateadded=datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M"))
     ]
 
 
-def processm4a(filename):
+def processm4a(filename, parse=part):
     '''Reads metadata from MPEG-4 audio files'''
 
-    f = easymp4.EasyMP4(filename)
-    title, anime, role, rolequal = part(f.get('title', _blank)[0])
-    artist = f.get('artist', _blank)[0]
+    f = mp4.MP4(filename)
+    tags = f.tags if f.tags is not None else {}
+    title, anime, role, rolequal = parse(_first(tags.get('©nam')))
+    artist = _first(tags.get('©ART'))
     fn_artist = artist if artist else 'Unknown Artist'
-    label = f.get('description', _blank)[0]
-    album = f.get('album', _blank)[0]
     id = random_id()
 
-    f = mp4.MP4(filename)
-    composer = f.get('©wrt', _blank)[0]
     return [
         metadata(
             ID=id,
             OriginalFileName=filename,
             Filename=canonicalFileName(id, fn_artist, title, 'm4a'),
             Tracktitle=title,
-            Album=album,
+            Album=_first(tags.get('©alb')),
             Length=int(f.info.length * 1000),
             Anime=anime,
             Role=role,
             Rolequalifier=rolequal,
             Artist=artist,
-            Composer=composer,
-            Label=label,
+            Composer=_first(tags.get('©wrt')),
+            Label=_first(tags.get('desc')),
             InMyriad="NO",
             Dateadded=datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M"))
     ]
 
 
-def processflac(filename):
+def processflac(filename, parse=part):
     '''Reads metadata from FLAC files'''
 
     f = flac.FLAC(filename)
-    title, anime, role, rolequal = part(f.get('title', _blank)[0])
+    title, anime, role, rolequal = parse(f.get('title', _blank)[0])
     label = f.get('description', _blank)[0]
     if not label:
         label = f.get('subtitle', _blank)[0]
@@ -232,15 +453,56 @@ def processflac(filename):
     ]
 
 
-def processFile(filename):
+_processors = {
+    '.mp3': processid3,
+    '.aac': partial(processid3, audioengine=aac.AAC),
+    '.m4a': processm4a,
+    '.flac': processflac
+}
+
+
+def _reissue(track, filename):
+    '''Gives a track read from the cache a fresh ID and date added'''
+
+    id = random_id()
+    tail = f'({track.ID}){track.Filename.suffix}'
+    name = track.Filename.name
+    if name.endswith(tail):
+        name = f'{name[:-len(tail)]}({id}){track.Filename.suffix}'
+    return track._replace(
+        ID=id,
+        OriginalFileName=filename,
+        Filename=track.Filename.with_name(name),
+        Dateadded=datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M"))
+
+
+def _cachedResult(filename, cache):
+    if cache is None:
+        return None
+    cached = cache.get(filename)
+    # Entries cached before fingerprints were taken need reading again
+    if cached is None or not all(track.Fingerprint for track in cached):
+        return None
+    return [_reissue(track, filename) for track in cached]
+
+
+def _readFile(filename, parse=part):
+    '''Reads the tags and the fingerprint of a file of a type we can read'''
+
+    result = _processors[Path(filename).suffix.lower()](filename, parse=parse)
+    fingerprint = audioFingerprint(filename)
+    return [track._replace(Fingerprint=fingerprint) for track in result]
+
+
+def processFile(filename, cache=None):
     suffix = Path(filename).suffix.lower()
-    processors = {
-        '.mp3': processid3,
-        '.aac': partial(processid3, audioengine=aac.AAC),
-        '.m4a': processm4a,
-        '.flac': processflac
-    }
-    if suffix not in processors:
+    if suffix not in _processors:
         return []
-    else:
-        return processors[suffix](filename)
+
+    cached = _cachedResult(filename, cache)
+    if cached is not None:
+        return cached
+    result = _readFile(filename)
+    if cache is not None:
+        cache.put(filename, result)
+    return result
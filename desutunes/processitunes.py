@@ -1,9 +1,15 @@
+import base64
+import os
 import plistlib
 import pathlib
-from PyQt5.QtCore import QFileInfo
-from .processfile import metadata, part, canonicalFileName, processFile
+import stat
+import tempfile
+from PyQt5.QtCore import QByteArray
+from PyQt5.QtSql import QSqlQuery
+from .processfile import metadata, partAll, canonicalFileName, processFiles
 from urllib.parse import urlparse, unquote
 from datetime import datetime, timezone
+from xml.etree import ElementTree
 
 _itunes_headers = {
     -1: 'Track ID',
@@ -20,101 +26,394 @@ _itunes_headers = {
 }
 
 
-def handleXML(fileName):
-    try:
-        with open(fileName, 'rb') as f:
-            plist = plistlib.load(f)
-    except Exception as e:
-        return []
+def _plistValue(element):
+    '''Converts a parsed plist XML element to the Python value it holds'''
+
+    tag = element.tag
+    text = element.text or ''
+    if tag == 'dict':
+        children = list(element)
+        return {
+            key.text or '': _plistValue(value)
+            for key, value in zip(children[::2], children[1::2])
+        }
+    elif tag == 'array':
+        return [_plistValue(child) for child in element]
+    elif tag == 'integer':
+        return int(text)
+    elif tag == 'real':
+        return float(text)
+    elif tag in ('true', 'false'):
+        return tag == 'true'
+    elif tag == 'date':
+        return datetime.strptime(text, "%Y-%m-%dT%H:%M:%SZ")
+    elif tag == 'data':
+        return base64.b64decode(text)
+    return text
+
 
-    tracks = []
+def iterITunesTracks(fileName):
+    '''Yields (track ID, track) for each entry in the Tracks dict of an
+    iTunes library XML file, parsing it as a stream so memory use doesn't
+    grow with the size of the library.'''
 
-    for idx, (tid, track) in enumerate(plist['Tracks'].items()):
-        if not track['Location'].startswith('file'):
+    # Elements that are open; the top-level dict's entries are at depth 3
+    stack = []
+    topKey = None
+    trackKey = None
+    for event, element in ElementTree.iterparse(fileName,
+                                                events=('start', 'end')):
+        if event == 'start':
+            stack.append(element)
             continue
-        inMyriad = track.get('Episode', 'Yes')
-
-        # The library has some typos, but the first 10 characters are reliable
-        if inMyriad.lower().startswith('not in myr'):
-            inMyriad = "NO"
-
-        title, anime, role, rolequal = part(track['Name'])
-        id = track['Persistent ID']
-        artist = track['Artist']
-        originalFileName = unquote(urlparse(track['Location']).path)
-        suffix = pathlib.Path(originalFileName).suffix[1:]
-        newFileName = canonicalFileName(id, artist, title, suffix)
-
-        # Latest versions of iTunes don't export Description in XML dumps
-        # We have to examine the file directly
-        # Composer should be in the XML, but check the file just in case
-        # since we've probably grabbed its metadata anyway
-        label = track.get('Description', '')
-        composer = track.get('Composer', '')
-        if not label or not composer:
-            try:
-                file_metadata = processFile(originalFileName,
-                                            QFileInfo(originalFileName))[0]
-                if not label:
-                    label = file_metadata.Label
-                if not composer:
-                    composer = file_metadata.Composer
-            except Exception as ex:
-                print("Unable to get extra metadata for", originalFileName)
-
-        track_metadata = metadata(
-            ID=id,
-            OriginalFileName=originalFileName,
-            Filename=newFileName,
-            Tracktitle=title,
-            Album=track.get('Album', ''),
-            Length=track['Total Time'],
-            Anime=anime,
-            Role=role,
-            Rolequalifier=rolequal,
-            Artist=artist,
-            Composer=composer,
-            Label=label,
-            InMyriad=inMyriad,
-            Dateadded=datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M"))
-        tracks.append(track_metadata)
-    print(f'Got metadata for {len(tracks)} tracks, out of '
-          f'{len(plist["Tracks"])} in the iTunes XML.')
-    return tracks
-
-
-def exportXML(model, libraryPath, fileName):
-    tracks = {}
-    episode_map = {'NO': 'NOT IN MYRIAD', 'Yes': ''}
-    for i in range(model.rowCount()):
-        r = model.record(i)
-        tracks[str(i)] = {
-            'Track ID':
-            str(i + 1),
-            'Persistent ID':
-            r.value('ID'),
-            'Location': (libraryPath / r.value('Filename')).as_uri(),
-            'Name':
-            '{} ({} {}{}{})'.format(
-                r.value('Tracktitle'), r.value('Anime'), r.value('Role'), ''
-                if r.value('Rolequant') == '' else ' ', r.value('Rolequant')),
-            'Artist':
-            r.value('Artist'),
-            'Album':
-            r.value('Album'),
-            'Total Time':
-            r.value('Length') / 1000,
-            'Description':
-            r.value('Label'),
-            'Composer':
-            r.value('Composer'),
-            'Episode':
-            episode_map.get(r.value('InMyriad'), r.value('InMyriad')),
-            'Date Added':
-            datetime.strptime(r.value('DateAdded'), "%Y-%m-%d %H:%M")
-        }
+
+        stack.pop()
+        depth = len(stack) + 1
+        inTracks = topKey == 'Tracks'
+        if depth == 3 and element.tag == 'key':
+            topKey = element.text
+        elif depth == 4 and inTracks and element.tag == 'key':
+            trackKey = element.text
+        elif depth == 4 and inTracks and element.tag == 'dict':
+            yield trackKey, _plistValue(element)
+
+        # Inside a track, keep the element until the whole track is read
+        if depth >= 3 and not (depth > 4 and inTracks):
+            stack[-1].remove(element)
+
+
+def _isLocal(track):
+    return track['Location'].startswith('file')
+
+
+def _trackMetadata(track, parts):
+    '''Makes the metadata for one local track from an iTunes library, given
+    the parts of its title'''
+
+    inMyriad = track.get('Episode', 'Yes')
+
+    # The library has some typos, but the first 10 characters are reliable
+    if inMyriad.lower().startswith('not in myr'):
+        inMyriad = "NO"
+
+    title, anime, role, rolequal = parts
+    id = track['Persistent ID']
+    artist = track['Artist']
+    originalFileName = unquote(urlparse(track['Location']).path)
+    suffix = pathlib.Path(originalFileName).suffix[1:]
+    newFileName = canonicalFileName(id, artist, title, suffix)
+
+    return metadata(
+        ID=id,
+        OriginalFileName=originalFileName,
+        Filename=newFileName,
+        Tracktitle=title,
+        Album=track.get('Album', ''),
+        Length=track['Total Time'],
+        Anime=anime,
+        Role=role,
+        Rolequalifier=rolequal,
+        Artist=artist,
+        Composer=track.get('Composer', ''),
+        Label=track.get('Description', ''),
+        InMyriad=inMyriad,
+        Dateadded=datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M"))
+
+
+def _probeFiles(tracks, workers=1, cache=None):
+    '''Fingerprints the audio of tracks from their files, reading them on a
+    pool of workers, and fills in any missing Label or Composer from their
+    tags. Returns how many of the files could be read.'''
+
+    # Latest versions of iTunes don't export Description in XML dumps
+    # We have to examine the file directly
+    # Composer should be in the XML, but check the file just in case
+    # since we've read its tags anyway
+    succeeded = 0
+    results = processFiles(
+        [track.OriginalFileName for track in tracks], workers, cache)
+    for index, (filename, result, error) in enumerate(results):
+        if error is not None or not result:
+            print("Unable to read", filename)
+            continue
+        track = tracks[index]
+        tracks[index] = track._replace(
+            Label=track.Label or result[0].Label,
+            Composer=track.Composer or result[0].Composer,
+            Fingerprint=result[0].Fingerprint)
+        succeeded += 1
+    return succeeded
+
+
+def handleXML(fileName, cache=None, workers=1, batchSize=2000,
+              progress=None):
+    '''Yields the tracks from an iTunes library XML file in lists of up to
+    batchSize, reading their files on a pool of workers for fingerprints and
+    calling progress, if given, after each batch.'''
+
+    batch = []
+    read = 0
+    total = 0
+    succeeded = 0
+
+    def finishBatch():
+        nonlocal read, succeeded
+        parts = partAll([track['Name'] for track in batch])
+        tracks = list(map(_trackMetadata, batch, parts))
+        batch.clear()
+        succeeded += _probeFiles(tracks, workers, cache)
+        read += len(tracks)
+        if progress is not None:
+            progress(read)
+        return tracks
+
+    try:
+        for tid, track in iterITunesTracks(fileName):
+            total += 1
+            if _isLocal(track):
+                batch.append(track)
+            if len(batch) >= batchSize:
+                yield finishBatch()
+        if batch:
+            yield finishBatch()
+    except (OSError, ElementTree.ParseError) as ex:
+        print(f"Unable to read {fileName}: {ex}")
+        return
+    finally:
+        if cache is not None:
+            cache.flush()
+
+    print(f'Got metadata for {read} tracks, out of '
+          f'{total} in the iTunes XML.')
+    if read:
+        print(f'Read {succeeded} of their {read} files.')
+
+
+# How many freshly rendered fragments are held before they're staged
+_stageChunk = 500
+
+_plistHeader = plistlib.dumps({})[:-len(b'<dict/>\n</plist>\n')]
+_plistFooter = b'</dict>\n</plist>\n'
+_trackColumns = ("t.rowid, t.id, t.filename, t.tracktitle, t.artist, "
+                 "t.album, t.length, t.anime, t.role, t.rolequant, t.label, "
+                 "t.composer, t.inmyriad, t.dateadded")
+_episode_map = {'NO': 'NOT IN MYRIAD', 'Yes': ''}
+
+
+def _plistEntries(entries):
+    '''Renders a dict as the keys and values that go inside a plist dict'''
+
+    rendered = plistlib.dumps(entries, sort_keys=False)
+    return rendered[len(_plistHeader) + len(b'<dict>\n'):-len(_plistFooter)]
+
+
+def _trackFragment(libraryPath, query):
+    '''Renders the row query is on as the key and dict for one entry in the
+    Tracks dict of an iTunes XML file'''
+
+    (rowid, id, filename, title, artist, album, length, anime, role,
+     rolequant, label, composer, inmyriad, dateadded) = (
+         '' if query.isNull(i) else query.value(i) for i in range(14))
+    track = {
+        'Track ID':
+        str(rowid),
+        'Persistent ID':
+        id,
+        'Location': (libraryPath / filename).as_uri(),
+        'Name':
+        '{} ({} {}{}{})'.format(title, anime, role, ''
+                                if rolequant == '' else ' ', rolequant),
+        'Artist':
+        artist,
+        'Album':
+        album,
+        'Total Time':
+        length / 1000,
+        'Description':
+        label,
+        'Composer':
+        composer,
+        'Episode':
+        _episode_map.get(inmyriad, inmyriad),
+        'Date Added':
+        datetime.strptime(dateadded, "%Y-%m-%d %H:%M")
+    }
+    return _plistEntries({str(rowid): dict(sorted(track.items()))})
+
+
+def _scalar(db, statement, default=0):
+    query = QSqlQuery(statement, db)
+    if query.next() and not query.isNull(0):
+        return query.value(0)
+    return default
+
+
+def lastExportRevision(db):
+    '''The changelog revision the library was at when it was last dumped'''
+
+    return _scalar(db, "select seq from xml_exports where name = 'dump'")
+
+
+def _writeTracks(f, db, readDb, libraryPath, since):
+    '''Writes the Tracks dict, re-rendering only the tracks that have
+    changed since their cached fragment was rendered. Fresh fragments are
+    staged in db a chunk at a time, to be kept once the export is done.'''
+
+    query = QSqlQuery(readDb)
+    query.setForwardOnly(True)
+    query.prepare(
+        f"select {_trackColumns}, coalesce(c.seq, 0), "
+        "f.trackrowid, f.seq, f.root, f.fragment from tracks t "
+        "left join (select id, max(seq) as seq from changelog group by id) c "
+        "on c.id = t.id "
+        "left join xml_fragments f on f.id = t.id "
+        "where coalesce(c.seq, 0) > ? order by t.rowid")
+    query.addBindValue(-1 if since is None else since)
+    if not query.exec_():
+        raise RuntimeError(query.lastError().text())
+
+    root = str(libraryPath)
+    # Staging from the reading connection joins its transaction
+    ownTransaction = db.connectionName() != readDb.connectionName()
+    rendered = []
+    f.write(b'\t<key>Tracks</key>\n\t<dict>\n')
+    while query.next():
+        rowid, id, seq = query.value(0), query.value(1), query.value(14)
+        if (not query.isNull(18) and query.value(15) == rowid
+                and query.value(16) >= seq and query.value(17) == root):
+            fragment = bytes(query.value(18))
+        else:
+            fragment = _trackFragment(libraryPath, query)
+            rendered.append((id, rowid, seq, QByteArray(fragment)))
+            if len(rendered) >= _stageChunk:
+                _stageFragments(db, root, rendered, ownTransaction)
+                rendered = []
+        f.write(fragment)
+    _stageFragments(db, root, rendered, ownTransaction)
+    f.write(b'\t</dict>\n')
+
+
+def _stageFragments(db, root, rendered, ownTransaction):
+    if not rendered:
+        return
+    if ownTransaction and not db.transaction():
+        raise RuntimeError(db.lastError().text())
+    query = QSqlQuery(db)
+    query.prepare("insert or replace into xml_fragments_staged"
+                  "(id, trackrowid, seq, fragment, root) "
+                  "values (?, ?, ?, ?, ?)")
+    for values in zip(*rendered):
+        query.addBindValue(list(values))
+    query.addBindValue([root] * len(rendered))
+    if not query.execBatch():
+        if ownTransaction:
+            db.rollback()
+        raise RuntimeError(query.lastError().text())
+    if ownTransaction and not db.commit():
+        raise RuntimeError(db.lastError().text())
+
+
+def _deletedSince(db, since):
+    query = QSqlQuery(db)
+    query.prepare("select distinct id from changelog "
+                  "where deleted = 1 and seq > ? "
+                  "and id not in (select id from tracks)")
+    query.addBindValue(since)
+    if not query.exec_():
+        raise RuntimeError(query.lastError().text())
+    deleted = []
+    while query.next():
+        deleted.append(query.value(0))
+    return deleted
+
+
+def _recordExport(db, revision):
+    '''Keeps the staged fragments, remembers the revision that was
+    exported, and prunes changelog entries that are no longer needed'''
+
+    if not db.transaction():
+        raise RuntimeError(db.lastError().text())
+    statements = [
+        ("insert or replace into xml_fragments"
+         "(id, trackrowid, seq, fragment, root) "
+         "select id, trackrowid, seq, fragment, root "
+         "from xml_fragments_staged", []),
+        ("delete from xml_fragments_staged", []),
+        ("insert or replace into xml_exports(name, seq) values ('dump', ?)",
+         [revision]),
+        ("delete from xml_fragments where id not in (select id from tracks)",
+         []),
+        ("delete from changelog where seq <= ? and ("
+         "seq not in (select max(seq) from changelog group by id) or "
+         "(deleted = 1 and id not in (select id from tracks)))",
+         [revision]),
+    ]
+    for statement, values in statements:
+        query = QSqlQuery(db)
+        query.prepare(statement)
+        for value in values:
+            query.addBindValue(value)
+        if not query.exec_():
+            db.rollback()
+            raise RuntimeError(query.lastError().text())
+    if not db.commit():
+        raise RuntimeError(db.lastError().text())
+
+
+def _fileMode(fileName):
+    '''The permissions open() would leave fileName with: the ones it has if
+    it exists, otherwise the default for new files under the umask'''
+
     try:
-        with open(fileName, 'wb') as f:
-            plistlib.dump({'Tracks': tracks}, f)
-    except Exception:
-        pass
+        return stat.S_IMODE(os.stat(fileName).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0o022)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def exportDatabaseXML(db, libraryPath, fileName, since=None, readDb=None,
+                      errors=None):
+    '''Writes the tracks in db out as an iTunes XML file, or with since (a
+    changelog revision) just those changed after it and the IDs of those
+    deleted. If it fails and an errors list is given, the reason is added.'''
+
+    if readDb is None:
+        readDb = db
+    # Anything left over from an export that didn't finish
+    QSqlQuery("delete from xml_fragments_staged", db)
+    directory = os.path.dirname(os.path.abspath(fileName))
+    try:
+        with tempfile.NamedTemporaryFile(
+                'wb', dir=directory, suffix='.tmp', delete=False) as f:
+            try:
+                if not readDb.transaction():
+                    raise RuntimeError(readDb.lastError().text())
+                revision = _scalar(readDb, "select max(seq) from changelog")
+                f.write(_plistHeader)
+                f.write(b'<dict>\n')
+                _writeTracks(f, db, readDb, libraryPath, since)
+                if since is not None:
+                    f.write(_plistEntries({
+                        'Deleted Tracks': _deletedSince(readDb, since),
+                        'Since Revision': since,
+                        'Revision': revision
+                    }))
+                f.write(_plistFooter)
+                f.flush()
+                os.fsync(f.fileno())
+            except Exception:
+                os.remove(f.name)
+                raise
+            finally:
+                readDb.commit()
+        # Temporary files are only readable by their owner
+        os.chmod(f.name, _fileMode(fileName))
+        os.replace(f.name, fileName)
+        _recordExport(db, revision)
+    except Exception as ex:
+        print(f"Unable to export {fileName}: {ex}")
+        if errors is not None:
+            errors.append(str(ex))
+        return False
+    return True
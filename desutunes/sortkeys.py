@@ -0,0 +1,54 @@
+'''Sort keys for the text columns of the tracks table. Each key is stored in
+its own indexed column next to the text it was made from, so that the
+table can be sorted straight from an index rather than by SQLite sorting
+every row with its byte-wise collation.'''
+
+from functools import lru_cache
+import re
+import unicodedata
+
+# The columns that get a sort key, and the name of the column it's kept in
+keyColumns = {
+    column: f'{column}_key'
+    for column in ("tracktitle", "artist", "album", "anime", "role",
+                   "rolequant", "label", "composer")
+}
+
+# What the table is ordered by when sorted on each column; ties are broken
+# by the columns after it, then by rowid. Columns that aren't listed are
+# ordered by themselves.
+sortChains = {
+    "tracktitle": ["tracktitle_key", "artist_key"],
+    "artist": ["artist_key", "tracktitle_key"],
+    "album": ["album_key", "tracktitle_key"],
+    "anime": ["anime_key", "role_key", "rolequant_key", "tracktitle_key"],
+    "role": ["role_key", "anime_key", "rolequant_key"],
+    "rolequant": ["rolequant_key", "anime_key", "role_key"],
+    "label": ["label_key", "artist_key", "tracktitle_key"],
+    "composer": ["composer_key", "tracktitle_key"],
+}
+
+_digits = re.compile(r'\d+')
+
+
+def _padDigits(match):
+    return match.group().zfill(10)
+
+
+@lru_cache(maxsize=65536)
+def sortKey(text):
+    '''A key that sorts text case-insensitively, ignoring accents, and with
+    runs of digits in numerical order, so that "OP 2" comes before
+    "op 10"'''
+
+    if text is None:
+        return ''
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return _digits.sub(_padDigits, text.casefold())
+
+
+def sortChain(column):
+    '''The columns the table is ordered by when sorted on column'''
+
+    return sortChains.get(column, [column])
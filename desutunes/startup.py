@@ -0,0 +1,38 @@
+'''Timing of the phases of starting desutunes, for --profile-startup'''
+
+import time
+
+# When desutunes started, as near as can be told: this module is the first
+# thing desutunes.desutunes imports
+started = time.perf_counter()
+
+
+class StartupProfile:
+    '''Records how long each phase of starting up takes, measured from the
+    end of the phase before. Does nothing unless enabled, so the marks can
+    stay in the startup path.'''
+
+    def __init__(self, enabled=True, start=None):
+        self.enabled = enabled
+        self._start = time.perf_counter() if start is None else start
+        self._last = self._start
+        self.phases = []
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def total(self):
+        return self._last - self._start
+
+    def report(self):
+        if not self.enabled:
+            return
+        width = max((len(phase) for phase, _ in self.phases), default=0)
+        print("Startup:")
+        for phase, elapsed in self.phases:
+            print(f"  {phase:<{width}}  {elapsed * 1000:8.1f}ms")
+        print(f"  {'total':<{width}}  {self.total() * 1000:8.1f}ms")
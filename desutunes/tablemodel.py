@@ -40,89 +40,120 @@
 #
 ############################################################################
 
-from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QApplication, QMessageBox, QTableView
+from PyQt5.QtCore import (Qt, QAbstractTableModel, QItemSelection,
+                          QItemSelectionModel, QModelIndex)
+from PyQt5.QtWidgets import (QAbstractItemView, QApplication, QMessageBox,
+                             QTableView)
 from PyQt5.QtGui import QBrush, QColor
-from PyQt5.QtSql import QSqlTableModel, QSqlDatabase, QSqlRecord
+from PyQt5.QtSql import QSqlTableModel, QSqlDatabase, QSqlRecord, QSqlQuery
 
-import shutil
 from . import connection
+from .fields import headers, col, columns
+from .library import (insertTracks, copyAndInsert, deleteTracks,
+                      moveToDeleted, trackFileNames, updateTracks)
+from .libraryindex import LibraryIndex
+from .sortkeys import keyColumns, sortChain, sortKey
+from collections import OrderedDict
 import datetime
+import json
+import re
+import time
 
-headers = [
-    "ID", "File name", "Track title", "Artist", "Album", "Length", "Anime",
-    "Role", "Role qualifier", "Label", "Composer", "In Myriad", "Date added"
-]
-col = headers.index
+# Row statuses, and the colours they are painted
+MISSING = 'missing'
+NEEDS_ATTENTION = 'needs attention'
+OK = 'ok'
+_statusBrushes = {
+    MISSING: QBrush(QColor(255, 128, 128)),
+    NEEDS_ATTENTION: QBrush(QColor(255, 255, 128))
+}
+_statusColumns = [col(name)
+                  for name in ("File name", "In Myriad", "Label", "Composer")]
 
 
-class desuplayerModel(QSqlTableModel):
-    def __init__(self, libraryPath, parent=None, db=QSqlDatabase()):
-        super(desuplayerModel, self).__init__(parent, db)
+def searchFilter(text):
+    '''Turns what's been typed into the search box into a filter on the
+    full-text index, matching rows that contain words starting with each
+    word typed. Returns '' if there's nothing to search for.'''
 
-        self.setTable('tracks')
+    words = re.findall(r'\w+', text)
+    if not words:
+        return ''
+    match = ' '.join(f'"{word}"*' for word in words)
+    return ("tracks.rowid in (select rowid from tracks_fts "
+            f"where tracks_fts match '{match}')")
 
-        self.setEditStrategy(QSqlTableModel.OnFieldChange)
-        self.select()
-        self._lock_edits = True
 
-        for index, name in enumerate(headers):
-            self.setHeaderData(index, Qt.Horizontal, name)
-        self.libraryPath = libraryPath
+class libraryMixin:
+    '''What the desutunes table models have in common. Expects the model
+    to provide database() and select(), and to set libraryPath and
+    libraryIndex'''
 
-        self.sortColumn = -1
-        self.sortOrder = None
+    _lock_edits = True
+    _sortKeys = []
+    _descending = False
 
-    def data(self, item, role=Qt.DisplayRole):
-        if role == Qt.BackgroundRole:
-            fileName = super().data(
-                self.index(item.row(), col("File name")), Qt.DisplayRole)
-            if not fileName:
-                return super().data(item, role)
-            file = self.libraryPath / fileName
-            if not file.is_file():
-                return QBrush(QColor(255, 128, 128))
-            elif (super().data(
-                    self.index(item.row(), col("In Myriad")),
-                    Qt.DisplayRole) in ["NO", "AWAITING EDITS"]
-                  or super().data(
-                      self.index(item.row(), col("Label")),
-                      Qt.DisplayRole) == '' or super().data(
-                          self.index(item.row(), col("Composer")),
-                          Qt.DisplayRole) == ''):
-                return QBrush(QColor(255, 255, 128))
-        return super().data(item, role)
+    def statusFor(self, fileName, inMyriad, label, composer):
+        '''Whether the track with these fields has gone missing from the
+        library, needs attention, or is ok'''
+
+        if not fileName:
+            return OK
+        elif not self.libraryIndex.contains(fileName):
+            return MISSING
+        elif (inMyriad in ["NO", "AWAITING EDITS"] or label == ''
+              or composer == ''):
+            return NEEDS_ATTENTION
+        return OK
 
     def flags(self, index):
+        # Columns past the headers hold the sort keys and fingerprint, and are
+        # hidden
+        if index.column() >= len(headers):
+            return Qt.ItemIsEnabled | Qt.ItemIsSelectable
         if (headers[index.column()] in ("ID", "File name", "Length",
                                         "Date added") and self._lock_edits):
             return Qt.ItemIsEnabled | Qt.ItemIsSelectable
         else:
             return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
 
-    def addRecords(self, tracks):
-        failures = []
-        for idx, track in enumerate(tracks):
-            print(
-                f"Copying {track.OriginalFileName} ({idx} / {len(tracks)})...")
-            try:
-                if not (self.libraryPath / track.Filename.parent).is_dir():
-                    (self.libraryPath / track.Filename.parent).mkdir()
-                shutil.copyfile(track.OriginalFileName,
-                                self.libraryPath / track.Filename)
-            except Exception as ex:
-                print(ex)
-                failures.append(track)
-                continue
-            self._lock_edits = False
-            record = self.record()
-            for fieldName, fieldValue in track._asdict().items():
-                if not fieldName == 'OriginalFileName':
-                    record.setValue(fieldName, str(fieldValue))
-            insertSuccess = self.insertRecord(-1, record)
-            assert insertSuccess
-            self._lock_edits = True
-        self.submitAll()
+    def addRecords(self, tracks, workers=4, batchSize=500):
+        '''Copies tracks into the library on a pool of threads, inserting
+        them into the database in batches as their copies are verified'''
+
+        copied = 0
+
+        def report(track, error):
+            nonlocal copied
+            copied += 1
+            if error is not None:
+                print(error)
+                return
+            print(f"Copied {track.OriginalFileName} "
+                  f"({copied} / {len(tracks)})")
+            self.libraryIndex.add(track.Filename)
+
+        failures = copyAndInsert(self.database(), tracks, self.libraryPath,
+                                 workers, batchSize, copied=report)
+        self.select()
+        self.reportFailures(failures)
+        return True
+
+    def tracksInserted(self, tracks, view=None):
+        '''Catches up with tracks that have been inserted into the database
+        on another connection, keeping view where it was if it's given'''
+
+        for track in tracks:
+            self.libraryIndex.add(track.Filename)
+        if view is None:
+            self.select()
+        else:
+            self.keepingView(view, self.select)
+
+    def reportFailures(self, failures):
+        '''Writes the tracks that couldn't be imported to failures.log,
+        and tells the user about them'''
+
         if len(failures) > 0:
             try:
                 with open(self.libraryPath / 'failures.log', 'a') as f:
@@ -143,33 +174,532 @@ class desuplayerModel(QSqlTableModel):
                 f'{len(failures)} track{"" if len(failures) == 1 else "s"} '
                 f'could not be imported successfully.\n\n{message}')
 
-        return True
+    def reportDuplicates(self, duplicates, skipped=True):
+        '''Tells the user about imported tracks whose audio was already in
+        the library, given as (track, ID of the track it duplicates)'''
+
+        if not duplicates:
+            return
+        shown = 10
+        lines = [f" - {track.Artist}, {track.Tracktitle} (same as {id})"
+                 for track, id in duplicates[:shown]]
+        if len(duplicates) > shown:
+            lines.append(f" ... and {len(duplicates) - shown} more")
+        for line in lines:
+            print(line)
+        plural = len(duplicates) != 1
+        if skipped:
+            message = (f'{len(duplicates)} track{"s" if plural else ""} '
+                       f'{"were" if plural else "was"} not imported, as '
+                       f'{"their" if plural else "its"} audio is already '
+                       'in the library:')
+        else:
+            message = (f'{len(duplicates)} imported track'
+                       f'{"s have" if plural else " has"} audio that was '
+                       'already in the library:')
+        QMessageBox.information(self.parent(), "Duplicate tracks",
+                                message + '\n\n' + '\n'.join(lines))
+
+    def bulkInsert(self, tracks, checksums=None):
+        '''Inserts tracks straight into the database in one transaction,
+        then refreshes the model once'''
+
+        start = time.perf_counter()
+        result = insertTracks(self.database(), tracks, checksums)
+        result = result and self.select()
+        elapsed = time.perf_counter() - start
+        if result and tracks:
+            print(f"Inserted {len(tracks)} tracks in {elapsed:.2f}s "
+                  f"({len(tracks) / elapsed:.0f} rows/s)")
+        return result
+
+    def removeRecords(self, ids):
+        '''Deletes the tracks with ids in one transaction, moves their files
+        to __deleted__ in the library, then refreshes the model once'''
+
+        fileNames = trackFileNames(self.database(), ids)
+        if not deleteTracks(self.database(), ids):
+            return False
+        moveToDeleted(self.libraryPath, fileNames)
+        return self.select()
+
+    def editRows(self, rows, column, edit):
+        '''Applies edit, which maps a cell's value to its new one, to column
+        in each of rows with one UPDATE. Returns the number of rows
+        changed, or None if the column can't be edited or the update failed.'''
+
+        rows = sorted(set(rows))
+        if not rows or not (self.flags(self.index(rows[0], column))
+                            & Qt.ItemIsEditable):
+            return None
+        changes = {}
+        changed = []
+        for row in rows:
+            value = self.data(self.index(row, column))
+            newValue = edit(value)
+            if newValue != value:
+                changes[self.data(self.index(row, col("ID")))] = newValue
+                changed.append((row, newValue))
+        if not changes:
+            return 0
+        if not updateTracks(self.database(), columns[column], changes):
+            return None
+        self.rowsEdited(column, changed)
+        return len(changed)
+
+    def setColumn(self, rows, column, value):
+        '''Sets column to value in each of rows'''
+
+        return self.editRows(rows, column, lambda _: value)
+
+    def replaceInColumn(self, rows, column, find, replacement):
+        '''Replaces find with replacement in column in each of rows'''
+
+        return self.editRows(
+            rows, column,
+            lambda value: str(value).replace(find, replacement)
+            if find and value is not None else value)
 
     def createView(self, title):
         view = QTableView()
         view.setModel(self)
         view.setWindowTitle(title)
+        for column in range(len(headers), self.columnCount()):
+            view.setColumnHidden(column, True)
         return view
 
-    def removeRecord(self, index):
-        result = self.removeRow(index)
-        result = result and self.submitAll()
-        result = result and self.select()
-        return result
+    def setSort(self, column, order):
+        '''Orders the rows by the sort keys for column, falling back on
+        rowid to break ties'''
+
+        self._sortKeys = sortChain(columns[column]) if column >= 0 else []
+        self._descending = order == Qt.DescendingOrder
+
+    def orderTerms(self):
+        direction = 'desc' if self._descending else 'asc'
+        return ', '.join(f'{key} {direction}'
+                         for key in self._sortKeys + ['rowid'])
+
+    def rowsForIds(self, ids):
+        '''Where the tracks with ids are in the table as it's currently
+        filtered and sorted, as a dict of id to row'''
+
+        ids = list(ids)
+        if not ids:
+            return {}
+        condition = f' where {self.filter()}' if self.filter() else ''
+        query = QSqlQuery(self.database())
+        query.prepare(
+            "select id, position from (select id, row_number() over "
+            f"(order by {self.orderTerms()}) - 1 as position "
+            f"from tracks{condition}) "
+            "where id in (select value from json_each(?))")
+        query.addBindValue(json.dumps(ids))
+        if not query.exec_():
+            print(query.lastError().text())
+            return {}
+        rows = {}
+        while query.next():
+            rows[query.value(0)] = query.value(1)
+        while (rows and self.rowCount() <= max(rows.values())
+               and self.canFetchMore(QModelIndex())):
+            self.fetchMore(QModelIndex())
+        return rows
+
+    def keepingView(self, view, refresh):
+        '''Calls refresh, which resets the model, keeping the cells selected
+        in view, its current cell and the row at the top of it in place'''
+
+        def idAt(row):
+            return self.data(self.index(row, col("ID")))
+
+        selectionModel = view.selectionModel()
+        selected = [(idAt(row), selection.left(), selection.right())
+                    for selection in selectionModel.selection()
+                    for row in range(selection.top(), selection.bottom() + 1)]
+        current = selectionModel.currentIndex()
+        current = (idAt(current.row()), current.column()) \
+            if current.isValid() else None
+        top = view.rowAt(0)
+        top = idAt(top) if top >= 0 else None
+
+        refresh()
+
+        rows = self.rowsForIds({id for id, _, _ in selected} |
+                               {current and current[0], top} - {None})
+        selection = QItemSelection()
+        for id, left, right in selected:
+            if id in rows:
+                selection.select(self.index(rows[id], left),
+                                 self.index(rows[id], right))
+        selectionModel.select(selection, QItemSelectionModel.ClearAndSelect)
+        if current is not None and current[0] in rows:
+            selectionModel.setCurrentIndex(
+                self.index(rows[current[0]], current[1]),
+                QItemSelectionModel.NoUpdate)
+        if top in rows:
+            view.scrollTo(self.index(rows[top], 0),
+                          QAbstractItemView.PositionAtTop)
+
+    def resort(self, column, view=None):
+        '''Sorts on column, ascending unless it's already sorted ascending
+        on it. If view is given, the cells selected in it, its current cell
+        and the row at the top of it stay put across the sort.'''
 
-    def resort(self, column):
-        self.sortColumn = column
         if column != self.sortColumn or self.sortOrder == Qt.DescendingOrder:
             self.sortOrder = Qt.AscendingOrder
         else:
             self.sortOrder = Qt.DescendingOrder
-        self.sort(column, self.sortOrder)
+        self.sortColumn = column
+        if view is None:
+            self.sort(column, self.sortOrder)
+            return
+        self.keepingView(view, lambda: self.sort(column, self.sortOrder))
+        view.horizontalHeader().setSortIndicator(column, self.sortOrder)
+
+
+class desuplayerModel(libraryMixin, QSqlTableModel):
+    def __init__(self, libraryPath, parent=None, db=QSqlDatabase(),
+                 lazy=False):
+        super(desuplayerModel, self).__init__(parent, db)
+
+        self._rowStatus = {}
+        for signal in (self.modelReset, self.rowsInserted, self.rowsRemoved,
+                       self.layoutChanged):
+            signal.connect(self.clearRowStatus)
+        self.setTable('tracks')
+
+        self.setEditStrategy(QSqlTableModel.OnFieldChange)
+        if not lazy:
+            self.select()
+        self._lock_edits = True
+
+        for index, name in enumerate(headers):
+            self.setHeaderData(index, Qt.Horizontal, name)
+        self.libraryPath = libraryPath
+        self.libraryIndex = LibraryIndex(libraryPath, self)
+        self.libraryIndex.changed.connect(self.libraryChanged)
+
+        self.sortColumn = -1
+        self.sortOrder = None
+
+    def rowStatus(self, row):
+        '''Whether row's file is missing, it needs attention, or it's ok.
+        Worked out once per row, then cached until one of the fields it
+        depends on is edited or the rows are reloaded.'''
+
+        status = self._rowStatus.get(row)
+        if status is None:
+            status = self.statusFor(*(
+                super(desuplayerModel, self).data(self.index(row, column))
+                for column in _statusColumns))
+            self._rowStatus[row] = status
+        return status
+
+    def data(self, item, role=Qt.DisplayRole):
+        if role == Qt.BackgroundRole:
+            brush = _statusBrushes.get(self.rowStatus(item.row()))
+            if brush is not None:
+                return brush
+        return super().data(item, role)
+
+    def setData(self, item, value, role=Qt.EditRole):
+        column = columns[item.column()] if item.column() < len(columns) \
+            else None
+        # Saving the edit reselects the rows, so find the ID first
+        id = super().data(self.index(item.row(), col("ID")))
+        result = super().setData(item, value, role)
+        if item.column() in _statusColumns:
+            self._rowStatus.pop(item.row(), None)
+        if result and column in keyColumns:
+            query = QSqlQuery(self.database())
+            query.prepare(f"update tracks set {keyColumns[column]} = ? "
+                          "where id = ?")
+            query.addBindValue(sortKey(value))
+            query.addBindValue(id)
+            if not query.exec_():
+                print(query.lastError().text())
+        return result
+
+    def rowsEdited(self, column, changed):
+        '''Re-reads just the rows that editRows changed'''
+
+        for row, _ in changed:
+            self._rowStatus.pop(row, None)
+            self.selectRow(row)
+
+    def sort(self, column, order):
+        self.setSort(column, order)
+        super().sort(column, order)
+
+    def orderByClause(self):
+        return f"order by {self.orderTerms()}"
+
+    def clearRowStatus(self):
+        self._rowStatus.clear()
+
+    def libraryChanged(self):
+        self.clearRowStatus()
+        if self.rowCount() > 0:
+            self.dataChanged.emit(
+                self.index(0, 0),
+                self.index(self.rowCount() - 1, self.columnCount() - 1),
+                [Qt.BackgroundRole])
+
+    def search(self, text):
+        '''Shows only the tracks matching text'''
+
+        self.setFilter(searchFilter(text))
+        return self.select()
+
+
+class windowedModel(libraryMixin, QAbstractTableModel):
+    '''A table model over the tracks table for very large libraries, which
+    keeps only the last few pages it was asked for and finds each page by
+    seeking to its first row's sort key rather than with OFFSET.'''
+
+    def __init__(self, libraryPath, parent=None, db=QSqlDatabase(),
+                 pageSize=256, maxPages=16, lazy=False):
+        super(windowedModel, self).__init__(parent)
+
+        self._db = db if db.isValid() else QSqlDatabase.database()
+        self.pageSize = pageSize
+        self.maxPages = maxPages
+        self._filter = ''
+        self._rowCount = 0
+        self._boundaries = []
+        self._pages = OrderedDict()
+        if not lazy:
+            self.select()
+        self._lock_edits = True
+
+        self.libraryPath = libraryPath
+        self.libraryIndex = LibraryIndex(libraryPath, self)
+        self.libraryIndex.changed.connect(self.libraryChanged)
+
+        self.sortColumn = -1
+        self.sortOrder = None
+
+    def database(self):
+        return self._db
+
+    def _query(self, sql, values=()):
+        query = QSqlQuery(self._db)
+        query.prepare(sql)
+        for value in values:
+            query.addBindValue(value)
+        if not query.exec_():
+            print(query.lastError().text())
+            return None
+        return query
+
+    def _where(self, *conditions):
+        conditions = [condition for condition in conditions + (self._filter,)
+                      if condition]
+        if not conditions:
+            return ''
+        return ' where ' + ' and '.join(f'({condition})'
+                                        for condition in conditions)
+
+    def filter(self):
+        return self._filter
+
+    def select(self):
+        '''Counts the rows, and notes down where each page starts, in a
+        single pass over the sort order'''
+
+        self.beginResetModel()
+        self._pages.clear()
+        self._boundaries = []
+        self._rowCount = 0
+        keys = ', '.join(self._sortKeys + ['rowid'])
+        query = self._query(
+            f"select {keys} from (select {keys}, row_number() over "
+            f"(order by {self.orderTerms()}) - 1 as position "
+            f"from tracks{self._where()}) "
+            f"where position % {self.pageSize} = 0 order by position")
+        if query is not None:
+            while query.next():
+                self._boundaries.append([
+                    None if query.isNull(index) else query.value(index)
+                    for index in range(len(self._sortKeys) + 1)])
+            count = self._query(
+                f"select count(*) from tracks{self._where()}")
+            if count is not None and count.next():
+                self._rowCount = count.value(0)
+        self.endResetModel()
+        return query is not None
+
+    def _fetch(self, conditions, values, orderTerms, limit):
+        query = self._query(
+            f"select rowid, {', '.join(columns)} from tracks"
+            f"{self._where(*conditions)} order by {orderTerms} "
+            f"limit {limit}", values)
+        rows = []
+        while query is not None and query.next():
+            rows.append([query.value(index)
+                         for index in range(len(columns) + 1)] + [None])
+        return rows
+
+    def _loadPage(self, number):
+        '''Reads the page starting at the number'th boundary. NULL sort keys
+        sort first ascending and last descending, so when sorting on a
+        column without a key a page can straddle the two.'''
+
+        start = self._boundaries[number]
+        keys = self._sortKeys
+        compare = '<=' if self._descending else '>='
+        byRowid = 'rowid desc' if self._descending else 'rowid asc'
+        if not keys:
+            return self._fetch([f'rowid {compare} ?'], start[-1:], byRowid,
+                               self.pageSize)
+        if None in start:
+            rows = self._fetch([f'{keys[0]} is null', f'rowid {compare} ?'],
+                               start[-1:], byRowid, self.pageSize)
+            if not self._descending and len(rows) < self.pageSize:
+                rows += self._fetch([f'{keys[0]} is not null'], [],
+                                    self.orderTerms(),
+                                    self.pageSize - len(rows))
+        else:
+            rows = self._fetch(
+                [f"({', '.join(keys)}, rowid) {compare} "
+                 f"({', '.join('?' * len(start))})"],
+                start, self.orderTerms(), self.pageSize)
+            if (self._descending and len(keys) == 1
+                    and len(rows) < self.pageSize):
+                rows += self._fetch([f'{keys[0]} is null'], [], byRowid,
+                                    self.pageSize - len(rows))
+        return rows
+
+    def _row(self, row):
+        number, offset = divmod(row, self.pageSize)
+        page = self._pages.get(number)
+        if page is None:
+            page = self._loadPage(number)
+            self._pages[number] = page
+            while len(self._pages) > self.maxPages:
+                self._pages.popitem(last=False)
+        else:
+            self._pages.move_to_end(number)
+        if offset >= len(page):
+            return None
+        return page[offset]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._rowCount
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(columns)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return headers[section]
+        return super().headerData(section, orientation, role)
+
+    def rowStatus(self, row):
+        '''Whether row's file is missing, it needs attention, or it's ok.
+        Kept alongside the row in its page.'''
+
+        values = self._row(row)
+        if values is None:
+            return OK
+        if values[-1] is None:
+            values[-1] = self.statusFor(*(values[column + 1]
+                                          for column in _statusColumns))
+        return values[-1]
+
+    def data(self, item, role=Qt.DisplayRole):
+        if not item.isValid():
+            return None
+        if role == Qt.BackgroundRole:
+            return _statusBrushes.get(self.rowStatus(item.row()))
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            values = self._row(item.row())
+            return None if values is None else values[item.column() + 1]
+        return None
+
+    def setData(self, item, value, role=Qt.EditRole):
+        if not item.isValid() or role != Qt.EditRole:
+            return False
+        values = self._row(item.row())
+        if values is None:
+            return False
+        column = columns[item.column()]
+        if column in keyColumns:
+            update = self._query(
+                f"update tracks set {column} = ?, {keyColumns[column]} = ? "
+                "where rowid = ?", [value, sortKey(value), values[0]])
+        else:
+            update = self._query(f"update tracks set {column} = ? "
+                                 "where rowid = ?", [value, values[0]])
+        if update is None:
+            return False
+        values[item.column() + 1] = value
+        if item.column() in _statusColumns:
+            values[-1] = None
+            self.dataChanged.emit(
+                self.index(item.row(), 0),
+                self.index(item.row(), self.columnCount() - 1),
+                [Qt.BackgroundRole])
+        self.dataChanged.emit(item, item, [Qt.DisplayRole, Qt.EditRole])
+        return True
+
+    def rowsEdited(self, column, changed):
+        '''Updates the rows that editRows changed in the pages that are
+        loaded. Other pages are read afresh when they're next needed.'''
+
+        for row, value in changed:
+            page = self._pages.get(row // self.pageSize)
+            if page is None or row % self.pageSize >= len(page):
+                continue
+            values = page[row % self.pageSize]
+            values[column + 1] = value
+            if column in _statusColumns:
+                values[-1] = None
+        roles = [Qt.DisplayRole, Qt.EditRole]
+        if column in _statusColumns:
+            roles.append(Qt.BackgroundRole)
+        self.dataChanged.emit(
+            self.index(changed[0][0], 0),
+            self.index(changed[-1][0], self.columnCount() - 1), roles)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.setSort(column, order)
+        self.select()
+
+    def libraryChanged(self):
+        for page in self._pages.values():
+            for values in page:
+                values[-1] = None
+        if self.rowCount() > 0:
+            self.dataChanged.emit(
+                self.index(0, 0),
+                self.index(self.rowCount() - 1, self.columnCount() - 1),
+                [Qt.BackgroundRole])
+
+    def search(self, text):
+        '''Shows only the tracks matching text'''
+
+        self._filter = searchFilter(text)
+        return self.select()
+
 
+def loadDatabase(database, libraryPath, windowed=False, lazy=False):
+    '''Opens database in libraryPath, returning a model of its tracks, or
+    False if it couldn't be opened. If lazy, the model is empty until its
+    select() is called.'''
 
-def loadDatabase(database, libraryPath):
     if not connection.createConnection(libraryPath / database):
+        QMessageBox.critical(
+            None, "Cannot open database",
+            "Unable to establish a database connection.\n"
+            "This example needs SQLite support. Please read the Qt SQL "
+            "driver documentation for information how to build it.\n\n"
+            "Click Cancel to exit.", QMessageBox.Cancel)
         return False
-    return desuplayerModel(libraryPath)
+    if windowed:
+        return windowedModel(libraryPath, lazy=lazy)
+    return desuplayerModel(libraryPath, lazy=lazy)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,99 @@
+'''An on-disk cache of parsed tags, so that re-importing files that haven't
+changed doesn't mean reading them all again'''
+
+import json
+import os
+import sqlite3
+from pathlib import Path
+from .processfile import metadata
+
+
+class TagCache:
+    '''Maps (path, size, mtime) to the metadata parsed from that file, in a
+    SQLite database. Holds roughly maxEntries files, evicting the least
+    recently used.'''
+
+    _commitInterval = 1000
+
+    def __init__(self, fileName, maxEntries=100000):
+        self.maxEntries = maxEntries
+        self._db = sqlite3.connect(str(fileName))
+        # It's only a cache, so durability can be traded for speed
+        self._db.execute('pragma journal_mode=wal')
+        self._db.execute('pragma synchronous=normal')
+        self._db.execute('create table if not exists tags('
+                         'path text primary key, '
+                         'size integer, '
+                         'mtime_ns integer, '
+                         'tracks text, '
+                         'used integer)')
+        self._db.execute('create index if not exists tags_used on tags(used)')
+        self._clock = self._db.execute(
+            'select coalesce(max(used), 0) from tags').fetchone()[0]
+        self._changes = 0
+
+    @staticmethod
+    def _key(filename):
+        info = os.stat(filename)
+        return os.path.abspath(filename), info.st_size, info.st_mtime_ns
+
+    def _changed(self):
+        self._changes += 1
+        if self._changes >= self._commitInterval:
+            self.flush()
+
+    def get(self, filename):
+        '''Returns the list of metadata stored for filename, or None if the
+        file isn't cached or has changed since it was'''
+
+        try:
+            path, size, mtime_ns = self._key(filename)
+        except OSError:
+            return None
+        row = self._db.execute(
+            'select tracks from tags where path = ? and size = ? '
+            'and mtime_ns = ?', (path, size, mtime_ns)).fetchone()
+        if row is None:
+            return None
+
+        self._clock += 1
+        self._db.execute('update tags set used = ? where path = ?',
+                         (self._clock, path))
+        self._changed()
+        return [
+            metadata(**{**fields, 'Filename': Path(fields['Filename'])})
+            for fields in json.loads(row[0])
+        ]
+
+    def put(self, filename, tracks):
+        '''Stores the list of metadata parsed from filename'''
+
+        try:
+            path, size, mtime_ns = self._key(filename)
+        except OSError:
+            return
+        self._clock += 1
+        self._db.execute(
+            'insert or replace into tags values (?, ?, ?, ?, ?)',
+            (path, size, mtime_ns,
+             json.dumps([{**track._asdict(), 'Filename': str(track.Filename)}
+                         for track in tracks]),
+             self._clock))
+        self._changed()
+
+    def evict(self):
+        '''Drops all but the maxEntries most recently used files'''
+
+        self._db.execute(
+            'delete from tags where used <= '
+            '(select used from tags order by used desc limit 1 offset ?)',
+            (self.maxEntries, ))
+
+    def flush(self):
+        self.evict()
+        self._db.commit()
+        self._changes = 0
+
+    def close(self):
+        self.flush()
+        self._db.close()
@@ -0,0 +1,76 @@
+'''Tests running desutunes from the command line'''
+
+import os
+import sqlite3
+import pytest
+from desutunes import cli
+
+
+@pytest.fixture(scope="module")
+def library(tmpdir_factory, audio_path):
+    libraryPath = tmpdir_factory.mktemp('cli')
+    assert run(libraryPath, 'import', str(audio_path)) == cli.OK
+    return libraryPath
+
+
+def run(libraryPath, *args):
+    return cli.main(['--mode', 'nekodesu', '--library', str(libraryPath)] +
+                    list(args))
+
+
+def test_main_no_database(tmpdir):
+    assert run(tmpdir, 'stats') == cli.NO_DATABASE
+    assert not tmpdir.join('desutunes.db').exists()
+
+
+def test_main_usage(tmpdir):
+    with pytest.raises(SystemExit) as exit:
+        run(tmpdir, 'bogus')
+    assert exit.value.code == cli.USAGE
+
+
+def test_main_stats(library, capsys):
+    assert run(library, 'stats') == cli.OK
+    assert 'Tracks: 4' in capsys.readouterr().out
+
+
+def test_main_dump(library, tmpdir):
+    output = str(tmpdir.join('songlibrary.xml'))
+    assert run(library, 'dump', '--output', output) == cli.OK
+    assert os.path.exists(output)
+    assert run(library, 'dump', '--output', output) == cli.OK
+    assert os.path.exists(output + '.old')
+    delta = str(tmpdir.join('delta.xml'))
+    assert run(library, 'dump', '--delta', '--output', delta) == cli.OK
+    assert os.path.getsize(delta) < os.path.getsize(output)
+
+
+def test_main_import_unreadable(library, tmpdir):
+    unreadable = tmpdir.join('broken.mp3')
+    unreadable.write('not really audio')
+    assert run(library, 'import', str(unreadable)) == cli.FAILED
+
+
+def test_main_verify(library, capsys):
+    assert run(library, 'verify') == cli.OK
+    for path in library.visit('*.flac'):
+        path.remove()
+    assert run(library, 'verify') == cli.FAILED
+    assert 'is missing' in capsys.readouterr().out
+
+
+def test_main_duplicates(tmpdir, audio_path, capsys):
+    libraryPath = tmpdir.mkdir('duplicates')
+    song = str(audio_path / 'test_audio.mp3')
+    assert run(libraryPath, 'import', song) == cli.OK
+    assert run(libraryPath, 'import', song) == cli.OK
+    assert run(libraryPath, 'stats') == cli.OK
+    assert 'Tracks: 1' in capsys.readouterr().out
+    assert run(libraryPath, 'import', '--allow-duplicates', song) == cli.OK
+    # As if the tracks were imported before fingerprints were taken
+    with sqlite3.connect(str(libraryPath.join('desutunes.db'))) as db:
+        db.execute("update tracks set fingerprint = null")
+    assert run(libraryPath, 'duplicates', '--workers', '1') == cli.OK
+    output = capsys.readouterr().out
+    assert 'Fingerprinted 2 of 2 tracks.' in output
+    assert '1 set of duplicates found.' in output
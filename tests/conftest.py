@@ -17,3 +17,41 @@ def database_model(tmpdir_factory):
 
     return loadDatabase("tesutotunes.db",
                         pathlib.Path(tmpdir_factory.mktemp('tesutotunes')))
+
+
+@pytest.fixture(scope="session")
+def make_track():
+    '''A factory for test tracks: make_track(index, **fields) gives the
+    metadata of track number index, with any of its fields overridden'''
+    from pathlib import Path
+    from desutunes.processfile import metadata
+
+    def make(index, **fields):
+        track = dict(
+            ID=f'{index:016X}',
+            Filename=Path('h0m54r') / f'test_{index}.mp3',
+            Tracktitle=f'Test {index}',
+            Artist='h0m54r',
+            Album='Sounds of the desutunes',
+            Length=1234,
+            Anime='Neko Desu',
+            Role='ED',
+            Rolequalifier='',
+            Label='h0m54r records',
+            Composer='h0m54r',
+            InMyriad='NO',
+            Dateadded='2018-04-01 12:00',
+            OriginalFileName='test_audio.mp3')
+        track.update(fields)
+        return metadata(**track)
+
+    return make
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    import os
+    from PyQt5.QtWidgets import QApplication
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    return QApplication.instance() or QApplication([])
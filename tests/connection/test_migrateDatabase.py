@@ -0,0 +1,139 @@
+'''Tests upgrading desutunes databases to the current schema'''
+
+import sqlite3
+import pytest
+from PyQt5.QtSql import QSqlDatabase, QSqlQuery
+from desutunes.connection import migrateDatabase, migrations, schemaVersion
+
+legacy_schema = ("create table tracks(id text primary key, "
+                 "filename text, tracktitle text, artist text, album text, "
+                 "length integer, anime text, role text, rolequant text, "
+                 "label text, composer text, inmyriad text, dateadded text)")
+
+
+@pytest.fixture
+def legacy_database(tmpdir):
+    '''A database as created before the schema was versioned'''
+
+    fileName = str(tmpdir.join("desutunes.db"))
+    db = sqlite3.connect(fileName)
+    db.execute(legacy_schema)
+    db.executemany(
+        "insert into tracks values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(f'{index:016X}', f'h0m54r/test_{index}.mp3', f'Test {index}',
+          'h0m54r', 'Sounds of the desutunes', 1234, 'Neko Desu', 'OP',
+          str(index), 'h0m54r records', 'h0m54r', 'NO', '2018-04-01 12:00')
+         for index in range(10)])
+    db.commit()
+    db.close()
+    return fileName
+
+
+@pytest.fixture
+def connection(legacy_database):
+    db = QSqlDatabase.addDatabase('QSQLITE', 'migration')
+    db.setDatabaseName(legacy_database)
+    assert db.open()
+    yield db
+    db.close()
+    del db
+    QSqlDatabase.removeDatabase('migration')
+
+
+def scalar(db, statement):
+    query = QSqlQuery(statement, db)
+    assert query.next(), query.lastError().text()
+    return query.value(0)
+
+
+def test_migrateDatabase_legacy(connection):
+    assert schemaVersion(connection) == 0
+    assert migrateDatabase(connection)
+    assert schemaVersion(connection) == len(migrations)
+    assert scalar(connection, "select count(*) from tracks") == 10
+    for table in ('checksums', 'changelog', 'xml_fragments', 'xml_exports',
+                  'integrity', 'xml_fragments_staged'):
+        assert table in connection.tables()
+
+
+def query_plan(db, statement):
+    query = QSqlQuery(f"explain query plan {statement}", db)
+    details = []
+    while query.next():
+        details.append(query.value(3))
+    return ' '.join(details)
+
+
+def test_migrateDatabase_indexes(connection):
+    assert migrateDatabase(connection)
+    plan = query_plan(connection, "select * from tracks order by "
+                      "anime_key, role_key, rolequant_key, tracktitle_key, "
+                      "rowid")
+    assert plan == "SCAN tracks USING INDEX tracks_sort_anime"
+    plan = query_plan(connection, "select * from tracks order by "
+                      "artist_key desc, tracktitle_key desc, rowid desc")
+    assert plan == "SCAN tracks USING INDEX tracks_sort_artist"
+    plan = query_plan(connection, "select count(*) from tracks "
+                      "where inmyriad = 'NO'")
+    assert "COVERING INDEX tracks_inmyriad" in plan
+    plan = query_plan(connection, "select id from tracks where fingerprint "
+                      "in (select value from json_each('[]'))")
+    assert "USING INDEX tracks_fingerprint" in plan
+    assert scalar(connection, "select count(*) from sqlite_master "
+                  "where type = 'index' and name in "
+                  "('tracks_artist', 'tracks_anime', 'tracks_role')") == 0
+
+
+def test_migrateDatabase_idempotent(connection):
+    assert migrateDatabase(connection)
+    assert migrateDatabase(connection)
+    assert QSqlQuery(connection).exec_("pragma user_version = 1")
+    assert migrateDatabase(connection)
+    assert schemaVersion(connection) == len(migrations)
+
+
+def test_migrateDatabase_sort_keys(connection):
+    assert migrateDatabase(connection)
+    assert scalar(connection, "select rolequant_key from tracks "
+                  "where id = '0000000000000007'") == '0000000007'
+    assert scalar(connection, "select tracktitle_key from tracks "
+                  "where id = '0000000000000003'") == 'test 0000000003'
+    seq = scalar(connection, "select max(seq) from changelog")
+    assert QSqlQuery(connection).exec_(
+        "update tracks set artist_key = 'x' where id = '0000000000000001'")
+    assert scalar(connection, "select max(seq) from changelog") == seq
+
+
+def test_migrateDatabase_triggers(connection):
+    assert migrateDatabase(connection)
+    assert QSqlQuery(connection).exec_(
+        "update tracks set label = 'New' where id = '0000000000000001'")
+    assert scalar(connection, "select id from changelog "
+                  "order by seq desc limit 1") == '0000000000000001'
+
+
+def test_migrateDatabase_failure_keeps_version(connection):
+    migrations.append(["create table broken("])
+    try:
+        assert not migrateDatabase(connection)
+    finally:
+        migrations.pop()
+    assert schemaVersion(connection) == len(migrations)
+    assert 'broken' not in connection.tables()
+
+
+def test_migrateDatabase_failing_function(connection, capsys):
+    def fail(db):
+        print("no sort keys for you")
+        return False
+
+    assert migrateDatabase(connection)
+    migrations.append(["create table partial(id text)", fail])
+    try:
+        assert not migrateDatabase(connection)
+    finally:
+        migrations.pop()
+    assert capsys.readouterr().out.splitlines()[-2:] == [
+        "no sort keys for you",
+        f"Unable to upgrade database to version {len(migrations) + 1}"]
+    assert 'partial' not in connection.tables()
@@ -0,0 +1,73 @@
+'''Tests the connection profile and the per-thread connections'''
+
+import threading
+from PyQt5.QtSql import QSqlDatabase, QSqlQuery
+from desutunes.connection import threadConnection, releaseThreadConnections
+
+
+def scalar(db, statement):
+    query = QSqlQuery(statement, db)
+    assert query.next(), query.lastError().text()
+    return query.value(0)
+
+
+def onThread(function):
+    '''Runs function on a new thread with its connections, returning its
+    result'''
+
+    results = []
+
+    def run():
+        try:
+            results.append(function())
+        finally:
+            releaseThreadConnections()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    return results[0]
+
+
+def test_createConnection_pragmas(database_model):
+    db = QSqlDatabase.database()
+    assert scalar(db, "pragma journal_mode") == 'wal'
+    assert scalar(db, "pragma synchronous") == 1
+    assert scalar(db, "pragma busy_timeout") == 5000
+
+
+def test_threadConnection_read_only(database_model):
+    def readAndWrite():
+        db = threadConnection()
+        count = scalar(db, "select count(*) from tracks")
+        written = QSqlQuery(db).exec_("delete from tracks")
+        return count, written
+
+    count = scalar(QSqlDatabase.database(), "select count(*) from tracks")
+    assert onThread(readAndWrite) == (count, False)
+
+
+def test_threadConnection_reuse(database_model):
+    def connections():
+        return (threadConnection().connectionName(),
+                threadConnection().connectionName(),
+                threadConnection(readOnly=False).connectionName())
+
+    first, again, writer = onThread(connections)
+    assert first == again
+    assert writer != first
+    assert not QSqlDatabase.contains(first)
+    assert not QSqlDatabase.contains(writer)
+
+
+def test_threadConnection_not_blocked_by_writer(database_model):
+    db = QSqlDatabase.database()
+    count = scalar(db, "select count(*) from tracks")
+    assert db.transaction()
+    try:
+        assert QSqlQuery(db).exec_(
+            "insert into tracks(id) values ('ffffffffffffffff')")
+        assert onThread(lambda: scalar(
+            threadConnection(), "select count(*) from tracks")) == count
+    finally:
+        db.rollback()
@@ -0,0 +1,54 @@
+'''Tests copying tracks into the library with copyfiles.py'''
+
+import hashlib
+import threading
+from concurrent.futures import CancelledError
+from pathlib import Path
+from desutunes.copyfiles import copyTracks, hashFile, verifiedCopy
+from desutunes.processfile import getMetadataForFileList
+
+
+def test_hashFile(audio_path):
+    filename = str(audio_path / "test_audio.flac")
+    with open(filename, 'rb') as f:
+        expected = hashlib.blake2b(f.read(), digest_size=20).hexdigest()
+    assert hashFile(filename) == expected
+
+
+def test_verifiedCopy(audio_path, tmpdir):
+    source = str(audio_path / "test_audio.m4a")
+    destination = str(tmpdir.join("artist", "copy.m4a"))
+    assert verifiedCopy(source, destination) == hashFile(source)
+    assert hashFile(destination) == hashFile(source)
+
+
+def test_copyTracks(audio_path, tmpdir):
+    tracks = getMetadataForFileList([str(audio_path)])
+    libraryPath = Path(str(tmpdir))
+    results = list(copyTracks(tracks, libraryPath, workers=2))
+    assert len(results) == 4
+    for track, checksum, error in results:
+        assert error is None
+        assert checksum == hashFile(track.OriginalFileName)
+        assert hashFile(libraryPath / track.Filename) == checksum
+
+
+def test_copyTracks_failure(audio_path, tmpdir):
+    track = getMetadataForFileList([str(audio_path / "test_audio.mp3")])[0]
+    missing = track._replace(OriginalFileName=str(tmpdir.join("gone.mp3")))
+    results = {result[0].OriginalFileName: result
+               for result in copyTracks([missing, track], Path(str(tmpdir)))}
+    assert len(results) == 2
+    assert isinstance(results[missing.OriginalFileName][2], OSError)
+    assert results[track.OriginalFileName][2] is None
+
+
+def test_copyTracks_stop(audio_path, tmpdir):
+    tracks = getMetadataForFileList([str(audio_path)])
+    stop = threading.Event()
+    stop.set()
+    libraryPath = Path(str(tmpdir))
+    for track, checksum, error in copyTracks(tracks, libraryPath,
+                                             stop=stop):
+        assert isinstance(error, CancelledError)
+        assert not (libraryPath / track.Filename).exists()
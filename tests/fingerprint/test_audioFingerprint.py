@@ -0,0 +1,75 @@
+'''Tests fingerprinting the audio in a file without its tags'''
+
+import shutil
+import mutagen.apev2
+import mutagen.flac
+import mutagen.id3
+import mutagen.mp4
+import pytest
+from desutunes.fingerprint import audioFingerprint
+from desutunes.processfile import processFile
+
+
+def retag_id3(fileName):
+    tags = mutagen.id3.ID3(fileName)
+    tags.add(mutagen.id3.TIT2(encoding=3, text='A different title'))
+    tags.add(mutagen.id3.COMM(encoding=3, lang='eng', desc='',
+                              text='x' * 5000))
+    tags.save(fileName, v1=2)
+    tags = mutagen.apev2.APEv2()
+    tags['Title'] = 'Another title'
+    tags.save(fileName)
+
+
+def retag_flac(fileName):
+    tags = mutagen.flac.FLAC(fileName)
+    tags['title'] = 'A different title'
+    tags['comment'] = 'x' * 5000
+    tags.save()
+
+
+def retag_m4a(fileName):
+    tags = mutagen.mp4.MP4(fileName)
+    tags['\xa9nam'] = 'A different title'
+    tags['\xa9cmt'] = 'x' * 5000
+    tags.save()
+
+
+@pytest.mark.parametrize('suffix, retag', [
+    ('mp3', retag_id3),
+    ('aac', retag_id3),
+    ('flac', retag_flac),
+    ('m4a', retag_m4a),
+])
+def test_audioFingerprint_ignores_tags(audio_path, tmpdir, suffix, retag):
+    original = str(audio_path / f"test_audio.{suffix}")
+    copy = str(tmpdir.join(f"retagged.{suffix}"))
+    shutil.copy(original, copy)
+    retag(copy)
+    with open(original, 'rb') as a, open(copy, 'rb') as b:
+        assert a.read() != b.read()
+    assert audioFingerprint(copy) == audioFingerprint(original)
+
+
+def test_audioFingerprint_differs(audio_path):
+    fingerprints = {audioFingerprint(str(audio_path / f"test_audio.{suffix}"))
+                    for suffix in ('mp3', 'aac', 'flac', 'm4a', 'aif')}
+    assert len(fingerprints) == 5
+
+
+def test_audioFingerprint_audio_changed(audio_path, tmpdir):
+    copy = str(tmpdir.join("changed.flac"))
+    shutil.copy(str(audio_path / "test_audio.flac"), copy)
+    with open(copy, 'r+b') as f:
+        f.seek(-10, 2)
+        byte = f.read(1)
+        f.seek(-10, 2)
+        f.write(bytes([byte[0] ^ 0xff]))
+    assert audioFingerprint(copy) != \
+        audioFingerprint(str(audio_path / "test_audio.flac"))
+
+
+def test_audioFingerprint_in_metadata(audio_path):
+    fileName = str(audio_path / "test_audio.m4a")
+    track, = processFile(fileName)
+    assert track.Fingerprint == audioFingerprint(fileName)
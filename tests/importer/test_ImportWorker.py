@@ -0,0 +1,177 @@
+'''Tests importing on a worker thread'''
+
+import plistlib
+import shutil
+import mutagen.flac
+import pytest
+from PyQt5.QtCore import (QCoreApplication, QItemSelectionModel, Qt,
+                          QThreadPool)
+from PyQt5.QtSql import QSqlDatabase, QSqlQuery
+from desutunes.fields import col
+from desutunes.importer import (ImportWorker, SCANNED, PARSED, COPIED,
+                                INSERTED)
+
+
+def count_tracks():
+    query = QSqlQuery("select count(*) from tracks", QSqlDatabase.database())
+    assert query.next()
+    return query.value(0)
+
+
+def run_import(worker, model, view=None):
+    '''Runs worker on a thread pool, then delivers its signals, returning
+    the progress it reported and the tracks it couldn't import'''
+
+    progress = []
+    finished = []
+    worker.signals.progress.connect(
+        lambda *args: progress.append(args))
+    worker.signals.inserted.connect(
+        lambda tracks: model.tracksInserted(tracks, view))
+    worker.signals.finished.connect(finished.append)
+    pool = QThreadPool()
+    pool.start(worker)
+    assert pool.waitForDone(30000)
+    QCoreApplication.processEvents()
+    assert len(finished) == 1
+    return progress, finished[0]
+
+
+def library_files(model):
+    query = QSqlQuery("select filename from tracks", model.database())
+    fileNames = []
+    while query.next():
+        fileNames.append(query.value(0))
+    return fileNames
+
+
+@pytest.fixture
+def model(database_model, qapp):
+    query = QSqlQuery(database_model.database())
+    assert query.exec_("delete from tracks")
+    database_model.select()
+    return database_model
+
+
+def test_ImportWorker(model, audio_path, tmpdir):
+    worker = ImportWorker([str(audio_path)], model.libraryPath,
+                          cacheFileName=str(tmpdir.join("tagcache.db")),
+                          workers=1, batchSize=3)
+    progress, failures = run_import(worker, model)
+
+    assert failures == []
+    assert count_tracks() == 4
+    assert model.rowCount() == 4
+    assert (SCANNED, 4, 0) in progress
+    assert (PARSED, 4, 4) in progress
+    assert (COPIED, 4, 4) in progress
+    # The first batch is in the library before the last file is read
+    assert [args for args in progress if args[0] == INSERTED] == [
+        (INSERTED, 3, 3), (INSERTED, 4, 4)]
+    assert progress.index((INSERTED, 3, 3)) < progress.index((PARSED, 4, 4))
+    for track in library_files(model):
+        assert (model.libraryPath / track).exists()
+
+
+def test_ImportWorker_cancelled(model, audio_path):
+    worker = ImportWorker([str(audio_path)], model.libraryPath, workers=1)
+    worker.cancel()
+    progress, failures = run_import(worker, model)
+
+    assert failures == []
+    assert count_tracks() == 0
+    assert not [args for args in progress if args[0] == COPIED]
+
+
+def test_ImportWorker_cancelled_while_reading(model, audio_path):
+    worker = ImportWorker([str(audio_path)], model.libraryPath, workers=1,
+                          batchSize=1)
+    worker.signals.inserted.connect(lambda tracks: worker.cancel(),
+                                    Qt.DirectConnection)
+    progress, failures = run_import(worker, model)
+
+    assert failures == []
+    assert count_tracks() == 1
+    assert model.rowCount() == 1
+
+
+def test_ImportWorker_duplicates(model, audio_path, tmpdir):
+    worker = ImportWorker([str(audio_path)], model.libraryPath, workers=1)
+    run_import(worker, model)
+    assert count_tracks() == 4
+
+    retagged = str(tmpdir.join("retagged.flac"))
+    shutil.copy(str(audio_path / "test_audio.flac"), retagged)
+    tags = mutagen.flac.FLAC(retagged)
+    tags['title'] = 'A different title'
+    tags.save()
+    duplicates = []
+    worker = ImportWorker([retagged, str(audio_path / "test_audio.mp3")],
+                          model.libraryPath, workers=1)
+    worker.signals.duplicates.connect(duplicates.extend)
+    progress, failures = run_import(worker, model)
+
+    assert failures == []
+    assert count_tracks() == 4
+    assert sorted(track.Filename.suffix for track, id in duplicates) == [
+        '.flac', '.mp3']
+    assert not [args for args in progress if args[0] == COPIED]
+
+
+def test_ImportWorker_keeps_view(model, audio_path):
+    worker = ImportWorker([str(audio_path / "test_audio.flac")],
+                          model.libraryPath, workers=1)
+    run_import(worker, model)
+    view = model.createView("Importing")
+    selectionModel = view.selectionModel()
+    selectionModel.setCurrentIndex(model.index(0, col("Artist")),
+                                   QItemSelectionModel.ClearAndSelect)
+    selected = model.data(model.index(0, col("ID")))
+
+    worker = ImportWorker([str(audio_path / "test_audio.mp3"),
+                           str(audio_path / "test_audio.m4a")],
+                          model.libraryPath, workers=1, batchSize=1)
+    run_import(worker, model, view)
+
+    assert model.rowCount() == 3
+    current = selectionModel.currentIndex()
+    assert model.data(model.index(current.row(), col("ID"))) == selected
+    assert [index.row() for index in selectionModel.selectedIndexes()] == [
+        current.row()]
+
+
+def test_ImportWorker_xml_in_batches(model, audio_path, tmpdir):
+    tracks = {
+        str(index): {
+            'Track ID': index,
+            'Persistent ID': f'{index:016X}',
+            'Name': f'Test {suffix} file (Spam OP)',
+            'Artist': 'Tachibana Kanade',
+            'Total Time': 2000,
+            'Description': 'h0m54r records',
+            'Composer': 'h0m54r',
+            'Location': (audio_path / f'test_audio.{suffix}').as_uri(),
+        }
+        for index, suffix in enumerate(['mp3', 'm4a', 'flac', 'aac'])
+    }
+    fileName = str(tmpdir.join("iTunes Library.xml"))
+    with open(fileName, 'wb') as f:
+        plistlib.dump({'Tracks': tracks}, f)
+    worker = ImportWorker([fileName], model.libraryPath, workers=1,
+                          batchSize=2)
+    progress, failures = run_import(worker, model)
+
+    assert failures == []
+    assert count_tracks() == 4
+    # Each batch is inserted before the next is read
+    stages = [args for args in progress if args[0] in (PARSED, INSERTED)]
+    assert stages == [(PARSED, 2, 0), (INSERTED, 2, 2),
+                      (PARSED, 4, 0), (INSERTED, 4, 4)]
+
+    # Every track was fingerprinted, so importing them again is caught
+    duplicates = []
+    worker = ImportWorker([fileName], model.libraryPath, workers=1)
+    worker.signals.duplicates.connect(duplicates.extend)
+    run_import(worker, model)
+    assert count_tracks() == 4
+    assert len(duplicates) == 4
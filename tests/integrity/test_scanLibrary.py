@@ -0,0 +1,108 @@
+'''Tests the incremental scan of the library's files'''
+
+import os
+import pytest
+from PyQt5.QtSql import QSqlQuery
+from desutunes.integrity import (scanLibrary, CORRUPT, MISSING, OK,
+                                 WRONG_LENGTH)
+from desutunes.processfile import getMetadataForFileList
+
+
+def execute(db, statement):
+    query = QSqlQuery(db)
+    assert query.exec_(statement), query.lastError().text()
+    return query
+
+
+def statuses(db):
+    query = execute(db, "select t.filename, i.status from tracks t "
+                    "join integrity i on i.id = t.id")
+    found = {}
+    while query.next():
+        found[os.path.splitext(query.value(0))[1]] = query.value(1)
+    return found
+
+
+@pytest.fixture
+def library(database_model, audio_path):
+    db = database_model.database()
+    execute(db, "delete from tracks")
+    execute(db, "delete from integrity")
+    database_model.addRecords(getMetadataForFileList([str(audio_path)]))
+    return db, database_model.libraryPath
+
+
+def library_file(db, libraryPath, suffix):
+    query = execute(db, "select filename from tracks "
+                    f"where filename like '%{suffix}'")
+    assert query.next()
+    return libraryPath / query.value(0)
+
+
+def test_scanLibrary_incremental(library):
+    db, libraryPath = library
+    result = scanLibrary(db, libraryPath, workers=1)
+    assert (result.checked, result.probed, result.problems) == (4, 4, [])
+    assert set(statuses(db).values()) == {OK}
+
+    result = scanLibrary(db, libraryPath, workers=1)
+    assert (result.checked, result.probed, result.problems) == (4, 0, [])
+
+    path = library_file(db, libraryPath, '.mp3')
+    info = os.stat(path)
+    os.utime(path, ns=(info.st_atime_ns, info.st_mtime_ns + 10 ** 9))
+    assert scanLibrary(db, libraryPath, workers=1).probed == 1
+    assert scanLibrary(db, libraryPath, workers=1, full=True).probed == 4
+
+
+def test_scanLibrary_missing(library):
+    db, libraryPath = library
+    scanLibrary(db, libraryPath, workers=1)
+    path = library_file(db, libraryPath, '.flac')
+    contents = path.read_bytes()
+    path.unlink()
+    result = scanLibrary(db, libraryPath, workers=1)
+    assert [problem.Status for problem in result.problems] == [MISSING]
+    assert statuses(db)['.flac'] == MISSING
+
+    path.write_bytes(contents)
+    result = scanLibrary(db, libraryPath, workers=1)
+    assert result.probed == 1
+    assert result.problems == []
+
+
+def test_scanLibrary_wrong_length(library):
+    db, libraryPath = library
+    scanLibrary(db, libraryPath, workers=1)
+    execute(db, "update tracks set length = length + 5000 "
+            "where filename like '%.m4a'")
+    result = scanLibrary(db, libraryPath, workers=1)
+    assert result.probed == 0
+    assert [problem.Status for problem in result.problems] == [WRONG_LENGTH]
+
+
+def test_scanLibrary_corrupt(library):
+    db, libraryPath = library
+    scanLibrary(db, libraryPath, workers=1)
+    path = library_file(db, libraryPath, '.flac')
+    contents = bytearray(path.read_bytes())
+    contents[-10] ^= 0xff
+    path.write_bytes(bytes(contents))
+    info = os.stat(path)
+    os.utime(path, ns=(info.st_atime_ns, info.st_mtime_ns + 10 ** 9))
+    result = scanLibrary(db, libraryPath, workers=1)
+    assert [problem.Status for problem in result.problems] == [CORRUPT]
+    # Unchanged since, so it isn't read again, but is still reported
+    result = scanLibrary(db, libraryPath, workers=1)
+    assert result.probed == 0
+    assert [problem.Status for problem in result.problems] == [CORRUPT]
+
+
+def test_scanLibrary_forgets_deleted_tracks(library):
+    db, libraryPath = library
+    scanLibrary(db, libraryPath, workers=1)
+    execute(db, "delete from tracks where filename like '%.aac'")
+    scanLibrary(db, libraryPath, workers=1)
+    query = execute(db, "select count(*) from integrity")
+    assert query.next()
+    assert query.value(0) == 3
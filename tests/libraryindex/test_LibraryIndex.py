@@ -0,0 +1,62 @@
+'''Tests the LibraryIndex class from libraryindex.py'''
+
+import os
+import pytest
+from desutunes.libraryindex import LibraryIndex
+
+
+@pytest.fixture
+def library(tmpdir):
+    tmpdir.mkdir("h0m54r").join("test_1.mp3").write("1")
+    tmpdir.join("loose.flac").write("2")
+    return tmpdir
+
+
+def test_LibraryIndex_not_ready(library):
+    index = LibraryIndex(str(library))
+    assert index.contains("h0m54r/missing.mp3")
+
+
+def test_LibraryIndex_scan(library):
+    index = LibraryIndex(str(library))
+    index.scan()
+    assert index.contains("h0m54r/test_1.mp3")
+    assert index.contains("loose.flac")
+    assert not index.contains("h0m54r/missing.mp3")
+    assert not index.contains("nobody/test_1.mp3")
+
+
+def test_LibraryIndex_rescan_only_changed_folders(library):
+    index = LibraryIndex(str(library))
+    index.scan()
+    changes = []
+    index.changed.connect(lambda: changes.append(True))
+    index.scan()
+    assert changes == []
+
+    folder = library.join("h0m54r")
+    folder.join("test_2.mp3").write("3")
+    folder.join("test_1.mp3").remove()
+    os.utime(str(folder), ns=(0, os.stat(str(folder)).st_mtime_ns + 10**9))
+    index.scan()
+    assert changes == [True]
+    assert index.contains("h0m54r/test_2.mp3")
+    assert not index.contains("h0m54r/test_1.mp3")
+
+
+def test_LibraryIndex_new_folder(library):
+    index = LibraryIndex(str(library))
+    index.scan()
+    library.mkdir("new artist").join("new.m4a").write("4")
+    os.utime(str(library), ns=(0, os.stat(str(library)).st_mtime_ns + 10**9))
+    index.scan()
+    assert index.contains("new artist/new.m4a")
+
+
+def test_LibraryIndex_add(library):
+    index = LibraryIndex(str(library))
+    index.scan()
+    index.add("h0m54r/added.mp3")
+    index.add("someone else/added.mp3")
+    assert index.contains("h0m54r/added.mp3")
+    assert index.contains("someone else/added.mp3")
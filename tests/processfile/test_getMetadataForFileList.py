@@ -2,6 +2,7 @@
 
 import os
 import pathlib
+import shutil
 from desutunes.processfile import getMetadataForFileList
 
 
@@ -21,3 +22,37 @@ def test_getMetadataForFileList_folder(audio_path):
     assert len(metadata_list) == 4
     assert ({metadata.Artist for metadata in metadata_list} ==
             {'Tachibana Kanade'})
+
+
+def test_getMetadataForFileList_parallel(audio_path):
+    filenames = [str(audio_path / "test_audio.m4a"),
+                 str(audio_path / "test_audio.mp3"),
+                 str(audio_path / "test_audio.aac"),
+                 str(audio_path / "test_audio.flac")]
+    metadata_list = getMetadataForFileList(filenames, workers=2)
+    assert ([metadata.OriginalFileName for metadata in metadata_list] ==
+            filenames)
+    assert len({metadata.ID for metadata in metadata_list}) == 4
+
+
+def test_getMetadataForFileList_failures(audio_path, tmpdir):
+    bad_file = tmpdir.join("not_audio.mp3")
+    bad_file.write("This is not an MP3 file")
+    failures = []
+    metadata_list = getMetadataForFileList(
+        [str(bad_file), str(audio_path / "test_audio.flac")],
+        workers=2, failures=failures)
+    assert len(metadata_list) == 1
+    assert metadata_list[0].Artist == 'Tachibana Kanade'
+    assert len(failures) == 1
+    assert failures[0][0] == str(bad_file)
+
+
+def test_getMetadataForFileList_parallel_ids_unique(audio_path, tmpdir):
+    fileNames = []
+    for index in range(16):
+        fileName = str(tmpdir.join(f"copy_{index}.mp3"))
+        shutil.copy(str(audio_path / "test_audio.mp3"), fileName)
+        fileNames.append(fileName)
+    metadata_list = getMetadataForFileList(fileNames, workers=4)
+    assert len({metadata.ID for metadata in metadata_list}) == 16
@@ -0,0 +1,33 @@
+# Tests the metadataBatches function from processfile.py
+
+import pytest
+from desutunes.processfile import metadataBatches
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_metadataBatches(audio_path, workers):
+    filenames = [str(audio_path / "test_audio.m4a"),
+                 str(audio_path / "test_audio.mp3"),
+                 str(audio_path / "test_audio.aac"),
+                 str(audio_path / "test_audio.flac")]
+    batches = list(metadataBatches(filenames, workers, batchSize=3))
+    assert [len(batch) for batch in batches] == [3, 1]
+    assert ([metadata.OriginalFileName for batch in batches
+             for metadata in batch] == filenames)
+
+
+def test_metadataBatches_failures(audio_path, tmpdir):
+    bad_file = tmpdir.join("not_audio.mp3")
+    bad_file.write("This is not an MP3 file")
+    failures = []
+    batches = list(metadataBatches(
+        [str(bad_file), str(audio_path / "test_audio.flac")],
+        batchSize=1, failures=failures))
+    assert [len(batch) for batch in batches] == [1]
+    assert failures[0][0] == str(bad_file)
+
+
+def test_metadataBatches_closed_early(audio_path):
+    batches = metadataBatches([str(audio_path)], workers=2, batchSize=1)
+    assert len(next(batches)) == 1
+    batches.close()
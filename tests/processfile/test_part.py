@@ -0,0 +1,47 @@
+# Tests the part and partAll functions from processfile.py against a corpus
+# of real-world titles
+
+import pathlib
+import pytest
+from desutunes import processfile
+from desutunes.processfile import part, partAll
+
+corpus_path = pathlib.Path(__file__).parent.parent / "corpus" / "titles.tsv"
+
+
+def load_corpus():
+    with open(corpus_path, encoding='utf-8') as f:
+        return [
+            (fields[0], tuple(fields[1:]))
+            for fields in (line.rstrip('\n').split('\t') for line in f
+                           if not line.startswith('#'))
+        ]
+
+
+@pytest.mark.parametrize("title,expected", load_corpus())
+def test_part_corpus(title, expected):
+    assert part(title) == expected
+
+
+def test_partAll_corpus():
+    corpus = load_corpus()
+    titles = [title for title, _ in corpus] * 3
+    expected = [expected for _, expected in corpus] * 3
+    assert partAll(titles) == expected
+
+
+def test_partAll_parses_each_title_once(monkeypatch):
+    parsed = []
+
+    def counting_part(title):
+        parsed.append(title)
+        return part(title)
+
+    monkeypatch.setattr(processfile, 'part', counting_part)
+    titles = ['Connect (Madoka OP)', 'Magia (Madoka ED)'] * 50
+    assert partAll(titles) == [part(title) for title in titles]
+    assert sorted(parsed) == sorted(set(titles))
+
+
+def test_partAll_empty():
+    assert partAll([]) == []
@@ -0,0 +1,42 @@
+# Tests the walkAudioFiles function from processfile.py
+
+import os
+import shutil
+import types
+from desutunes.processfile import walkAudioFiles
+
+
+def test_walkAudioFiles_is_lazy(audio_path):
+    assert isinstance(walkAudioFiles([str(audio_path)]), types.GeneratorType)
+
+
+def test_walkAudioFiles_folder(audio_path):
+    assert list(walkAudioFiles([str(audio_path)])) == [
+        str(audio_path / name) for name in
+        ['test_audio.aac', 'test_audio.flac', 'test_audio.m4a',
+         'test_audio.mp3']]
+
+
+def test_walkAudioFiles_files(audio_path):
+    filenames = [str(audio_path / "test_audio.mp3"),
+                 str(audio_path / "test_audio.aif"),
+                 str(audio_path / "missing.mp3"),
+                 str(audio_path / "test_audio.m4a")]
+    assert list(walkAudioFiles(filenames)) == [filenames[0], filenames[3]]
+
+
+def test_walkAudioFiles_nested(audio_path, tmpdir):
+    nested = tmpdir.mkdir("a").mkdir("b").mkdir("c")
+    shutil.copyfile(str(audio_path / "test_audio.mp3"),
+                    str(nested.join("deep.MP3")))
+    tmpdir.join("notes.txt").write("Not audio")
+    assert (list(walkAudioFiles([str(tmpdir)])) ==
+            [str(nested.join("deep.MP3"))])
+
+
+def test_walkAudioFiles_symlink_loop(audio_path, tmpdir):
+    shutil.copyfile(str(audio_path / "test_audio.flac"),
+                    str(tmpdir.join("track.flac")))
+    os.symlink(str(tmpdir), str(tmpdir.join("loop")))
+    assert (list(walkAudioFiles([str(tmpdir)])) ==
+            [str(tmpdir.join("track.flac"))])
@@ -0,0 +1,73 @@
+'''Tests exporting a desutunes db as iTunes XML'''
+
+import os
+import plistlib
+import stat
+from datetime import datetime
+from desutunes.processitunes import exportDatabaseXML
+
+
+def export(model, fileName, **options):
+    return exportDatabaseXML(model.database(), model.libraryPath, fileName,
+                             **options)
+
+
+def test_exportXML(database_model, tmpdir, make_track):
+    assert database_model.bulkInsert([
+        make_track(index,
+                   Rolequalifier='' if index % 2 else '2',
+                   Label='h0m54r & <friends>',
+                   Composer='🐱',
+                   InMyriad='NO' if index % 2 else 'Yes')
+        for index in range(300)])
+    fileName = str(tmpdir.join("songlibrary.xml"))
+    assert export(database_model, fileName)
+
+    with open(fileName, 'rb') as f:
+        tracks = plistlib.load(f)['Tracks']
+    assert len(tracks) == 300
+    assert tracks['1'] == {
+        'Track ID': '1',
+        'Persistent ID': '0000000000000000',
+        'Location': (database_model.libraryPath /
+                     'h0m54r/test_0.mp3').as_uri(),
+        'Name': 'Test 0 (Neko Desu ED 2)',
+        'Artist': 'h0m54r',
+        'Album': 'Sounds of the desutunes',
+        'Total Time': 1.234,
+        'Description': 'h0m54r & <friends>',
+        'Composer': '🐱',
+        'Episode': '',
+        'Date Added': datetime(2018, 4, 1, 12, 0)
+    }
+    assert tracks['300']['Name'] == 'Test 299 (Neko Desu ED)'
+    assert tracks['300']['Episode'] == 'NOT IN MYRIAD'
+
+
+def test_exportXML_replaces_atomically(database_model, tmpdir):
+    fileName = tmpdir.join("songlibrary.xml")
+    fileName.write("old")
+    assert export(database_model, str(fileName))
+    assert fileName.read().startswith('<?xml')
+    assert [path.basename for path in tmpdir.listdir()] == [
+        "songlibrary.xml"]
+
+
+def test_exportXML_permissions(database_model, tmpdir):
+    umask = os.umask(0o022)
+    try:
+        fileName = str(tmpdir.join("songlibrary.xml"))
+        assert export(database_model, fileName)
+        assert stat.S_IMODE(os.stat(fileName).st_mode) == 0o644
+        os.chmod(fileName, 0o640)
+        assert export(database_model, fileName)
+        assert stat.S_IMODE(os.stat(fileName).st_mode) == 0o640
+    finally:
+        os.umask(umask)
+
+
+def test_exportXML_bad_path(database_model, tmpdir):
+    fileName = str(tmpdir.join("missing", "songlibrary.xml"))
+    errors = []
+    assert not export(database_model, fileName, errors=errors)
+    assert len(errors) == 1
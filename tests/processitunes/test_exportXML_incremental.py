@@ -0,0 +1,107 @@
+'''Tests that XML exports only re-render tracks that have changed'''
+
+import plistlib
+from PyQt5.QtCore import QByteArray
+from PyQt5.QtSql import QSqlQuery
+from desutunes import processitunes
+from desutunes.processitunes import exportDatabaseXML, lastExportRevision
+
+
+def export(model, fileName, **options):
+    return exportDatabaseXML(model.database(), model.libraryPath, fileName,
+                             **options)
+
+
+def execute(model, statement, *values):
+    query = QSqlQuery(model.database())
+    query.prepare(statement)
+    for value in values:
+        query.addBindValue(value)
+    assert query.exec_(), query.lastError().text()
+    return query
+
+
+def load(fileName):
+    with open(fileName, 'rb') as f:
+        return plistlib.load(f)
+
+
+def test_export_caches_fragments(database_model, tmpdir, make_track):
+    assert database_model.bulkInsert([make_track(index) for index in range(3)])
+    fileName = str(tmpdir.join("songlibrary.xml"))
+    assert export(database_model, fileName)
+    query = execute(database_model, "select count(*) from xml_fragments")
+    assert query.next() and query.value(0) == 3
+    assert lastExportRevision(database_model.database()) > 0
+
+
+def test_export_reuses_unchanged_fragments(database_model, tmpdir):
+    query = execute(database_model,
+                    "select fragment from xml_fragments where id = ?",
+                    '0000000000000000')
+    assert query.next()
+    fragment = bytes(query.value(0)).replace(b'h0m54r</string>',
+                                             b'From the cache</string>')
+    execute(database_model,
+            "update xml_fragments set fragment = ? where id = ?",
+            QByteArray(fragment), '0000000000000000')
+    execute(database_model, "update tracks set artist = 'Edited' where id = ?",
+            '0000000000000001')
+
+    fileName = str(tmpdir.join("songlibrary.xml"))
+    assert export(database_model, fileName)
+    tracks = load(fileName)['Tracks']
+    assert len(tracks) == 3
+    assert tracks['1']['Artist'] == 'From the cache'
+    assert tracks['2']['Artist'] == 'Edited'
+    assert tracks['3']['Artist'] == 'h0m54r'
+
+
+def test_export_delta(database_model, tmpdir):
+    since = lastExportRevision(database_model.database())
+    execute(database_model, "update tracks set label = 'New' where id = ?",
+            '0000000000000001')
+    execute(database_model, "delete from tracks where id = ?",
+            '0000000000000002')
+
+    fileName = str(tmpdir.join("songlibrary-delta.xml"))
+    assert export(database_model, fileName, since=since)
+    delta = load(fileName)
+    assert list(delta['Tracks']) == ['2']
+    assert delta['Tracks']['2']['Description'] == 'New'
+    assert delta['Deleted Tracks'] == ['0000000000000002']
+    assert delta['Since Revision'] == since
+    assert delta['Revision'] == lastExportRevision(database_model.database())
+
+    assert export(database_model, fileName,
+                  since=lastExportRevision(database_model.database()))
+    delta = load(fileName)
+    assert delta['Tracks'] == {}
+    assert delta['Deleted Tracks'] == []
+
+
+def count(model, table):
+    query = execute(model, f"select count(*) from {table}")
+    assert query.next()
+    return query.value(0)
+
+
+def test_export_stages_in_chunks(database_model, tmpdir, monkeypatch,
+                                 make_track):
+    monkeypatch.setattr(processitunes, '_stageChunk', 2)
+    execute(database_model, "delete from tracks")
+    execute(database_model, "delete from xml_fragments")
+    assert database_model.bulkInsert([make_track(index) for index in range(5)])
+
+    def failingReplace(source, destination):
+        raise OSError("no space left")
+
+    fileName = str(tmpdir.join("songlibrary.xml"))
+    with monkeypatch.context() as patch:
+        patch.setattr(processitunes.os, 'replace', failingReplace)
+        assert not export(database_model, fileName)
+    assert count(database_model, "xml_fragments") == 0
+
+    assert export(database_model, fileName)
+    assert count(database_model, "xml_fragments") == 5
+    assert count(database_model, "xml_fragments_staged") == 0
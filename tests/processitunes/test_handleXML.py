@@ -0,0 +1,115 @@
+'''Tests importing an iTunes library XML file'''
+
+import plistlib
+from datetime import datetime
+import pytest
+from desutunes.fingerprint import audioFingerprint
+from desutunes.processitunes import handleXML, iterITunesTracks
+
+
+@pytest.fixture
+def library_xml(audio_path, tmpdir):
+    library = {
+        'Major Version': 1,
+        'Tracks': {
+            '101': {
+                'Track ID': 101,
+                'Persistent ID': '0123456789ABCDEF',
+                'Name': 'Test 1 (Neko Desu OP2)',
+                'Artist': 'h0m54r',
+                'Album': 'Sounds of the desutunes',
+                'Total Time': 1234,
+                'Description': 'h0m54r records',
+                'Composer': 'h0m54r',
+                'Episode': 'NOT IN MYRIAD',
+                'Date Added': datetime(2018, 4, 1, 12, 0),
+                'Location': 'file:///music/h0m54r/Test%201.mp3',
+                'Compilation': True,
+            },
+            '102': {
+                'Track ID': 102,
+                'Persistent ID': '123456789ABCDEF0',
+                'Name': 'Internet radio',
+                'Artist': 'Nobody',
+                'Total Time': 0,
+                'Location': 'http://example.com/stream',
+            },
+            '103': {
+                'Track ID': 103,
+                'Persistent ID': '23456789ABCDEF01',
+                'Name': 'Test MP3 file (Spam OP1)',
+                'Artist': 'Tachibana Kanade',
+                'Total Time': 2168,
+                'Location': (audio_path / 'test_audio.mp3').as_uri(),
+            },
+        },
+        'Playlists': [{
+            'Name': 'Library',
+            'Playlist Items': [{'Track ID': 101}, {'Track ID': 103}]
+        }],
+    }
+    fileName = str(tmpdir.join("iTunes Library.xml"))
+    with open(fileName, 'wb') as f:
+        plistlib.dump(library, f)
+    return fileName, library
+
+
+def test_iterITunesTracks(library_xml):
+    fileName, library = library_xml
+    assert dict(iterITunesTracks(fileName)) == library['Tracks']
+
+
+def read_tracks(fileName, **options):
+    return [track for batch in handleXML(fileName, **options)
+            for track in batch]
+
+
+def test_handleXML(library_xml):
+    fileName, _ = library_xml
+    tracks = read_tracks(fileName)
+    assert [track.ID for track in tracks] == ['0123456789ABCDEF',
+                                              '23456789ABCDEF01']
+    assert tracks[0].OriginalFileName == '/music/h0m54r/Test 1.mp3'
+    assert str(tracks[0].Filename) == 'h0m54r/Test 1 (0123456789ABCDEF).mp3'
+    assert tracks[0].Anime == 'Neko Desu'
+    assert tracks[0].Role == 'OP'
+    assert tracks[0].Rolequalifier == '2'
+    assert tracks[0].InMyriad == 'NO'
+    assert tracks[0].Label == 'h0m54r records'
+
+
+def test_handleXML_reads_missing_fields_from_file(library_xml):
+    fileName, _ = library_xml
+    track = read_tracks(fileName)[1]
+    assert track.Label == 'h0m54r records'
+    assert track.Composer == '🐱'
+    assert track.InMyriad == 'Yes'
+
+
+def test_handleXML_bad_file(tmpdir):
+    fileName = tmpdir.join("broken.xml")
+    fileName.write("<plist><dict><key>Tracks</key>")
+    assert read_tracks(str(fileName)) == []
+
+
+@pytest.mark.parametrize("workers,batchSize,count", [(1, 2000, 1),
+                                                     (2, 1, 2)])
+def test_handleXML_probes_in_batches(library_xml, capsys, workers,
+                                     batchSize, count):
+    fileName, _ = library_xml
+    batches = list(handleXML(fileName, workers=workers, batchSize=batchSize))
+    assert len(batches) == count
+    tracks = [track for batch in batches for track in batch]
+    assert [track.Composer for track in tracks] == ['h0m54r', '🐱']
+    assert [track.Label for track in tracks] == ['h0m54r records'] * 2
+    assert 'Read 1 of their 2 files.' in capsys.readouterr().out
+
+
+def test_handleXML_fingerprints_every_file(library_xml, audio_path):
+    fileName, _ = library_xml
+    missing, complete = read_tracks(fileName)
+    # Its file doesn't exist, so it keeps what the XML says
+    assert missing.Fingerprint == ''
+    assert missing.Label == 'h0m54r records'
+    assert complete.Fingerprint == audioFingerprint(
+        str(audio_path / 'test_audio.mp3'))
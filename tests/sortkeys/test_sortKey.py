@@ -0,0 +1,28 @@
+'''Tests the keys the tracks table is sorted by'''
+
+from desutunes.sortkeys import sortChain, sortKey
+
+
+def test_sortKey_case():
+    assert sortKey('ClariS') == sortKey('claris') == sortKey('CLARIS')
+
+
+def test_sortKey_accents():
+    assert sortKey('Pokémon') == sortKey('Pokemon')
+    assert sortKey('Straße') == sortKey('STRASSE')
+
+
+def test_sortKey_natural_order():
+    names = ['OP 10', 'op 2', 'OP 1', 'ED', 'op 2b', 'Op 02a']
+    assert sorted(names, key=sortKey) == [
+        'ED', 'OP 1', 'op 2', 'Op 02a', 'op 2b', 'OP 10']
+
+
+def test_sortKey_empty():
+    assert sortKey(None) == sortKey('') == ''
+
+
+def test_sortChain():
+    assert sortChain('anime') == [
+        'anime_key', 'role_key', 'rolequant_key', 'tracktitle_key']
+    assert sortChain('dateadded') == ['dateadded']
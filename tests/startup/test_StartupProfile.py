@@ -0,0 +1,26 @@
+'''Tests timing the phases of starting up'''
+
+import time
+from desutunes.startup import StartupProfile
+
+
+def test_StartupProfile(capsys):
+    profile = StartupProfile()
+    time.sleep(0.01)
+    profile.mark('first')
+    profile.mark('second')
+    assert [phase for phase, _ in profile.phases] == ['first', 'second']
+    assert profile.phases[0][1] >= 0.01
+    assert abs(profile.total() - sum(
+        elapsed for _, elapsed in profile.phases)) < 1e-9
+    profile.report()
+    out = capsys.readouterr().out
+    assert 'first' in out and 'second' in out and 'total' in out
+
+
+def test_StartupProfile_disabled(capsys):
+    profile = StartupProfile(enabled=False)
+    profile.mark('first')
+    profile.report()
+    assert profile.phases == []
+    assert capsys.readouterr().out == ''
@@ -35,3 +35,13 @@ def test_addRecords(database_model, audio_path):
     assert database_model.data(database_model.index(0, 2)) == 'Test 1'
     assert database_model.data(database_model.index(1, 0)) == '0123456789ABCDEF'
     
+
+def test_addRecords_checksums(database_model, audio_path):
+    from PyQt5.QtSql import QSqlQuery
+    from desutunes.copyfiles import hashFile
+
+    query = QSqlQuery("select checksum from checksums "
+                      "where id = '123456789ABCDEF0'",
+                      database_model.database())
+    assert query.next()
+    assert query.value(0) == hashFile(str(audio_path / 'test_audio.mp3'))
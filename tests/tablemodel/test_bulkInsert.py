@@ -0,0 +1,32 @@
+'''Tests inserting many records at once into a desutunes db'''
+
+from PyQt5.QtSql import QSqlQuery
+
+
+def count_rows(model):
+    query = QSqlQuery("select count(*) from tracks", model.database())
+    query.next()
+    return query.value(0)
+
+
+def test_bulkInsert(database_model, make_track):
+    assert database_model.bulkInsert(
+        [make_track(index) for index in range(1000)])
+    while database_model.canFetchMore():
+        database_model.fetchMore()
+    assert database_model.rowCount() == 1000
+    assert database_model.data(database_model.index(999, 2)) == 'Test 999'
+    assert database_model.data(database_model.index(999, 5)) == 1234
+    assert database_model.data(database_model.index(0, 1)) == (
+        'h0m54r/test_0.mp3')
+
+
+def test_bulkInsert_empty(database_model):
+    assert database_model.bulkInsert([])
+
+
+def test_bulkInsert_duplicate_rolls_back(database_model, make_track):
+    rows_before = count_rows(database_model)
+    assert not database_model.bulkInsert(
+        [make_track(index) for index in range(1001)])
+    assert count_rows(database_model) == rows_before
@@ -0,0 +1,76 @@
+'''Tests editing a column of many rows at once'''
+
+import pathlib
+import pytest
+from PyQt5.QtSql import QSqlQuery
+from desutunes.tablemodel import col, loadDatabase, NEEDS_ATTENTION, OK
+
+
+@pytest.fixture(params=[False, True], ids=['table', 'windowed'])
+def model(request, tmpdir, make_track):
+    model = loadDatabase("tesutotunes.db", pathlib.Path(str(tmpdir)),
+                         windowed=request.param)
+    assert model.bulkInsert([
+        make_track(index, Artist='Artist', Album=f'Album {index % 2}',
+                   Label='Label Records', Composer='', InMyriad='YES')
+        for index in range(20)])
+    return model
+
+
+def column_values(model, column):
+    query = QSqlQuery(f"select {column} from tracks order by id",
+                      model.database())
+    values = []
+    while query.next():
+        values.append(query.value(0))
+    return values
+
+
+def test_setColumn(model):
+    resets = []
+    changes = []
+    model.modelReset.connect(lambda: resets.append(True))
+    model.dataChanged.connect(lambda *args: changes.append(args))
+    rows = list(range(0, 20, 2))
+    assert model.rowStatus(0) == NEEDS_ATTENTION
+    assert model.setColumn(rows, col("Composer"), 'Somebody') == 10
+
+    assert column_values(model, 'composer') == [
+        '' if index % 2 else 'Somebody' for index in range(20)]
+    assert column_values(model, 'composer_key')[0] == 'somebody'
+    assert resets == []
+    assert changes
+    for row in range(20):
+        assert model.data(model.index(row, col("Composer"))) == (
+            'Somebody' if row in rows else '')
+    assert model.rowStatus(0) == OK
+    assert model.rowStatus(1) == NEEDS_ATTENTION
+
+
+def test_setColumn_unchanged(model):
+    assert model.setColumn([0, 1], col("Artist"), 'Artist') == 0
+
+
+def test_setColumn_locked(model):
+    assert model.setColumn([0, 1], col("Length"), 1) is None
+    assert column_values(model, 'length') == [1234] * 20
+
+
+def test_replaceInColumn(model):
+    assert model.replaceInColumn(range(20), col("Label"), 'Records',
+                                 'Music') == 20
+    assert set(column_values(model, 'label')) == {'Label Music'}
+    assert set(column_values(model, 'label_key')) == {'label music'}
+    assert model.data(model.index(5, col("Label"))) == 'Label Music'
+    assert model.replaceInColumn(range(20), col("Label"), 'Records',
+                                 'Music') == 0
+
+
+def test_editRows_changelog(model):
+    query = QSqlQuery("select count(*) from changelog", model.database())
+    assert query.next()
+    before = query.value(0)
+    assert model.setColumn([3, 4], col("Album"), 'Best of') == 2
+    query = QSqlQuery("select count(*) from changelog", model.database())
+    assert query.next()
+    assert query.value(0) == before + 2
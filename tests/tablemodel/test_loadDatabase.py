@@ -7,3 +7,26 @@ def test_loadDatabase(database_model):
     assert database_model.sortColumn == -1
     assert database_model.sortOrder is None
     assert (database_model.libraryPath / "tesutotunes.db").stat().st_size > 0
+
+
+def test_loadDatabase_lazy(tmpdir):
+    import pathlib
+    from desutunes.tablemodel import loadDatabase
+
+    libraryPath = pathlib.Path(str(tmpdir))
+    model = loadDatabase("tesutotunes.db", libraryPath, lazy=True)
+    assert model.rowCount() == 0
+    assert model.columnCount() > 0
+    assert model.select()
+
+
+def test_loadDatabase_light_imports():
+    import subprocess
+    import sys
+
+    modules = subprocess.check_output([
+        sys.executable, '-c', 'import sys, desutunes.tablemodel; '
+        'print(" ".join(sys.modules))'
+    ]).decode().split()
+    assert 'mutagen' not in modules
+    assert 'desutunes.processfile' not in modules
@@ -0,0 +1,44 @@
+'''Tests deleting many records at once from a desutunes db'''
+
+from PyQt5.QtSql import QSqlQuery
+from desutunes.processfile import getMetadataForFileList
+from desutunes.tablemodel import col
+
+
+def table_ids(model):
+    query = QSqlQuery("select id from tracks", model.database())
+    ids = []
+    while query.next():
+        ids.append(query.value(0))
+    return ids
+
+
+def test_removeRecords(database_model, audio_path):
+    assert QSqlQuery(database_model.database()).exec_("delete from tracks")
+    tracks = getMetadataForFileList([str(audio_path)])
+    database_model.addRecords(tracks)
+    assert database_model.rowCount() == 4
+
+    doomed = [track.ID for track in tracks[1:3]]
+    selects = []
+    database_model.modelReset.connect(lambda: selects.append(True))
+    assert database_model.removeRecords(doomed)
+
+    assert len(selects) == 1
+    assert sorted(table_ids(database_model)) == sorted(
+        track.ID for track in tracks if track.ID not in doomed)
+    assert database_model.rowCount() == 2
+    assert {database_model.data(database_model.index(row, col("ID")))
+            for row in range(2)}.isdisjoint(doomed)
+    libraryPath = database_model.libraryPath
+    for track in tracks:
+        deleted = libraryPath / '__deleted__' / track.Filename.name
+        assert deleted.exists() == (track.ID in doomed)
+        assert (libraryPath / track.Filename).exists() != \
+            (track.ID in doomed)
+
+    query = QSqlQuery("select count(*) from checksums where id in "
+                      f"('{doomed[0]}', '{doomed[1]}')",
+                      database_model.database())
+    assert query.next()
+    assert query.value(0) == 0
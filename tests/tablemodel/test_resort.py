@@ -0,0 +1,79 @@
+'''Tests sorting the table on its sort keys'''
+
+import pytest
+from PyQt5.QtCore import QItemSelectionModel, Qt
+from PyQt5.QtSql import QSqlQuery
+from desutunes.tablemodel import col
+
+
+@pytest.fixture(scope="module")
+def model(database_model, qapp, make_track):
+    assert database_model.bulkInsert([
+        make_track(index, Artist=artist) for index, artist in enumerate(
+            ['kalafina', 'ClariS', 'Aimer', 'claris', 'Ayane', 'fripSide',
+             'Artist 10', 'artist 9', 'Éir Aoi'])])
+    yield database_model
+    database_model.sort(-1, Qt.AscendingOrder)
+
+
+def artists(model):
+    return [model.data(model.index(row, col("Artist")))
+            for row in range(model.rowCount())]
+
+
+def test_resort_toggles(model):
+    model.resort(col("Artist"))
+    assert model.sortOrder == Qt.AscendingOrder
+    assert artists(model) == ['Aimer', 'artist 9', 'Artist 10', 'Ayane',
+                              'ClariS', 'claris', 'Éir Aoi', 'fripSide',
+                              'kalafina']
+    model.resort(col("Artist"))
+    assert model.sortOrder == Qt.DescendingOrder
+    assert artists(model)[0] == 'kalafina'
+    model.resort(col("Artist"))
+    assert model.sortOrder == Qt.AscendingOrder
+    model.resort(col("Track title"))
+    assert model.sortOrder == Qt.AscendingOrder
+    assert model.sortColumn == col("Track title")
+
+
+def test_resort_keeps_selection(model):
+    view = model.createView("test")
+    assert view.isColumnHidden(model.columnCount() - 1)
+    assert not view.isColumnHidden(col("Date added"))
+    model.resort(col("Track title"))
+    selectionModel = view.selectionModel()
+    ayane = artists(model).index('Ayane')
+    selectionModel.setCurrentIndex(model.index(ayane, col("Artist")),
+                                   QItemSelectionModel.ClearAndSelect)
+    selectionModel.select(model.index(1, col("Artist")),
+                          QItemSelectionModel.Select)
+    selectedArtist = model.data(model.index(1, col("Artist")))
+
+    model.resort(col("Artist"), view)
+    assert view.horizontalHeader().sortIndicatorSection() == col("Artist")
+    rows = artists(model)
+    assert {(index.row(), index.column())
+            for index in selectionModel.selectedIndexes()} == {
+        (rows.index('Ayane'), col("Artist")),
+        (rows.index(selectedArtist), col("Artist"))}
+    assert selectionModel.currentIndex().row() == rows.index('Ayane')
+
+
+def test_setData_updates_sort_key(model):
+    model.sort(col("Artist"), Qt.AscendingOrder)
+    row = artists(model).index('fripSide')
+    assert model.setData(model.index(row, col("Artist")), 'ADO')
+    query = QSqlQuery(model.database())
+    assert query.exec_("select artist_key from tracks "
+                       "where id = '0000000000000005'")
+    assert query.next()
+    assert query.value(0) == 'ado'
+    model.select()
+    assert artists(model)[0] == 'ADO'
+
+
+def test_select_all_rows(model):
+    view = model.createView("Select all")
+    view.selectAll()
+    assert len(view.selectionModel().selectedRows()) == model.rowCount()
@@ -0,0 +1,36 @@
+'''Tests the cached row statuses that colour the desutunes table'''
+
+from PyQt5.QtCore import Qt
+from desutunes.tablemodel import col, MISSING, NEEDS_ATTENTION, OK
+
+
+def test_rowStatus(database_model, make_track):
+    assert database_model.bulkInsert([
+        make_track(1, InMyriad='Yes'),
+        make_track(2, Label='', InMyriad='Yes'),
+        make_track(3),
+    ])
+    assert [database_model.rowStatus(row) for row in range(3)] == [
+        OK, NEEDS_ATTENTION, NEEDS_ATTENTION]
+    assert database_model.data(database_model.index(0, 0),
+                               Qt.BackgroundRole) is None
+    assert database_model.data(database_model.index(1, 0),
+                               Qt.BackgroundRole) is not None
+
+
+def test_rowStatus_after_edit(database_model):
+    assert database_model.setData(
+        database_model.index(1, col("Label")), 'Edited records')
+    assert database_model.rowStatus(1) == OK
+
+
+def test_rowStatus_missing_files(database_model):
+    database_model.libraryIndex.scan()
+    assert [database_model.rowStatus(row) for row in range(3)] == [
+        MISSING, MISSING, MISSING]
+
+
+def test_rowStatus_cleared_on_select(database_model):
+    database_model._rowStatus[0] = 'stale'
+    database_model.select()
+    assert database_model.rowStatus(0) == MISSING
@@ -0,0 +1,63 @@
+'''Tests searching the library through the full-text index'''
+
+import pytest
+from desutunes.tablemodel import col, searchFilter
+
+
+@pytest.fixture(scope="module")
+def library(database_model, make_track):
+    assert database_model.bulkInsert([
+        make_track(index + 1, Tracktitle=title, Artist=artist, Anime=anime,
+                   Label=label, Album='', Composer='')
+        for index, (title, artist, anime, label) in enumerate([
+            ('Connect', 'ClariS', 'Puella Magi Madoka Magica', 'SME Records'),
+            ('Magia', 'Kalafina', 'Puella Magi Madoka Magica', 'SME Records'),
+            ('Sobakasu', 'Judy and Mary', 'Rurouni Kenshin', 'Epic Sony'),
+            ('Pokémon Theme', "O'Brien", 'Pokémon', '4Kids'),
+        ])
+    ])
+    yield database_model
+    database_model.search('')
+
+
+def titles(model):
+    return sorted(model.data(model.index(row, col("Track title")))
+                  for row in range(model.rowCount()))
+
+
+def test_searchFilter_nothing_to_search():
+    assert searchFilter('') == ''
+    assert searchFilter(' "\'* ') == ''
+
+
+def test_search_word(library):
+    assert library.search('madoka')
+    assert titles(library) == ['Connect', 'Magia']
+
+
+def test_search_prefix(library):
+    assert library.search('kens')
+    assert titles(library) == ['Sobakasu']
+
+
+def test_search_all_words(library):
+    assert library.search('madoka kalafina')
+    assert titles(library) == ['Magia']
+
+
+def test_search_diacritics_and_quotes(library):
+    assert library.search("pokemon o'brien")
+    assert titles(library) == ['Pokémon Theme']
+
+
+def test_search_follows_edits(library):
+    assert library.search('sobakasu')
+    row = 0
+    assert library.setData(library.index(row, col("Label")), 'Ki/oon')
+    assert library.search('kioon') and titles(library) == []
+    assert library.search('ki oon') and titles(library) == ['Sobakasu']
+
+
+def test_search_cleared(library):
+    assert library.search('')
+    assert len(titles(library)) == 4
@@ -0,0 +1,129 @@
+'''Tests the windowed, keyset-paginated table model'''
+
+import pathlib
+import pytest
+from PyQt5.QtCore import Qt
+from PyQt5.QtSql import QSqlQuery
+from desutunes.tablemodel import (col, loadDatabase, windowedModel, MISSING,
+                                  NEEDS_ATTENTION, OK)
+
+
+animes = ['Madoka', 'Kenshin', 'Haruhi', 'Lain', 'Bebop', 'Evangelion',
+          'Nadesico', 'Utena', 'Slayers', 'Gundam', 'Macross']
+
+
+@pytest.fixture(scope="module")
+def windowed_model(tmpdir_factory, make_track):
+    model = loadDatabase(
+        "tesutotunes.db", pathlib.Path(tmpdir_factory.mktemp('windowed')),
+        windowed=True)
+    assert isinstance(model, windowedModel)
+    model.pageSize = 16
+    model.maxPages = 3
+    assert model.bulkInsert([
+        make_track(index,
+                   Tracktitle=f'Title {(index * 7) % 101}',
+                   Artist=f'{"aA"[index % 2]}rtist {(index * 13) % 37}',
+                   Album='',
+                   Length=index,
+                   Anime=animes[index % len(animes)],
+                   InMyriad='YES',
+                   Dateadded=f'2018-04-{index % 30 + 1:02d} 12:00')
+        for index in range(1000)])
+    query = QSqlQuery(model.database())
+    assert query.exec_("update tracks set dateadded = null "
+                       "where length % 97 = 0")
+    assert model.select()
+    yield model
+    model.search('')
+    model.sort(-1)
+
+
+def expected_ids(model, orderBy):
+    query = QSqlQuery(model.database())
+    assert query.exec_(f"select id from tracks order by {orderBy}")
+    ids = []
+    while query.next():
+        ids.append(query.value(0))
+    return ids
+
+
+def model_ids(model):
+    return [model.data(model.index(row, col("ID")))
+            for row in range(model.rowCount())]
+
+
+@pytest.mark.parametrize('column, order, orderBy', [
+    (-1, Qt.AscendingOrder, 'rowid'),
+    (col("Artist"), Qt.AscendingOrder,
+     'artist_key, tracktitle_key, rowid'),
+    (col("Artist"), Qt.DescendingOrder,
+     'artist_key desc, tracktitle_key desc, rowid desc'),
+    (col("Anime"), Qt.AscendingOrder,
+     'anime_key, role_key, rolequant_key, tracktitle_key, rowid'),
+    (col("Date added"), Qt.AscendingOrder, 'dateadded, rowid'),
+    (col("Date added"), Qt.DescendingOrder,
+     'dateadded desc, rowid desc'),
+])
+def test_windowedModel_order(windowed_model, column, order, orderBy):
+    windowed_model.sort(column, order)
+    assert windowed_model.rowCount() == 1000
+    assert model_ids(windowed_model) == expected_ids(windowed_model,
+                                                     orderBy)
+    assert len(windowed_model._pages) <= windowed_model.maxPages
+
+
+def test_windowedModel_jump_to_end(windowed_model):
+    windowed_model.sort(col("Date added"), Qt.DescendingOrder)
+    ids = expected_ids(windowed_model, 'dateadded desc, rowid desc')
+    assert windowed_model.data(windowed_model.index(999, col("ID"))) == \
+        ids[999]
+    assert list(windowed_model._pages) == [999 // 16]
+
+
+def test_windowedModel_setData(windowed_model):
+    windowed_model.sort(-1)
+    index = windowed_model.index(500, col("Label"))
+    assert windowed_model.rowStatus(500) == OK
+    assert windowed_model.setData(index, '')
+    assert windowed_model.rowStatus(500) == NEEDS_ATTENTION
+    windowed_model._pages.clear()
+    assert windowed_model.data(index) == ''
+    assert windowed_model.data(index, Qt.BackgroundRole) is not None
+    assert windowed_model.setData(index, 'Label')
+    assert windowed_model.rowStatus(500) == OK
+
+
+def test_windowedModel_missing(windowed_model):
+    windowed_model.sort(-1)
+    windowed_model.libraryIndex.scan()
+    windowed_model.libraryChanged()
+    assert windowed_model.rowStatus(0) == MISSING
+
+
+def test_windowedModel_flags(windowed_model):
+    assert not (windowed_model.flags(windowed_model.index(0, col("ID")))
+                & Qt.ItemIsEditable)
+    assert (windowed_model.flags(windowed_model.index(0, col("Artist")))
+            & Qt.ItemIsEditable)
+    assert windowed_model.headerData(col("Artist"), Qt.Horizontal) == \
+        "Artist"
+
+
+def test_windowedModel_search(windowed_model):
+    windowed_model.search('Lain')
+    assert windowed_model.rowCount() == len([
+        index for index in range(1000) if index % 11 == 3])
+    assert windowed_model.data(windowed_model.index(0, col("Anime"))) == \
+        'Lain'
+    windowed_model.search('')
+    assert windowed_model.rowCount() == 1000
+
+
+def test_windowedModel_removeRecords(windowed_model):
+    windowed_model.sort(col("Artist"), Qt.AscendingOrder)
+    doomed = [windowed_model.data(windowed_model.index(row, col("ID")))
+              for row in (0, 500, 999)]
+    assert windowed_model.removeRecords(doomed)
+    assert windowed_model.rowCount() == 997
+    assert set(model_ids(windowed_model)).isdisjoint(doomed)
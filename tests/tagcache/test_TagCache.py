@@ -0,0 +1,80 @@
+'''Tests the TagCache class from tagcache.py'''
+
+import os
+import shutil
+import pytest
+from desutunes.processfile import processFile, getMetadataForFileList
+from desutunes.tagcache import TagCache
+
+
+@pytest.fixture
+def cache(tmpdir):
+    tag_cache = TagCache(str(tmpdir.join("tagcache.db")))
+    yield tag_cache
+    tag_cache.close()
+
+
+@pytest.fixture
+def mp3_copy(audio_path, tmpdir):
+    filename = str(tmpdir.join("test_audio.mp3"))
+    shutil.copyfile(str(audio_path / "test_audio.mp3"), filename)
+    return filename
+
+
+def test_TagCache_miss(cache, mp3_copy):
+    assert cache.get(mp3_copy) is None
+
+
+def test_TagCache_roundtrip(cache, mp3_copy):
+    original = processFile(mp3_copy)
+    cache.put(mp3_copy, original)
+    assert cache.get(mp3_copy) == original
+
+
+def test_TagCache_changed_file(cache, mp3_copy):
+    cache.put(mp3_copy, processFile(mp3_copy))
+    info = os.stat(mp3_copy)
+    os.utime(mp3_copy, ns=(info.st_atime_ns, info.st_mtime_ns + 10**9))
+    assert cache.get(mp3_copy) is None
+
+
+def test_TagCache_persists(tmpdir, mp3_copy):
+    first = TagCache(str(tmpdir.join("tagcache.db")))
+    first.put(mp3_copy, processFile(mp3_copy))
+    first.close()
+    second = TagCache(str(tmpdir.join("tagcache.db")))
+    assert second.get(mp3_copy) is not None
+    second.close()
+
+
+def test_TagCache_evicts_least_recently_used(tmpdir, audio_path):
+    cache = TagCache(str(tmpdir.join("tagcache.db")), maxEntries=2)
+    filenames = [str(audio_path / name) for name in
+                 ["test_audio.mp3", "test_audio.m4a", "test_audio.flac"]]
+    for filename in filenames:
+        cache.put(filename, processFile(filename))
+    cache.get(filenames[0])
+    cache.flush()
+    assert cache.get(filenames[0]) is not None
+    assert cache.get(filenames[1]) is None
+    assert cache.get(filenames[2]) is not None
+    cache.close()
+
+
+def test_processFile_uses_cache(cache, mp3_copy):
+    original = processFile(mp3_copy, cache)[0]
+    cache.put(mp3_copy, [original._replace(Label='From the cache')])
+    cached = processFile(mp3_copy, cache)[0]
+    assert cached.Label == 'From the cache'
+    assert cached.ID != original.ID
+    assert str(cached.Filename) == (
+        f'Tachibana Kanade/Test MP3 file ({cached.ID}).mp3')
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_getMetadataForFileList_uses_cache(cache, mp3_copy, workers):
+    original = getMetadataForFileList([mp3_copy], workers, cache=cache)
+    assert cache.get(mp3_copy) is not None
+    cache.put(mp3_copy, [original[0]._replace(Label='From the cache')])
+    cached = getMetadataForFileList([mp3_copy], workers, cache=cache)
+    assert cached[0].Label == 'From the cache'